@@ -0,0 +1,7 @@
+-- Migration script for employee search / typeahead
+-- /v1/employee/search and /v1/employee/typeahead match prefixes (LIKE 'q%')
+-- of first_name, last_name, email and phone_number. email and phone_number
+-- already have unique indexes; these cover the names.
+
+CREATE INDEX ix_employees_first_name ON employees (first_name);
+CREATE INDEX ix_employees_last_name ON employees (last_name);
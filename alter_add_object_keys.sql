@@ -0,0 +1,22 @@
+-- Migration script to store storage backend + object key instead of relying on public S3 URLs
+-- file_url is kept for legacy clients; response URLs are built from object_key at read time
+
+ALTER TABLE files
+    ADD COLUMN storage_backend VARCHAR(20) NOT NULL DEFAULT 's3' AFTER file_url,
+    ADD COLUMN object_key VARCHAR(512) NULL AFTER storage_backend;
+
+ALTER TABLE thumbnails
+    ADD COLUMN storage_backend VARCHAR(20) NOT NULL DEFAULT 's3' AFTER file_url,
+    ADD COLUMN object_key VARCHAR(512) NULL AFTER storage_backend;
+
+ALTER TABLE thumbnail_sprites
+    ADD COLUMN storage_backend VARCHAR(20) NOT NULL DEFAULT 's3' AFTER file_url,
+    ADD COLUMN object_key VARCHAR(512) NULL AFTER storage_backend;
+
+-- Backfill keys of existing rows from their public S3 URLs
+UPDATE files SET object_key = SUBSTRING_INDEX(file_url, '.amazonaws.com/', -1)
+    WHERE object_key IS NULL AND file_url LIKE '%.amazonaws.com/%';
+UPDATE thumbnails SET object_key = SUBSTRING_INDEX(file_url, '.amazonaws.com/', -1)
+    WHERE object_key IS NULL AND file_url LIKE '%.amazonaws.com/%';
+UPDATE thumbnail_sprites SET object_key = SUBSTRING_INDEX(file_url, '.amazonaws.com/', -1)
+    WHERE object_key IS NULL AND file_url LIKE '%.amazonaws.com/%';
@@ -0,0 +1,9 @@
+-- Migration script for storage tiering of cold originals
+-- Access stats are updated by downloads and thumbnail renders
+
+ALTER TABLE files
+    ADD COLUMN last_accessed DATETIME NULL,
+    ADD COLUMN access_count INT DEFAULT 0,
+    ADD COLUMN storage_tier VARCHAR(10) NOT NULL DEFAULT 'hot' COMMENT 'hot or cold';
+
+CREATE INDEX idx_files_tiering ON files(storage_tier, last_accessed);
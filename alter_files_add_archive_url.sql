@@ -0,0 +1,5 @@
+-- Migration script for optional original-image optimization on upload
+-- Stores the untouched original when IMAGE_ARCHIVE_ORIGINALS is enabled
+
+ALTER TABLE files
+    ADD COLUMN archive_url VARCHAR(512) NULL COMMENT 'Untouched original when the upload was optimized' AFTER size;
@@ -0,0 +1,7 @@
+-- Migration script for responsive thumbnail sets
+-- Source dimensions are read from the image header on upload; legacy rows stay NULL
+-- and fall back to square thumbnail boxes until backfilled
+
+ALTER TABLE files
+    ADD COLUMN width INT NULL COMMENT 'Source image width in pixels' AFTER archive_url,
+    ADD COLUMN height INT NULL COMMENT 'Source image height in pixels' AFTER width;
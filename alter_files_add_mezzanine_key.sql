@@ -0,0 +1,8 @@
+-- Migration script for the thumbnail mezzanine master
+-- files.mezzanine_key points at a downscaled WebP copy of a large original
+-- (THUMBNAIL_MEZZANINE_MAX_DIMENSION); small thumbnails are rendered from it
+-- instead of the full original. It is created on the first small render and
+-- cleared when the content is replaced.
+
+ALTER TABLE files
+    ADD COLUMN mezzanine_key VARCHAR(512) NULL COMMENT 'Downscaled master small thumbnails are rendered from' AFTER phash;
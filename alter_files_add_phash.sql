@@ -0,0 +1,8 @@
+-- Migration script to add perceptual hashes to files
+-- 64-bit dHash (hex) of image content, used for near-duplicate lookups.
+-- Existing images are hashed by: python backfill_phash.py
+
+ALTER TABLE files
+    ADD COLUMN phash VARCHAR(16) NULL COMMENT '64-bit dHash (hex) of image content' AFTER height;
+
+CREATE INDEX ix_files_phash ON files(phash);
@@ -0,0 +1,8 @@
+-- Migration script for file ownership
+-- files.uploaded_by records the authenticated user who uploaded the file; only that
+-- user or an admin may replace its content (PUT /v1/files/{id}/content).
+-- Existing rows and public uploads stay NULL, so only admins can replace them.
+
+ALTER TABLE files
+    ADD COLUMN uploaded_by INT NULL AFTER version,
+    ADD INDEX ix_files_uploaded_by (uploaded_by);
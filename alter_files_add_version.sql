@@ -0,0 +1,7 @@
+-- Migration script for content-versioned thumbnail URLs
+-- files.version is bumped when a file's content is replaced (PUT /v1/files/{id}/content);
+-- generated thumbnail URLs carry it as ?v= so they can be cached as immutable.
+-- New thumbnails are stored under content-hashed keys; existing rows keep their old keys.
+
+ALTER TABLE files
+    ADD COLUMN version INT NOT NULL DEFAULT 1 AFTER phash;
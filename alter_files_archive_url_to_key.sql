@@ -0,0 +1,13 @@
+-- Migration script: keep the archived original as an object key, like object_key
+-- and mezzanine_key, instead of a full URL that had to be parsed back.
+-- Archived originals are stored under archive/, so the key is the URL path from there.
+
+ALTER TABLE files
+    ADD COLUMN archive_key VARCHAR(512) NULL COMMENT 'Object key of the untouched original when the upload was optimized' AFTER size;
+
+UPDATE files
+SET archive_key = SUBSTRING(archive_url, LOCATE('/archive/', archive_url) + 1)
+WHERE archive_url IS NOT NULL AND LOCATE('/archive/', archive_url) > 0;
+
+ALTER TABLE files
+    DROP COLUMN archive_url;
@@ -0,0 +1,8 @@
+-- Migration script for bounded sprite sheet caching
+-- thumbnail_sprites.last_accessed orders sheets for LRU eviction: beyond
+-- SPRITE_CACHE_MAX_SHEETS the least recently used rows and their objects are deleted.
+-- Existing sheets start with NULL and are evicted first.
+
+ALTER TABLE thumbnail_sprites
+    ADD COLUMN last_accessed DATETIME NULL AFTER updated_at,
+    ADD INDEX ix_thumbnail_sprites_last_accessed (last_accessed);
@@ -0,0 +1,8 @@
+-- Migration script for lossless thumbnail tracking
+-- Small thumbnails may be derived from a larger stored variant in another format only
+-- if that variant is lossless. PNG used to be quantized by the "smallest" encoder
+-- profile, so existing rows cannot be trusted and start as lossy; re-rendered PNG
+-- variants are recorded as lossless.
+
+ALTER TABLE thumbnails
+    ADD COLUMN lossless BOOLEAN NOT NULL DEFAULT FALSE AFTER file_size;
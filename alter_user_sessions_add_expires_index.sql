@@ -0,0 +1,9 @@
+-- Migration script for session expiry pruning
+-- With SESSION_STORE=sql, expired user_sessions rows are deleted in batches
+-- (SESSION_PRUNE_BATCH_SIZE) by expires_at; this index keeps that cheap.
+-- Sessions are looked up by session_token, which is already unique.
+
+CREATE INDEX ix_user_sessions_expires_at ON user_sessions (expires_at);
+
+-- One-off cleanup of the rows accumulated before pruning existed (repeat until 0 rows)
+DELETE FROM user_sessions WHERE expires_at < UTC_TIMESTAMP() LIMIT 10000;
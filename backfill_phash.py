@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Compute perceptual hashes for images uploaded before hashing was added,
+so they show up in near-duplicate lookups. Safe to rerun.
+
+Examples:
+    python backfill_phash.py
+    python backfill_phash.py --batch-size 500 --concurrency 16
+"""
+
+import argparse
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.core.database import SessionLocal
+from core.core.storage import s3_storage
+# Import all models to ensure they are registered with Base
+from users.models import User
+from employee.models import Employee
+from role.models import Role, UserRole
+from file_storage.models import File, Thumbnail
+from file_storage import tasks
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill perceptual hashes of existing images")
+    parser.add_argument("--batch-size", type=int, default=200, help="Files loaded and committed per batch")
+    parser.add_argument("--concurrency", type=int, default=8, help="Originals downloaded in parallel")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        stats = tasks.backfill_phashes(db, s3_storage, batch_size=args.batch_size, concurrency=args.concurrency)
+        logger.info(f"Done: {stats['hashed']} hashed, {stats['failed']} failed")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Thumbnail render benchmarks.
+
+Memory (default): peak memory of one render, each case in a fresh process so
+the numbers do not leak into each other:
+- bytes:   the original is downloaded into memory and rendered from bytes
+- spooled: the original is downloaded into a spooled temp file (S3Storage.open_object)
+Reported per case: tracemalloc peak (Python buffers: downloads, encoded output)
+and the growth of the process max RSS (includes Pillow's decoded pixels).
+
+Engines (--engines): the spooled case once per installed image engine
+(pillow, vips), with the output size so the fit can be compared.
+
+Encoder matrix (--matrix): encode ms and output bytes for every encoder
+profile and format on a fixed corpus (generated with a fixed seed, or --corpus).
+
+Examples:
+    python bench_thumbnails.py
+    python bench_thumbnails.py --input photo.jpg --width 300 --height 300 --format webp
+    python bench_thumbnails.py --source-size 6000x4000 --spool-max-size 1 --output bench_output.txt
+    python bench_thumbnails.py --engine vips
+    python bench_thumbnails.py --engines --source-size 6000x4000 --format jpg
+    python bench_thumbnails.py --matrix --width 600 --height 600
+    python bench_thumbnails.py --matrix --corpus ./samples --repeat 10 --output bench_output.txt
+"""
+
+import argparse
+import io
+import multiprocessing
+import resource
+import shutil
+import statistics
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+CHUNK_SIZE = 256 * 1024  # boto3 download io_chunksize
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Peak memory per thumbnail render")
+    parser.add_argument("--input", help="Source image (default: a generated JPEG)")
+    parser.add_argument("--source-size", default="4000x3000", help="Size of the generated source image")
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--height", type=int, default=300)
+    parser.add_argument("--format", default="webp", choices=["webp", "jpg", "jpeg", "png"])
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--spool-max-size", type=int, default=None, help="Override STORAGE_SPOOL_MAX_SIZE (bytes, 1 forces disk)")
+    parser.add_argument("--output", help="Also append the results to this file")
+    parser.add_argument("--engine", default=None, help="Image engine for the memory cases (default: IMAGE_ENGINE)")
+    parser.add_argument("--engines", action="store_true", help="Compare every installed image engine instead")
+    parser.add_argument("--matrix", action="store_true", help="Run the encoder profile matrix instead")
+    parser.add_argument("--corpus", help="Directory of images for --matrix (default: generated corpus)")
+    parser.add_argument("--repeat", type=int, default=5, help="Encodes per cell in --matrix (median is reported)")
+    return parser.parse_args()
+
+def generate_source(size: str, path: str):
+    width, height = (int(n) for n in size.lower().split("x"))
+    # Noise keeps the file close to a real photo's size
+    image = Image.merge("RGB", [Image.effect_noise((width, height), 64) for _ in range(3)])
+    image.save(path, "JPEG", quality=92)
+
+def _download(path: str, target):
+    """Copy the source in chunks, like download_fileobj does"""
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, target, CHUNK_SIZE)
+    target.seek(0)
+    return target
+
+def _run_case(mode: str, engine: str, args, path: str, queue):
+    from file_storage import engines
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    if mode == "bytes":
+        source = _download(path, io.BytesIO()).getvalue()
+    else:
+        source = _download(path, tempfile.SpooledTemporaryFile(max_size=args.spool_max_size))
+    try:
+        thumbnail_data = engines.get_image_engine(engine).resize(source, args.width, args.height, args.format, args.quality)
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux
+    with Image.open(io.BytesIO(thumbnail_data)) as output:
+        output_dimensions = "%dx%d" % output.size
+    queue.put((mode, peak, (rss_after - rss_before) * 1024, elapsed, len(thumbnail_data), output_dimensions))
+
+def run_case(mode: str, engine: str, args, path: str) -> tuple:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(mode, engine, args, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def generated_corpus() -> list:
+    """Fixed-seed images covering photos, smooth gradients and flat graphics with alpha"""
+    rng = np.random.default_rng(0)
+    # Photo: smooth colour field plus sensor-like grain
+    field = Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)).resize((1600, 1200), Image.Resampling.BICUBIC)
+    grain = rng.normal(0, 12, (1200, 1600, 3))
+    photo = Image.fromarray(np.clip(np.asarray(field, dtype=np.float64) + grain, 0, 255).astype(np.uint8))
+
+    gradient = Image.radial_gradient("L").resize((1600, 1200)).convert("RGB")
+
+    graphic = Image.new("RGBA", (1200, 1200), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(graphic)
+    for i in range(12):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3)) + (255,)
+        draw.rectangle([i * 90, i * 60, i * 90 + 300, i * 60 + 200], fill=color)
+        draw.ellipse([1100 - i * 80, i * 90, 1190 - i * 60, i * 90 + 150], fill=color)
+
+    return [("photo", photo), ("gradient", gradient), ("graphic", graphic)]
+
+def load_corpus(path: str) -> list:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        try:
+            with Image.open(os.path.join(path, name)) as image:
+                image.load()
+                corpus.append((name, image.copy()))
+        except Exception:
+            continue
+    return corpus
+
+def run_matrix(args) -> list:
+    from file_storage import engines
+
+    corpus = load_corpus(args.corpus) if args.corpus else generated_corpus()
+    lines = [
+        f"encoder matrix: {args.width}x{args.height} q{args.quality}, median of {args.repeat}",
+        f"{'image':<14}{'format':<8}{'profile':<10}{'encode ms':>11}{'bytes':>10}",
+    ]
+    for name, source in corpus:
+        buffer = io.BytesIO()
+        source.save(buffer, format="PNG")
+        for format in ("webp", "jpg", "png"):
+            image = engines.prepare_thumbnail_image(buffer.getvalue(), args.width, args.height, format)
+            for profile in engines.ENCODER_PROFILES:
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    encoded = engines.encode_thumbnail_image(image, format, args.quality, profile)
+                    timings.append((time.perf_counter() - started) * 1000)
+                lines.append(
+                    f"{name[:13]:<14}{format:<8}{profile:<10}{statistics.median(timings):>11.2f}{len(encoded):>10}"
+                )
+    return lines
+
+def main():
+    args = parse_args()
+    if args.matrix:
+        lines = run_matrix(args)
+        print("\n".join(lines))
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n\n")
+        return
+
+    from core.core.config import settings
+    from file_storage import engines
+    if args.spool_max_size is None:
+        args.spool_max_size = settings.STORAGE_SPOOL_MAX_SIZE
+    if args.engines:
+        cases = [("spooled", engine) for engine in engines.available_engines()]
+    else:
+        engine = args.engine or settings.IMAGE_ENGINE
+        cases = [("bytes", engine), ("spooled", engine)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.input
+        if not path:
+            path = os.path.join(tmp, "source.jpg")
+            generate_source(args.source_size, path)
+        source_size = os.path.getsize(path)
+
+        lines = [
+            f"source {os.path.basename(path)} {source_size / 1024 / 1024:.1f} MB -> "
+            f"{args.width}x{args.height} {args.format} q{args.quality}, spool max {args.spool_max_size} bytes",
+            f"{'mode':<10}{'engine':<8}{'py peak MB':>12}{'rss growth MB':>15}{'seconds':>10}{'output KB':>11}{'output':>11}",
+        ]
+        for mode, engine in cases:
+            _, peak, rss, elapsed, output_size, output_dimensions = run_case(mode, engine, args, path)
+            lines.append(
+                f"{mode:<10}{engine:<8}{peak / 1024 / 1024:>12.1f}{rss / 1024 / 1024:>15.1f}{elapsed:>10.2f}"
+                f"{output_size / 1024:>11.1f}{output_dimensions:>11}"
+            )
+
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n\n")
+
+if __name__ == "__main__":
+    main()
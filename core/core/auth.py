@@ -4,30 +4,23 @@ from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
 
 from .database import get_db
 from .config import settings
 from users import crud as users_crud, models as users_models
 from role import crud as role_crud
 from .exceptions import AuthenticationError
+from .security import verify_password, verify_and_update_password, get_password_hash
+from .principal_cache import token_claims_cache, principal_cache
 from users.crud import get_user_by_username
 from users.models import User
-from users.schemas import TokenData
+from users.schemas import Principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
 def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """
     Authenticates a user by checking username and password.
@@ -35,8 +28,13 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
     user = get_user_by_username(db, username=username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this password was hashed
+        user.hashed_password = new_hash
+        db.commit()
     return user
 
 def create_access_token(data: dict) -> str:
@@ -56,43 +54,87 @@ def create_refresh_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> users_models.User:
+def decode_access_token(token: str) -> dict:
+    """Claims of a valid access token; tokens verified before are served from the claims cache"""
     credentials_exception = AuthenticationError(message="Could not validate credentials")
-    
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        token_type: str = payload.get("type")
-        print("token_type", token_type)
-        print("username", username)
-
-        if username is None or token_type != "access":
+
+    payload = token_claims_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
             raise credentials_exception
-            
-        token_data = TokenData(username=username)
-    except JWTError:
+        if payload.get("sub") is not None and payload.get("type") == "access":
+            token_claims_cache.set(token, payload)
+
+    if payload.get("sub") is None or payload.get("type") != "access":
         raise credentials_exception
-    
-    user = users_crud.get_user_by_username(db, username=token_data.username)
-    print("user", user)
-    
+    return payload
+
+def load_principal(db: Session, username: str) -> Optional[Principal]:
+    """
+    Identity, active flag and role names of a user: from the principal cache,
+    or from the database (then cached). None if the user does not exist.
+    """
+    cached = principal_cache.get(username)
+    if cached is not None:
+        return Principal(**cached)
+
+    user = users_crud.get_user_by_username(db, username=username)
     if user is None:
-        raise credentials_exception
+        return None
+    roles = role_crud.get_user_role_names(db, user_id=user.id)
+    principal = Principal(id=user.id, username=user.username, is_active=bool(user.is_active), roles=frozenset(roles))
+    principal_cache.set(username, {**principal.dict(), "roles": roles})
+    return principal
+
+def access_token_claims(principal: Principal) -> dict:
+    """Claims for a new access token; with AUTH_TOKEN_ROLES_CLAIM the principal is embedded"""
+    claims = {"sub": principal.username}
+    if settings.AUTH_TOKEN_ROLES_CLAIM:
+        claims.update(uid=principal.id, roles=sorted(principal.roles))
+    return claims
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    Authenticated principal of the request, with its role names resolved once.
+    Served from the token claims and principal caches (or the signed roles claim),
+    so most requests need no database round trip for identity or permissions.
+    Endpoints that need the full user row depend on get_current_user_model.
+    """
+    payload = decode_access_token(token)
+
+    if settings.AUTH_TOKEN_ROLES_CLAIM and "uid" in payload and "roles" in payload:
+        # Only active users are issued tokens
+        return Principal(id=payload["uid"], username=payload["sub"], is_active=True, roles=frozenset(payload["roles"]))
+
+    principal = load_principal(db, payload["sub"])
+    if principal is None:
+        raise AuthenticationError(message="Could not validate credentials")
         
-    if not user.is_active:
+    if not principal.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
 
+    return principal
+
+def get_current_user_model(
+    principal: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> users_models.User:
+    """The authenticated user's row, with its relationships"""
+    user = db.query(users_models.User).filter(users_models.User.id == principal.id).first()
+    if user is None:
+        raise AuthenticationError(message="Could not validate credentials")
     return user
 
 class PermissionChecker:
     def __init__(self, required_roles: list[str]):
         self.required_roles = required_roles
+        self._required = frozenset(required_roles)
 
-    def __call__(self, user: users_models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-        user_roles = role_crud.get_user_roles(db, user_id=user.id)
-        user_role_names = {role.name for role in user_roles}
-
-        if not any(role in user_role_names for role in self.required_roles):
+    def __call__(self, user: Principal = Depends(get_current_user)):
+        # Role names come with the principal, so this is a set lookup
+        if user.roles.isdisjoint(self._required):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"User does not have the required roles. Required one of: {self.required_roles}"
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import os
 from urllib.parse import quote_plus
 from enum import IntEnum
@@ -12,6 +12,7 @@ class Settings(BaseSettings):
     ENV: str = "development"
     PROJECT_NAME: str = "FastAPI Monolithic"
     API_V1_STR: str = "/v1"
+    METRICS_ENABLED: bool = True    # Expose GET /metrics (Prometheus text format)
 
     # CORS settings
     CORS: dict = {
@@ -27,6 +28,52 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30  # 30 minutes
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7     # 7 days
 
+    # Refresh token sessions: sql (user_sessions, pruned in batches) or redis (TTL expiry;
+    # Redis becomes a hard dependency of login and refresh)
+    SESSION_STORE: str = "sql"
+    SESSION_PRUNE_INTERVAL: int = 3600      # Seconds between prunes of expired rows (sql)
+    SESSION_PRUNE_BATCH_SIZE: int = 1000    # Rows per DELETE (sql)
+
+    # Password hashing: bcrypt cost (changing it rehashes passwords at the next login)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2          # Dedicated processes; 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING: int = 16     # Queued + running; more get a 503
+    PASSWORD_HASH_RETRY_AFTER: int = 2      # Seconds, Retry-After of that 503
+
+    # Employee typeahead (/v1/employee/typeahead)
+    EMPLOYEE_TYPEAHEAD_LIMIT: int = 10      # Default and maximum matches returned
+    EMPLOYEE_TYPEAHEAD_CACHE_TTL: int = 30  # Seconds a prefix's matches are reused
+    EMPLOYEE_TYPEAHEAD_CACHE_SIZE: int = 2000
+
+    # Bulk employee import (/v1/employee/import)
+    EMPLOYEE_IMPORT_CHUNK_SIZE: int = 500   # Rows validated, hashed and inserted per transaction
+    EMPLOYEE_IMPORT_HASH_WORKERS: int = 4   # Processes hashing passwords during an import; 0 inline
+    EMPLOYEE_IMPORT_MAX_ERRORS: int = 1000  # Row errors returned in the response
+
+    # Failed login throttling (per process)
+    LOGIN_FAILURE_WINDOW: int = 300         # Seconds
+    LOGIN_MAX_FAILURES_PER_USER: int = 5
+    LOGIN_MAX_FAILURES_PER_IP: int = 20
+
+    # Authenticated principal cache (get_current_user)
+    AUTH_TOKEN_CACHE_SIZE: int = 10000      # Verified tokens whose claims are kept until exp
+    AUTH_PRINCIPAL_CACHE_SIZE: int = 10000  # Users kept in the in-process cache
+    AUTH_PRINCIPAL_LOCAL_TTL: int = 30      # Seconds; bounds staleness across workers
+    AUTH_PRINCIPAL_REDIS_TTL: int = 300     # Seconds; 0 disables the Redis layer
+    AUTH_REDIS_RETRY_AFTER: int = 30        # Seconds Redis is skipped after an error
+    # Embed user id and role names in access tokens, so requests need no lookup at all.
+    # Role changes and deactivation then apply only when the token is refreshed.
+    AUTH_TOKEN_ROLES_CLAIM: bool = False
+
+    # Redis settings
+    REDIS_CONFIG: dict = {
+        "host": "redis",
+        "port": 6379,
+        "default_db": 0,
+        "password": "123456",
+        "socket_timeout": 0.5,
+    }
+
     # Database settings
     DB_HOST: str
     DB_PORT: int = 5432
@@ -40,6 +87,70 @@ class Settings(BaseSettings):
     AWS_REGION_NAME: str
     AWS_S3_BUCKET_NAME: Optional[str] = None
 
+    # Image ingest settings
+    IMAGE_OPTIMIZE_ON_UPLOAD: bool = False      # Strip metadata / recompress JPEG and PNG originals
+    IMAGE_MAX_DIMENSION: int = 4096             # Longest edge kept for optimized originals
+    IMAGE_JPEG_QUALITY: int = 90                # Used only when an optimized JPEG had to be resized or rotated
+    IMAGE_ARCHIVE_ORIGINALS: bool = False       # Keep the untouched upload under archive/
+    IMAGE_ARCHIVE_STORAGE_CLASS: str = "GLACIER_IR"
+    UPLOAD_BATCH_MAX_FILES: int = 20            # Parts accepted by the batch upload endpoints
+    UPLOAD_CONCURRENCY: int = 4                 # Parallel S3 uploads per batch request
+
+    # Object URL settings
+    STORAGE_CDN_BASE_URL: Optional[str] = None      # Rewrite object URLs to this CDN origin
+    STORAGE_PRIVATE_OBJECTS: bool = False           # Serve objects through presigned GET URLs
+    STORAGE_PRESIGN_EXPIRES: int = 3600             # Presigned URL lifetime in seconds
+    STORAGE_PRESIGN_REFRESH_MARGIN: int = 300       # Re-sign this many seconds before expiry
+    STORAGE_URL_CACHE_SIZE: int = 10000             # Presigned URLs kept in memory
+    STORAGE_SPOOL_MAX_SIZE: int = 8 * 1024 * 1024   # Downloads above this size are spooled to a temp file
+
+    # Storage tiering settings
+    STORAGE_HOT_CLASS: str = "STANDARD"
+    STORAGE_COLD_CLASS: str = "STANDARD_IA"     # Must be an instant-retrieval class
+    STORAGE_COLD_AFTER_DAYS: int = 30           # Originals untouched this long are moved to the cold class
+    STORAGE_TIERING_MIN_SIZE: int = 128 * 1024  # Smaller objects are billed as 128KB in IA classes anyway
+
+    # Thumbnail settings
+    PUBLIC_BASE_URL: str = "http://localhost:8000"          # Public URL of this API
+    THUMBNAIL_CDN_BASE_URL: Optional[str] = None            # CDN in front of the thumbnail endpoints, if any
+    THUMBNAIL_SRCSET_WIDTHS: List[int] = [150, 300, 600, 1000]
+    THUMBNAIL_RENDER_WORKERS: int = 2                       # Processes in the thumbnail render pool
+    THUMBNAIL_INLINE_MAX_AGE: int = 3600                    # Cache-Control max-age of a first render served inline
+    THUMBNAIL_JOB_WORKERS: int = 2                          # Threads running /info?wait=false renders
+    THUMBNAIL_JOB_RETRY_AFTER: int = 1                      # Retry-After (seconds) sent while a job is pending
+    THUMBNAIL_JOB_TTL: int = 300                            # Seconds finished job states are kept for polling
+    THUMBNAIL_JOB_MAX_PENDING: int = 100                    # Jobs queued or running per process; more get a 503
+    IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"  # Content-addressed objects and versioned URLs
+    THUMBNAIL_INFLIGHT_WAIT: float = 30.0                   # Seconds a concurrent miss waits for the in-flight render
+    THUMBNAIL_DERIVE_MIN_RATIO: float = 2.0                 # Render from a stored variant at least this many times larger
+    THUMBNAIL_MEZZANINE_MAX_DIMENSION: int = 2048           # Edge of the downscaled master small variants use (0 disables)
+    THUMBNAIL_MEZZANINE_QUALITY: int = 90                   # WebP quality of that master
+    # On-demand render admission; running + queued renders each hold a request thread, keep the sum well below the pool size (40)
+    THUMBNAIL_ADMISSION_MAX_CONCURRENT: int = 4             # Renders running at once
+    THUMBNAIL_ADMISSION_MAX_QUEUE: int = 8                  # Renders waiting for a slot; more are rejected at once
+    THUMBNAIL_ADMISSION_PER_CLIENT: int = 2                 # Running + waiting renders per client IP
+    THUMBNAIL_ADMISSION_QUEUE_TIMEOUT: float = 5.0          # Seconds a render waits for a slot before it is rejected
+    THUMBNAIL_ADMISSION_RETRY_AFTER: int = 2                # Retry-After (seconds) on a rejected render
+    THUMBNAIL_ADMISSION_FALLBACK: bool = True               # Serve the nearest existing variant instead of 503 when rejected
+    THUMBNAIL_AUTO_QUALITY_SSIM: float = 0.98              # q=auto keeps SSIM vs the lossless resize above this
+    THUMBNAIL_AUTO_QUALITY_MIN: int = 30
+    THUMBNAIL_AUTO_QUALITY_MAX: int = 95
+    THUMBNAIL_REUSE_NEAR_DUPLICATES: bool = False           # Serve a near-identical file's existing thumbnail instead of rendering
+    THUMBNAIL_REUSE_MAX_DISTANCE: int = 2                   # Max dHash Hamming distance for that reuse
+    PHASH_INDEX_REBUILD_INTERVAL: int = 600                 # Seconds between full rebuilds of the near-duplicate index
+    IMAGE_ENGINE: str = "pillow"                            # pillow or vips (needs pyvips + libvips, falls back to pillow)
+    THUMBNAIL_ENCODER_PROFILE: str = "balanced"             # fast, balanced or smallest
+    # Encoder profile per render path; paths not listed use THUMBNAIL_ENCODER_PROFILE
+    ENCODER_PROFILE_PRESETS: Dict[str, str] = {
+        "on_demand": "balanced",    # request path, including inline first renders
+        "warmup": "smallest",       # warm_thumbnails.py, off the request path
+        "regenerate": "smallest",   # regenerate_thumbnails.py
+        "sprite": "balanced",
+    }
+    SPRITE_MAX_FILES: int = 200                 # Max file ids per sprite sheet
+    SPRITE_DOWNLOAD_CONCURRENCY: int = 8        # Parallel source downloads while building a sheet
+    SPRITE_CACHE_MAX_SHEETS: int = 5000         # Cached sheets kept; the least recently used are deleted beyond this
+
     # Email settings
     SMTP_SERVER: str = "smtp.gmail.com"
     SMTP_PORT: int = 587
@@ -45,6 +45,26 @@ class NotFoundError(APIError):
             error_code="NOT_FOUND"
         )
 
+class ServiceUnavailableError(APIError):
+    """Request shed under load; the client should retry later"""
+    def __init__(self, message: str = "Service temporarily unavailable", retry_after: int = 1):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            message=message,
+            error_code="SERVICE_UNAVAILABLE",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+class TooManyRequestsError(APIError):
+    """Client is being throttled; the client should retry after retry_after seconds"""
+    def __init__(self, message: str = "Too many requests", retry_after: int = 1):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            message=message,
+            error_code="TOO_MANY_REQUESTS",
+            headers={"Retry-After": str(retry_after)}
+        )
+
 class DatabaseError(APIError):
     """Database operation errors"""
     def __init__(self, message: str = "Database operation failed"):
@@ -0,0 +1,74 @@
+from collections import deque
+from typing import Optional
+import threading
+import time
+
+from .config import settings
+from .exceptions import TooManyRequestsError
+
+class LoginThrottle:
+    """
+    Failed logins per username and per client IP within a sliding window.
+    Once either key reaches its limit, further attempts are refused before
+    the password is checked, so brute force costs no bcrypt time. Per process,
+    like the render admission control.
+    """
+    # Sweep expired keys once this many are tracked
+    SWEEP_THRESHOLD = 10000
+
+    def __init__(self, window: int, max_per_user: int, max_per_ip: int):
+        self.window = window
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self._failures = {}  # key -> deque of failure timestamps (monotonic)
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> Optional[deque]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def _keys(self, username: str, ip: Optional[str]) -> list:
+        keys = [(f"user:{username.lower()}", self.max_per_user)]
+        if ip:
+            keys.append((f"ip:{ip}", self.max_per_ip))
+        return keys
+
+    def check(self, username: str, ip: Optional[str]):
+        """Raise TooManyRequestsError if the username or IP is throttled"""
+        now = time.monotonic()
+        with self._lock:
+            for key, limit in self._keys(username, ip):
+                failures = self._recent(key, now)
+                if limit and failures is not None and len(failures) >= limit:
+                    retry_after = int(failures[-limit] + self.window - now) + 1
+                    raise TooManyRequestsError(
+                        message="Too many failed login attempts, please try again later",
+                        retry_after=retry_after
+                    )
+
+    def record_failure(self, username: str, ip: Optional[str]):
+        now = time.monotonic()
+        with self._lock:
+            for key, _ in self._keys(username, ip):
+                self._failures.setdefault(key, deque()).append(now)
+            if len(self._failures) > self.SWEEP_THRESHOLD:
+                for key in list(self._failures):
+                    self._recent(key, now)
+
+    def reset(self, username: str):
+        """Clear a username's failures after a successful login (the IP count stays)"""
+        with self._lock:
+            self._failures.pop(f"user:{username.lower()}", None)
+
+login_throttle = LoginThrottle(
+    window=settings.LOGIN_FAILURE_WINDOW,
+    max_per_user=settings.LOGIN_MAX_FAILURES_PER_USER,
+    max_per_ip=settings.LOGIN_MAX_FAILURES_PER_IP
+)
@@ -0,0 +1,119 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+import threading
+import time
+
+# Seconds; upper bounds of the latency buckets (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+class Histogram:
+    """Labelled latency histogram, rendered in the Prometheus text format"""
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(value[0]), value[1], value[2]]) for key, value in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.histograms = []
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...]) -> Histogram:
+        histogram = Histogram(name, description, label_names)
+        self.histograms.append(histogram)
+        return histogram
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+# Per process: with several workers each one exposes its own numbers
+registry = Registry()
+
+class Trace:
+    """
+    Stage durations of one operation. Repeated stages add up; every stage and
+    the total are observed once, with the trace's labels, when it finishes.
+    """
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self):
+        for stage, seconds in self.stages.items():
+            self.histogram.observe(seconds, stage=stage, **self.labels)
+        self.histogram.observe(time.perf_counter() - self.started, stage="total", **self.labels)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("metrics_trace", default=None)
+
+@contextmanager
+def trace(histogram: Histogram, **labels):
+    """Collect stage_timer durations of the code inside into a new trace"""
+    current = Trace(histogram, labels)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        current.finish()
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a stage of the current trace; a no-op outside of one"""
+    current = _current_trace.get()
+    if current is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add(stage, time.perf_counter() - started)
+
+def set_labels(**labels):
+    """Update labels of the current trace, e.g. once the cache outcome is known"""
+    current = _current_trace.get()
+    if current is not None:
+        current.labels.update(labels)
@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import repeat
+from typing import Optional, Tuple
+import logging
+import multiprocessing
+import threading
+
+from passlib.context import CryptContext
+
+from .config import settings
+from .exceptions import ServiceUnavailableError
+
+logger = logging.getLogger(__name__)
+
+@lru_cache()
+def crypt_context(rounds: int) -> CryptContext:
+    """bcrypt context; hashes with any other cost report needs_update, so logins rehash them"""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+# Run in the worker processes
+def _hash(password: str, rounds: int) -> str:
+    return crypt_context(rounds).hash(password)
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    return crypt_context(rounds).verify_and_update(password, hashed_password)
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small dedicated process pool instead of the request
+    threads. At most max_pending hashes/verifications are queued or running;
+    beyond that requests get a 503 at once, so a login flood costs a bounded
+    amount of CPU and cannot starve the rest of the API. workers=0 runs
+    inline (scripts, tests).
+    """
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs request threads is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise ServiceUnavailableError(
+                    message="Too many password operations in progress, please retry",
+                    retry_after=settings.PASSWORD_HASH_RETRY_AFTER
+                )
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            logger.error("Password hashing pool crashed, restarting it")
+            with self._lock:
+                self._executor = None
+            raise ServiceUnavailableError(
+                message="Password service restarting, please retry",
+                retry_after=settings.PASSWORD_HASH_RETRY_AFTER
+            )
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.rounds)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new hash if the stored one uses an outdated cost, else None)"""
+        return self._run(_verify_and_update, password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending}
+
+@contextmanager
+def bulk_hasher(workers: int):
+    """
+    hash_many(passwords) -> hashes, backed by a temporary pool of its own so a
+    bulk import never queues ahead of logins in the shared pool. workers=0
+    hashes inline.
+    """
+    rounds = settings.BCRYPT_ROUNDS
+    if not workers:
+        yield lambda passwords: [_hash(password, rounds) for password in passwords]
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        def hash_many(passwords: list) -> list:
+            chunksize = max(1, len(passwords) // (workers * 4))
+            return list(executor.map(_hash, passwords, repeat(rounds), chunksize=chunksize))
+        yield hash_many
+    finally:
+        executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    rounds=settings.BCRYPT_ROUNDS
+)
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from .config import settings
+from . import redis_client
+
+logger = logging.getLogger(__name__)
+
+class TokenClaimsCache:
+    """
+    Verified JWT claims keyed by a hash of the token, kept until the token's
+    exp. A token is only ever added after its signature checked out, so a hit
+    skips the decode without trusting anything new.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._claims = OrderedDict()  # sha256(token) -> (claims, exp)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            cached = self._claims.get(key)
+            if cached is None:
+                return None
+            if cached[1] <= time.time():
+                del self._claims[key]
+                return None
+            self._claims.move_to_end(key)
+            return cached[0]
+
+    def set(self, token: str, claims: dict):
+        exp = claims.get("exp")
+        if not exp:
+            return
+        with self._lock:
+            self._claims[self._key(token)] = (claims, exp)
+            self._claims.move_to_end(self._key(token))
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+class PrincipalCache:
+    """
+    Identity data of authenticated users (id, active flag, roles) by username:
+    a short-lived in-process LRU in front of Redis. Writes that change it call
+    invalidate(); other workers' local copies expire within AUTH_PRINCIPAL_LOCAL_TTL.
+    Redis errors are logged and skipped (for AUTH_REDIS_RETRY_AFTER seconds) so an
+    outage falls back to the database instead of failing requests.
+    """
+    def __init__(self, max_size: int, local_ttl: int, redis_ttl: int):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local = OrderedDict()  # username -> (principal dict, expires_at)
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0.0
+
+    @staticmethod
+    def _redis_key(username: str) -> str:
+        return f"auth:principal:{username}"
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Principal cache: Redis unavailable, using the database ({e})")
+        self._redis_retry_at = time.monotonic() + settings.AUTH_REDIS_RETRY_AFTER
+
+    def _set_local(self, username: str, principal: dict):
+        with self._lock:
+            self._local[username] = (principal, time.monotonic() + self.local_ttl)
+            self._local.move_to_end(username)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            cached = self._local.get(username)
+            if cached and cached[1] > time.monotonic():
+                self._local.move_to_end(username)
+                return cached[0]
+
+        if not self.redis_ttl or not self._redis_available():
+            return None
+        try:
+            value = redis_client.get_key(self._redis_key(username))
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        if value is None:
+            return None
+        principal = json.loads(value)
+        self._set_local(username, principal)
+        return principal
+
+    def set(self, username: str, principal: dict):
+        self._set_local(username, principal)
+        if not self.redis_ttl or not self._redis_available():
+            return
+        try:
+            redis_client.set_key(self._redis_key(username), json.dumps(principal), expire=self.redis_ttl)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._local.pop(username, None)
+        if not self.redis_ttl:
+            return
+        try:
+            redis_client.delete_key(self._redis_key(username))
+        except Exception as e:
+            # Not skipped while Redis looks down: a missed delete serves stale data until the TTL
+            logger.error(f"Principal cache: failed to invalidate {username} in Redis: {e}")
+
+token_claims_cache = TokenClaimsCache(settings.AUTH_TOKEN_CACHE_SIZE)
+principal_cache = PrincipalCache(
+    max_size=settings.AUTH_PRINCIPAL_CACHE_SIZE,
+    local_ttl=settings.AUTH_PRINCIPAL_LOCAL_TTL,
+    redis_ttl=settings.AUTH_PRINCIPAL_REDIS_TTL
+)
+
+def invalidate_principal(username: Optional[str]):
+    """Drop a user's cached identity after deactivation or a role change"""
+    if username:
+        principal_cache.invalidate(username)
@@ -6,6 +6,8 @@ redis_client = redis.Redis(
     port=settings.REDIS_CONFIG['port'],
     db=settings.REDIS_CONFIG['default_db'],
     password=settings.REDIS_CONFIG['password'],
+    socket_timeout=settings.REDIS_CONFIG.get('socket_timeout'),
+    socket_connect_timeout=settings.REDIS_CONFIG.get('socket_timeout'),
     decode_responses=True
 )
 
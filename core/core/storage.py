@@ -4,9 +4,14 @@ import logging
 from fastapi import UploadFile
 import uuid
 import io
-from typing import Union
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Union, Optional
 
 from .config import settings
+from .metrics import stage_timer
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -29,15 +34,18 @@ class S3Storage:
             logger.error(f"Error initializing S3 client: {e}")
             self.s3_client = None
 
+    def generate_object_name(self, filename: str, prefix: str = "uploads") -> str:
+        """Generate a unique object name using UUID and original filename"""
+        file_extension = filename.split('.')[-1]
+        return f"{prefix}/{uuid.uuid4()}.{file_extension}"
+
     def upload_file(self, file: UploadFile, object_name: str = None) -> Union[str, None]:
         if not self.s3_client:
             logger.error("S3 client not available. Cannot upload file.")
             return None
 
         if object_name is None:
-            # Generate a unique object name using UUID and original filename
-            file_extension = file.filename.split('.')[-1]
-            object_name = f"uploads/{uuid.uuid4()}.{file_extension}"
+            object_name = self.generate_object_name(file.filename)
 
         try:
             self.s3_client.upload_fileobj(
@@ -46,7 +54,7 @@ class S3Storage:
                 object_name,
                 ExtraArgs={'ContentType': file.content_type}
             )
-            file_url = f"https://{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/{object_name}"
+            file_url = self.public_url(object_name)
             logger.info(f"File {file.filename} uploaded to {file_url}")
             return file_url
         except ClientError as e:
@@ -56,55 +64,109 @@ class S3Storage:
             logger.error(f"An unexpected error occurred during file upload: {e}")
             return None
 
-    def upload_file_from_bytes(self, file_data: bytes, filename: str, content_type: str = None) -> Union[str, None]:
+    def upload_file_from_bytes(
+        self,
+        file_data: bytes,
+        filename: str,
+        content_type: str = None,
+        storage_class: str = None,
+        cache_control: str = None
+    ) -> Union[str, None]:
         """Upload file from bytes data to S3"""
+        # BytesIO shares the bytes object, the data is not copied
+        return self.upload_fileobj(io.BytesIO(file_data), filename, content_type, storage_class, cache_control)
+
+    def upload_fileobj(
+        self,
+        file_obj,
+        object_key: str,
+        content_type: str = None,
+        storage_class: str = None,
+        cache_control: str = None
+    ) -> Union[str, None]:
+        """Stream a readable file-like object to S3 and return its URL"""
         if not self.s3_client:
             logger.error("S3 client not available. Cannot upload file.")
             return None
 
         try:
-            # Create file-like object from bytes
-            file_obj = io.BytesIO(file_data)
-            
             # Set extra args
             extra_args = {}
             if content_type:
                 extra_args['ContentType'] = content_type
+            if storage_class:
+                extra_args['StorageClass'] = storage_class
+            if cache_control:
+                extra_args['CacheControl'] = cache_control
             
             # Upload to S3
-            self.s3_client.upload_fileobj(
-                file_obj,
-                self.bucket_name,
-                filename,
-                ExtraArgs=extra_args
-            )
+            with stage_timer("s3_upload"):
+                self.s3_client.upload_fileobj(
+                    file_obj,
+                    self.bucket_name,
+                    object_key,
+                    ExtraArgs=extra_args
+                )
             
-            file_url = f"https://{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/{filename}"
-            logger.info(f"File {filename} uploaded to {file_url}")
+            file_url = self.public_url(object_key)
+            logger.info(f"File {object_key} uploaded to {file_url}")
             return file_url
             
         except ClientError as e:
-            logger.error(f"Failed to upload {filename} to S3: {e}")
+            logger.error(f"Failed to upload {object_key} to S3: {e}")
             return None
         except Exception as e:
             logger.error(f"An unexpected error occurred during file upload: {e}")
             return None
 
-    def download_file_as_bytes(self, file_url: str) -> Union[bytes, None]:
-        """Download file from S3 and return as bytes"""
+    def public_url(self, object_key: str) -> str:
+        """Canonical public S3 URL of an object"""
+        return f"https://{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/{object_key}"
+
+    def object_key_from_url(self, file_url: str) -> Union[str, None]:
+        """Extract object key from a public S3 URL (rows stored before object keys were kept)"""
+        # Expected format: https://bucket.s3.region.amazonaws.com/path/to/file
+        host = f"{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/"
+        if not file_url or host not in file_url:
+            logger.error(f"Invalid S3 URL format: {file_url}")
+            return None
+        return file_url.split(host)[1]
+
+    def get_object_url(self, object_key: str) -> str:
+        """Build the URL clients should use for an object: presigned, CDN or public S3"""
+        return object_url_builder.build(object_key)
+
+    def change_storage_class(self, object_key: str, storage_class: str) -> bool:
+        """Move an object to another storage class in place; its key and URL stay the same"""
+        if not self.s3_client:
+            logger.error("S3 client not available. Cannot change storage class.")
+            return False
+
+        try:
+            self.s3_client.copy_object(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                CopySource={'Bucket': self.bucket_name, 'Key': object_key},
+                StorageClass=storage_class,
+                MetadataDirective='COPY'
+            )
+            logger.info(f"File {object_key} moved to storage class {storage_class}")
+            return True
+
+        except ClientError as e:
+            logger.error(f"Failed to change storage class of {object_key}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while changing storage class: {e}")
+            return False
+
+    def download_object(self, object_key: str) -> Union[bytes, None]:
+        """Download object from S3 by key and return as bytes"""
         if not self.s3_client:
             logger.error("S3 client not available. Cannot download file.")
             return None
 
         try:
-            # Extract object key from URL
-            # Expected format: https://bucket.s3.region.amazonaws.com/path/to/file
-            if f"{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com" in file_url:
-                object_key = file_url.split(f"{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/")[1]
-            else:
-                logger.error(f"Invalid S3 URL format: {file_url}")
-                return None
-            
             # Download file to bytes
             file_obj = io.BytesIO()
             self.s3_client.download_fileobj(self.bucket_name, object_key, file_obj)
@@ -120,21 +182,44 @@ class S3Storage:
             logger.error(f"An unexpected error occurred during file download: {e}")
             return None
 
-    def delete_file(self, file_url: str) -> bool:
-        """Delete file from S3"""
+    def open_object(self, object_key: str):
+        """
+        Download object from S3 into a seekable temporary file, positioned at 0.
+        Objects larger than STORAGE_SPOOL_MAX_SIZE spill to disk instead of memory.
+        The caller closes the returned file.
+        """
+        if not self.s3_client:
+            logger.error("S3 client not available. Cannot download file.")
+            return None
+
+        file_obj = tempfile.SpooledTemporaryFile(max_size=settings.STORAGE_SPOOL_MAX_SIZE)
+        try:
+            with stage_timer("s3_download"):
+                self.s3_client.download_fileobj(self.bucket_name, object_key, file_obj)
+            file_obj.seek(0)
+            logger.info(f"File {object_key} downloaded successfully")
+            return file_obj
+        except ClientError as e:
+            logger.error(f"Failed to download file from S3: {e}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during file download: {e}")
+        file_obj.close()
+        return None
+
+    def download_file_as_bytes(self, file_url: str) -> Union[bytes, None]:
+        """Download file from S3 by its public URL and return as bytes"""
+        object_key = self.object_key_from_url(file_url)
+        if object_key is None:
+            return None
+        return self.download_object(object_key)
+
+    def delete_object(self, object_key: str) -> bool:
+        """Delete object from S3 by key"""
         if not self.s3_client:
             logger.error("S3 client not available. Cannot delete file.")
             return False
 
         try:
-            # Extract object key from URL
-            if f"{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com" in file_url:
-                object_key = file_url.split(f"{self.bucket_name}.s3.{settings.AWS_REGION_NAME}.amazonaws.com/")[1]
-            else:
-                logger.error(f"Invalid S3 URL format: {file_url}")
-                return False
-            
-            # Delete file from S3
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=object_key)
             logger.info(f"File {object_key} deleted successfully")
             return True
@@ -146,5 +231,62 @@ class S3Storage:
             logger.error(f"An unexpected error occurred during file deletion: {e}")
             return False
 
+    def delete_file(self, file_url: str) -> bool:
+        """Delete file from S3 by its public URL"""
+        object_key = self.object_key_from_url(file_url)
+        if object_key is None:
+            return False
+        return self.delete_object(object_key)
+
+class ObjectUrlBuilder:
+    """
+    Turns object keys into client URLs at read time.
+    Presigned URLs are cached until shortly before they expire, so listing
+    responses do not pay a signing cost per item on every request.
+    """
+    def __init__(self, storage: S3Storage):
+        self.storage = storage
+        self._presigned = OrderedDict()  # object_key -> (url, refresh_at)
+        self._lock = threading.Lock()
+
+    def build(self, object_key: str) -> str:
+        if settings.STORAGE_PRIVATE_OBJECTS:
+            return self._presigned_url(object_key)
+        if settings.STORAGE_CDN_BASE_URL:
+            return f"{settings.STORAGE_CDN_BASE_URL.rstrip('/')}/{object_key}"
+        return self.storage.public_url(object_key)
+
+    def _presigned_url(self, object_key: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._presigned.get(object_key)
+            if cached and cached[1] > now:
+                self._presigned.move_to_end(object_key)
+                return cached[0]
+
+        if not self.storage.s3_client:
+            logger.error("S3 client not available. Cannot presign URL.")
+            return self.storage.public_url(object_key)
+
+        url = self.storage.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.storage.bucket_name, 'Key': object_key},
+            ExpiresIn=settings.STORAGE_PRESIGN_EXPIRES
+        )
+        refresh_at = now + settings.STORAGE_PRESIGN_EXPIRES - settings.STORAGE_PRESIGN_REFRESH_MARGIN
+        with self._lock:
+            self._presigned[object_key] = (url, refresh_at)
+            self._presigned.move_to_end(object_key)
+            while len(self._presigned) > settings.STORAGE_URL_CACHE_SIZE:
+                self._presigned.popitem(last=False)
+        return url
+
 # Create a single instance to be used across the application
-s3_storage = S3Storage() 
\ No newline at end of file
+s3_storage = S3Storage()
+object_url_builder = ObjectUrlBuilder(s3_storage)
+
+def build_object_url(storage_backend: Optional[str], object_key: Optional[str], file_url: Optional[str]) -> Optional[str]:
+    """URL for a stored row; rows without an object key keep serving their stored URL"""
+    if storage_backend == "s3" and object_key:
+        return s3_storage.get_object_url(object_key)
+    return file_url
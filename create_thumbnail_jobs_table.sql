@@ -0,0 +1,18 @@
+-- Migration script to create thumbnail_jobs table
+-- Checkpoints of bulk thumbnail regeneration runs (regenerate_thumbnails.py)
+
+CREATE TABLE IF NOT EXISTS thumbnail_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running' COMMENT 'running, completed',
+    last_file_id INT NOT NULL DEFAULT 0,
+    total_files INT DEFAULT 0,
+    processed_files INT DEFAULT 0,
+    rendered_variants BIGINT DEFAULT 0,
+    failed_variants BIGINT DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NULL ON UPDATE CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL,
+
+    CONSTRAINT unique_thumbnail_job_name UNIQUE (name)
+);
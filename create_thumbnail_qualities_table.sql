@@ -0,0 +1,16 @@
+-- Migration script to create thumbnail_qualities table
+-- Encoder quality chosen by q=auto per file, size and format
+
+CREATE TABLE IF NOT EXISTS thumbnail_qualities (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    file_id INT NOT NULL,
+    width INT NOT NULL,
+    height INT NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    quality INT NOT NULL,
+    score FLOAT COMMENT 'SSIM of the chosen quality against the lossless resize',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE,
+    CONSTRAINT unique_thumbnail_quality UNIQUE (file_id, width, height, format)
+);
@@ -0,0 +1,20 @@
+-- Migration script to create thumbnail_sprites table
+-- Caches gallery sprite sheets keyed on preset + sorted file ids
+
+CREATE TABLE IF NOT EXISTS thumbnail_sprites (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    cache_key VARCHAR(64) NOT NULL,
+    preset VARCHAR(10) NOT NULL,
+    file_ids TEXT NOT NULL COMMENT 'Comma separated member file ids',
+    source_signature VARCHAR(64) NOT NULL,
+    file_url VARCHAR(512) NOT NULL,
+    file_size FLOAT,
+    width INT NOT NULL,
+    height INT NOT NULL,
+    tile_size INT NOT NULL,
+    coordinates JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NULL ON UPDATE CURRENT_TIMESTAMP,
+
+    CONSTRAINT unique_sprite_cache_key UNIQUE (cache_key)
+);
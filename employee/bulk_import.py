@@ -0,0 +1,229 @@
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+import codecs
+import csv
+import json
+import logging
+import threading
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from core.core.config import settings
+from core.core.exceptions import ServiceUnavailableError
+from core.core.password_hashing import bulk_hasher
+from employee import typeahead
+from employee.models import Employee
+from employee.schemas import EmployeeImportRow
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# One import at a time per process: each one runs its own hashing pool
+_import_lock = threading.Lock()
+
+def detect_format(filename: Optional[str], format: Optional[str] = None) -> Optional[str]:
+    """csv or ndjson, from the explicit format or the file extension"""
+    if format:
+        format = format.lower()
+        return "ndjson" if format in ("ndjson", "jsonl") else format if format in IMPORT_FORMATS else None
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+def iter_rows(stream, format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    (row number, fields, parse error) for every record, read incrementally from
+    the binary upload stream. Empty CSV cells count as missing.
+    """
+    text = codecs.getreader("utf-8-sig")(stream)
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row_number, row in enumerate(reader, start=1):
+            yield row_number, {k.strip(): (v.strip() or None) if isinstance(v, str) else v for k, v in row.items() if k}, None
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(fields, dict):
+            yield row_number, None, "Expected a JSON object"
+            continue
+        yield row_number, fields, None
+
+def _validation_messages(e: ValidationError) -> list:
+    return [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+class EmployeeImport:
+    """
+    Streams rows into users + employees, EMPLOYEE_IMPORT_CHUNK_SIZE at a time:
+    validate the chunk, reject duplicates (within the file and against the
+    database, one query per unique column, ignoring case like the MySQL
+    collation), hash the passwords in parallel, then insert both tables with
+    executemany and commit. A chunk that still fails to insert is rolled back
+    and retried one row per transaction, so only the conflicting rows fail;
+    earlier chunks stay.
+    """
+    def __init__(self, db: Session, chunk_size: int, max_errors: int):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.seen = {"username": set(), "email": set(), "phone_number": set()}
+
+    def _fail(self, row_number: int, username: Optional[str], messages: list):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row_number, "username": username, "errors": messages})
+
+    def _existing(self, column, values: set) -> set:
+        """Casefolded values of column already stored"""
+        if not values:
+            return set()
+        return {value.casefold() for (value,) in self.db.query(column).filter(column.in_(values)).all()}
+
+    def _validate_chunk(self, chunk: list) -> list:
+        valid = []
+        for row_number, fields, parse_error in chunk:
+            if parse_error:
+                self._fail(row_number, None, [parse_error])
+                continue
+            try:
+                valid.append((row_number, EmployeeImportRow(**fields)))
+            except ValidationError as e:
+                self._fail(row_number, fields.get("username"), _validation_messages(e))
+
+        existing = {
+            "username": self._existing(User.username, {row.username for _, row in valid}),
+            "email": self._existing(Employee.email, {row.email for _, row in valid}),
+            "phone_number": self._existing(Employee.phone_number, {row.phone_number for _, row in valid if row.phone_number}),
+        }
+        unique = []
+        for row_number, row in valid:
+            messages = []
+            for field in ("username", "email", "phone_number"):
+                value = getattr(row, field)
+                if value is None:
+                    continue
+                value = value.casefold()
+                if value in existing[field]:
+                    messages.append(f"{field}: already exists")
+                elif value in self.seen[field]:
+                    messages.append(f"{field}: duplicated in the file")
+            if messages:
+                self._fail(row_number, row.username, messages)
+                continue
+            for field in ("username", "email", "phone_number"):
+                if getattr(row, field) is not None:
+                    self.seen[field].add(getattr(row, field).casefold())
+            unique.append((row_number, row))
+        return unique
+
+    def _insert_chunk(self, rows: list, hashes: list):
+        now = datetime.utcnow()
+        self.db.execute(insert(User), [
+            {
+                "username": row.username,
+                "hashed_password": hashed_password,
+                "is_active": True,
+                "is_verified": True,
+                "created_at": now,
+            }
+            for (_, row), hashed_password in zip(rows, hashes)
+        ])
+        # executemany does not return ids; one query maps them back
+        user_ids = dict(
+            self.db.query(User.username, User.id).filter(User.username.in_([row.username for _, row in rows])).all()
+        )
+        self.db.execute(insert(Employee), [
+            {
+                "user_id": user_ids[row.username],
+                "first_name": row.first_name,
+                "last_name": row.last_name,
+                "email": row.email,
+                "phone_number": row.phone_number,
+                "address": row.address,
+                "date_of_birth": row.date_of_birth,
+                "status": row.status if row.status is not None else 1,
+            }
+            for _, row in rows
+        ])
+        self.db.commit()
+
+    def _process_chunk(self, chunk: list, hash_many):
+        self.total += len(chunk)
+        rows = self._validate_chunk(chunk)
+        if not rows:
+            return
+        hashes = hash_many([row.password for _, row in rows])
+        try:
+            self._insert_chunk(rows, hashes)
+            self.imported += len(rows)
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            # e.orig: the statement parameters include password hashes
+            logger.warning(f"Employee import: chunk insert failed, retrying row by row: {getattr(e, 'orig', e)}")
+            self._insert_rows(rows, hashes)
+        typeahead.clear_cache()
+
+    def _insert_rows(self, rows: list, hashes: list):
+        """Slow path after a failed chunk: one transaction per row, each failure reported on its row"""
+        for (row_number, row), hashed_password in zip(rows, hashes):
+            try:
+                self._insert_chunk([(row_number, row)], [hashed_password])
+            except IntegrityError as e:
+                self.db.rollback()
+                logger.info(f"Employee import: row {row_number} rejected: {e.orig}")
+                self._fail(row_number, row.username, ["Conflicts with an existing user or employee, nothing stored for this row"])
+                continue
+            except SQLAlchemyError as e:
+                self.db.rollback()
+                logger.error(f"Employee import: row {row_number} insert failed: {getattr(e, 'orig', e)}")
+                self._fail(row_number, row.username, ["Insert failed, nothing stored for this row"])
+                continue
+            self.imported += 1
+
+    def run(self, rows: Iterator) -> dict:
+        with bulk_hasher(settings.EMPLOYEE_IMPORT_HASH_WORKERS) as hash_many:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._process_chunk(chunk, hash_many)
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+def import_employees(db: Session, stream, format: str) -> dict:
+    """Import a CSV/NDJSON stream of employees; see EmployeeImport"""
+    if not _import_lock.acquire(blocking=False):
+        raise ServiceUnavailableError(message="Another employee import is running", retry_after=30)
+    try:
+        importer = EmployeeImport(
+            db,
+            chunk_size=settings.EMPLOYEE_IMPORT_CHUNK_SIZE,
+            max_errors=settings.EMPLOYEE_IMPORT_MAX_ERRORS
+        )
+        return importer.run(iter_rows(stream, format))
+    finally:
+        _import_lock.release()
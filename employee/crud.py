@@ -1,9 +1,14 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
 from employee.models import Employee
 from users.models import User
 from employee.schemas import EmployeeCreate
 from core.core.security import get_password_hash
 from datetime import datetime
+from employee import typeahead
+from employee.typeahead import prefix_pattern
+
 
 def create_employee(db: Session, employee_in: EmployeeCreate):
     # 1. Create user
@@ -33,4 +38,25 @@ def create_employee(db: Session, employee_in: EmployeeCreate):
     db.add(db_employee)
     db.commit()
     db.refresh(db_employee)
-    return db_employee 
\ No newline at end of file
+    typeahead.clear_cache()
+    return db_employee
+
+
+def search_employees(db: Session, q: Optional[str] = None, skip: int = 0, limit: int = 20) -> Tuple[List[Employee], int]:
+    """
+    Employees whose first name, last name, email or phone number starts with q.
+    Plain LIKE 'q%' (not ilike: lower() would defeat the indexes; the column
+    collation already ignores case), so each column is an index range scan.
+    """
+    query = db.query(Employee)
+    if q:
+        pattern = prefix_pattern(q)
+        query = query.filter(or_(
+            Employee.first_name.like(pattern, escape="\\"),
+            Employee.last_name.like(pattern, escape="\\"),
+            Employee.email.like(pattern, escape="\\"),
+            Employee.phone_number.like(pattern, escape="\\")
+        ))
+    total = query.count()
+    items = query.order_by(Employee.last_name, Employee.first_name, Employee.id).offset(skip).limit(limit).all()
+    return items, total
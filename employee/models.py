@@ -8,8 +8,8 @@ class Employee(Base):
 
     id = Column(BigInteger, primary_key=True, index=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False, unique=True)
-    first_name = Column(String(100), nullable=True)
-    last_name = Column(String(100), nullable=True)
+    first_name = Column(String(100), nullable=True, index=True)
+    last_name = Column(String(100), nullable=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     phone_number = Column(String(20), unique=True, index=True)
     address = Column(Text)
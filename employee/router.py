@@ -1,15 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
 from sqlalchemy.orm import Session
-from employee.schemas import EmployeeCreate, Employee
-from employee.crud import create_employee
+from typing import Optional, List
+from employee.schemas import EmployeeCreate, Employee, EmployeeImportResult, EmployeePage, EmployeeSuggestion
+from employee.crud import create_employee, search_employees
+from employee.bulk_import import detect_format, import_employees
+from employee.typeahead import suggest_employees
 from core.core.database import get_db
+from core.core.auth import PermissionChecker, get_current_user
 
 router = APIRouter(prefix="/employee", tags=["Employee"])
 
+employee_admin_permission = PermissionChecker(required_roles=["employee_manager", "admin"])
+
 @router.post("/create", response_model=Employee, status_code=status.HTTP_201_CREATED)
 def create_employee_api(employee_in: EmployeeCreate, db: Session = Depends(get_db)):
     try:
         employee = create_employee(db, employee_in)
         return employee
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/search", response_model=EmployeePage, dependencies=[Depends(get_current_user)])
+def search_employees_api(
+    q: Optional[str] = Query(None, description="Prefix of the first name, last name, email or phone number"),
+    page: int = 1,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Directory search for any signed-in user, so items are the slim typeahead entries"""
+    skip = (page - 1) * limit if page > 0 else 0
+    items, total = search_employees(db, q=q.strip() if q else None, skip=skip, limit=limit)
+    return {"page": page, "limit": limit, "total": total, "items": items}
+
+@router.get("/typeahead", response_model=List[EmployeeSuggestion], dependencies=[Depends(get_current_user)])
+def employee_typeahead_api(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    """Top matches for "assign to" pickers; hot prefixes are answered from memory"""
+    return suggest_employees(db, q, limit)
+
+@router.post("/import", response_model=EmployeeImportResult, dependencies=[Depends(employee_admin_permission)])
+def import_employees_api(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv | ndjson (default: from the file extension)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk create users + employees from a CSV (header row) or NDJSON file with the
+    fields username, password, email, first_name, last_name, phone_number,
+    address, date_of_birth, status. Valid rows are stored; the others are
+    returned with their errors.
+    """
+    import_format = detect_format(file.filename, format)
+    if import_format is None:
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ file CSV hoặc NDJSON")
+    return import_employees(db, file.file, import_format)
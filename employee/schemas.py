@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -25,4 +25,39 @@ class Employee(EmployeeBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class EmployeeSuggestion(BaseModel):
+    """Directory and typeahead entry: just enough to render and pick a person"""
+    id: int
+    user_id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: str
+    phone_number: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class EmployeePage(BaseModel):
+    page: int
+    limit: int
+    total: int
+    items: List[EmployeeSuggestion]
+
+class EmployeeImportRow(EmployeeBase):
+    """One CSV/NDJSON import row: the employee fields plus the login"""
+    username: str
+    password: str
+
+class ImportRowError(BaseModel):
+    row: int
+    username: Optional[str] = None
+    errors: List[str]
+
+class EmployeeImportResult(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Optional
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from core.core.config import settings
+from employee.models import Employee
+
+# Columns matched by prefix, each backed by its own index
+PREFIX_COLUMNS = (Employee.first_name, Employee.last_name, Employee.email, Employee.phone_number)
+
+def prefix_pattern(prefix: str) -> str:
+    """LIKE pattern matching values that start with prefix (wildcards escaped)"""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+class PrefixCache:
+    """
+    Typeahead matches by normalised prefix for a few seconds: pickers fire the
+    same short prefixes over and over while people type. Cleared whenever
+    employees are added; other workers see new people within the TTL.
+    """
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # prefix -> (matches, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, prefix: str) -> Optional[list]:
+        with self._lock:
+            cached = self._entries.get(prefix)
+            if cached is None:
+                return None
+            if cached[1] <= time.monotonic():
+                del self._entries[prefix]
+                return None
+            self._entries.move_to_end(prefix)
+            return cached[0]
+
+    def set(self, prefix: str, matches: list):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[prefix] = (matches, time.monotonic() + self.ttl)
+            self._entries.move_to_end(prefix)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+prefix_cache = PrefixCache(ttl=settings.EMPLOYEE_TYPEAHEAD_CACHE_TTL, max_size=settings.EMPLOYEE_TYPEAHEAD_CACHE_SIZE)
+
+def clear_cache():
+    """Change hook: call after employees are created, imported or renamed"""
+    prefix_cache.clear()
+
+def _fetch(db: Session, prefix: str, limit: int) -> list:
+    """
+    One short index range scan per column (LIKE 'prefix%' ORDER BY column LIMIT n)
+    instead of an OR over all of them, merged by the matched value.
+    """
+    pattern = prefix_pattern(prefix)
+    columns = (Employee.id, Employee.user_id, Employee.first_name, Employee.last_name, Employee.email, Employee.phone_number)
+    matches = {}
+    for column in PREFIX_COLUMNS:
+        rows = (
+            db.query(*columns, column.label("matched"))
+            .filter(column.like(pattern, escape="\\"))
+            .order_by(column, Employee.id)
+            .limit(limit)
+            .all()
+        )
+        for row in rows:
+            key = ((row.matched or "").lower(), row.id)
+            if row.id not in matches or key < matches[row.id][0]:
+                matches[row.id] = (key, row)
+
+    ranked = sorted(matches.values(), key=lambda match: match[0])[:limit]
+    return [
+        {
+            "id": row.id,
+            "user_id": row.user_id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "email": row.email,
+            "phone_number": row.phone_number,
+        }
+        for _, row in ranked
+    ]
+
+def suggest_employees(db: Session, prefix: str, limit: Optional[int] = None) -> list:
+    """Top matches for a typeahead prefix, served from the prefix cache when hot"""
+    max_limit = settings.EMPLOYEE_TYPEAHEAD_LIMIT
+    limit = min(limit or max_limit, max_limit)
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return []
+
+    # Always fetch and cache max_limit matches, so any limit is served from one entry
+    matches = prefix_cache.get(prefix)
+    if matches is None:
+        matches = _fetch(db, prefix, max_limit)
+        prefix_cache.set(prefix, matches)
+    return matches[:limit]
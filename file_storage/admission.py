@@ -0,0 +1,112 @@
+from collections import Counter
+from typing import Optional
+import threading
+import time
+
+from core.core.config import settings
+from core.core.metrics import stage_timer
+
+class RenderRejected(Exception):
+    """A render was shed instead of queued; reason is queue_full, client_limit or queue_timeout"""
+    def __init__(self, reason: str):
+        super().__init__(f"Thumbnail render rejected: {reason}")
+        self.reason = reason
+
+class RenderAdmission:
+    """
+    Admission control in front of on-demand renders. At most max_concurrent
+    renders run, at most max_queue more wait for a slot, and one client may
+    hold at most per_client of either. Anything beyond that is rejected at
+    once, so a burst of cold thumbnails cannot tie up every request thread
+    and slow down the rest of the API.
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, per_client: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.queue_timeout = queue_timeout
+        self.condition = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.clients = Counter()
+        self.counters = Counter()
+
+    def _acquire(self, client: str):
+        with self.condition:
+            if self.clients[client] >= self.per_client:
+                self.counters["rejected_client_limit"] += 1
+                raise RenderRejected("client_limit")
+            if self.running >= self.max_concurrent and self.waiting >= self.max_queue:
+                self.counters["rejected_queue_full"] += 1
+                raise RenderRejected("queue_full")
+
+            self.clients[client] += 1
+            if self.running >= self.max_concurrent:
+                self.waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.running >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self.condition.wait(remaining):
+                            if self.running < self.max_concurrent:
+                                break
+                            self._release_client(client)
+                            self.counters["rejected_queue_timeout"] += 1
+                            raise RenderRejected("queue_timeout")
+                finally:
+                    self.waiting -= 1
+            self.running += 1
+            self.counters["admitted"] += 1
+
+    def _release_client(self, client: str):
+        self.clients[client] -= 1
+        if self.clients[client] <= 0:
+            del self.clients[client]
+
+    def _release(self, client: str):
+        with self.condition:
+            self.running -= 1
+            self._release_client(client)
+            self.condition.notify()
+
+    def run(self, client: str, render):
+        """Call render() once admitted; raises RenderRejected if shed"""
+        with stage_timer("queue"):
+            self._acquire(client)
+        try:
+            return render()
+        finally:
+            self._release(client)
+
+    def record_fallback(self):
+        with self.condition:
+            self.counters["served_fallback"] += 1
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "running": self.running,
+                "queued": self.waiting,
+                "clients": len(self.clients),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "per_client": self.per_client,
+                "admitted": self.counters["admitted"],
+                "rejected_queue_full": self.counters["rejected_queue_full"],
+                "rejected_client_limit": self.counters["rejected_client_limit"],
+                "rejected_queue_timeout": self.counters["rejected_queue_timeout"],
+                "served_fallback": self.counters["served_fallback"],
+            }
+
+render_admission = RenderAdmission(
+    max_concurrent=settings.THUMBNAIL_ADMISSION_MAX_CONCURRENT,
+    max_queue=settings.THUMBNAIL_ADMISSION_MAX_QUEUE,
+    per_client=settings.THUMBNAIL_ADMISSION_PER_CLIENT,
+    queue_timeout=settings.THUMBNAIL_ADMISSION_QUEUE_TIMEOUT
+)
+
+def admit_render(client: Optional[str], render):
+    """Run render under admission control; client None (internal callers) bypasses it"""
+    if client is None:
+        return render()
+    return render_admission.run(client, render)
@@ -1,18 +1,65 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
-from typing import Optional
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from fastapi import UploadFile, HTTPException, status
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
+import math
 import os
-from PIL import Image
+from PIL import Image, ImageCms, ImageOps, ExifTags
 import boto3
 from botocore.exceptions import ClientError
+import logging
 
-from . import models, schemas
+from core.core.config import settings
+from core.core import metrics
+from core.core.metrics import stage_timer
+from . import engines, models, schemas
+from .admission import admit_render
+from .phash import dhash, hamming, phash_index
 
-def create_file(db: Session, file: schemas.FileCreate) -> models.File:
-    db_file = models.File(**file.dict())
+logger = logging.getLogger(__name__)
+
+# Originals that the optional ingest stage knows how to optimize
+OPTIMIZABLE_IMAGE_TYPES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+}
+
+THUMBNAIL_STAGE_SECONDS = metrics.registry.histogram(
+    "thumbnail_stage_seconds",
+    "Thumbnail pipeline latency per stage",
+    ("stage", "format", "size", "cache")
+)
+
+# Upper bounds of the size label (longest requested edge, px)
+THUMBNAIL_SIZE_BUCKETS = (150, 300, 600, 1000, 2000)
+
+def thumbnail_trace(width: int, height: int, format: str, cache: str = "miss"):
+    """
+    Trace the stages of one thumbnail request into THUMBNAIL_STAGE_SECONDS, labelled
+    with the format, the size bucket and the cache outcome (metrics.set_labels)
+    """
+    edge = max(width, height)
+    size = next((str(bound) for bound in THUMBNAIL_SIZE_BUCKETS if edge <= bound), f"{THUMBNAIL_SIZE_BUCKETS[-1]}+")
+    return metrics.trace(THUMBNAIL_STAGE_SECONDS, format=format.lower(), size=size, cache=cache)
+
+# Coarseness of ThumbnailSprite.last_accessed; hits within it do not update the row
+SPRITE_ACCESS_RESOLUTION = timedelta(hours=1)
+
+# Square tile edge (px) for each sprite sheet preset
+SPRITE_PRESETS = {
+    "xs": 48,
+    "sm": 64,
+    "md": 96,
+    "lg": 128,
+}
+
+def create_file(db: Session, file: schemas.FileCreate, uploaded_by: Optional[int] = None) -> models.File:
+    db_file = models.File(**file.dict(), uploaded_by=uploaded_by)
     db.add(db_file)
     db.commit()
     db.refresh(db_file)
@@ -59,13 +106,20 @@ def get_files(
     
     return {"total": total, "files": files} 
 
-def upload_file(
-    db: Session,
-    file: UploadFile,
-    s3_storage,
-    validate_public: bool = False
-) -> models.File:
-    # Validate public upload
+def get_object_key(s3_storage, row) -> Optional[str]:
+    """Stored object key, or the key parsed from file_url for rows stored before keys were kept"""
+    return row.object_key or s3_storage.object_key_from_url(row.file_url)
+
+def record_file_access(db: Session, s3_storage, db_file: models.File) -> models.File:
+    """Track an access to the original; cold files are moved back to the hot tier by the tiering job"""
+    db_file.last_accessed = datetime.utcnow()
+    db_file.access_count = (db_file.access_count or 0) + 1
+    with stage_timer("db_commit"):
+        db.commit()
+    return db_file
+
+def validate_upload(file: UploadFile, validate_public: bool = False):
+    """Reject uploads the public endpoints do not accept"""
     if validate_public:
         allowed_types = ["image/jpeg", "image/png", "image/gif", "image/webp", "application/pdf"]
         if file.content_type not in allowed_types:
@@ -75,34 +129,347 @@ def upload_file(
         file.file.seek(0)
         if file_size > 5 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="Dung lượng file tối đa 5MB")
-    # Check s3 client
+
+def ensure_storage_available(s3_storage):
     if not s3_storage.s3_client:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="client is not available."
         )
-    # Get file size before uploading
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    file_url = s3_storage.upload_file(file=file)
+
+def store_upload(file: UploadFile, s3_storage) -> schemas.FileCreate:
+    """
+    Optimize (optionally), upload to S3 and describe the stored object.
+    No database access, so several uploads can run in parallel.
+    """
+    archive_key = None
+    optimized_data = None
+    object_name = s3_storage.generate_object_name(file.filename)
+    if settings.IMAGE_OPTIMIZE_ON_UPLOAD and file.content_type in OPTIMIZABLE_IMAGE_TYPES:
+        original_data = file.file.read()
+        file.file.seek(0)
+        optimized_data = optimize_original_image(original_data, file.content_type)
+
+    if optimized_data is not None:
+        if settings.IMAGE_ARCHIVE_ORIGINALS:
+            # Keep the untouched upload next to the optimized one, in a colder storage class
+            archive_key = object_name.replace("uploads/", "archive/", 1)
+            if s3_storage.upload_file_from_bytes(
+                file_data=original_data,
+                filename=archive_key,
+                content_type=file.content_type,
+                storage_class=settings.IMAGE_ARCHIVE_STORAGE_CLASS
+            ) is None:
+                archive_key = None
+                logger.warning(f"Failed to archive original of {file.filename}, keeping the untouched upload")
+                optimized_data = None
+    
+    # Read what is needed from the content before uploading: boto closes the stream it uploads
+    width, height, phash = None, None, None
+    if file.content_type and file.content_type.startswith('image/'):
+        stored_image = io.BytesIO(optimized_data) if optimized_data is not None else file.file
+        width, height = read_image_dimensions(stored_image)
+        phash = dhash(stored_image)
+
+    if optimized_data is not None:
+        file_size = len(optimized_data)
+        file_url = s3_storage.upload_file_from_bytes(
+            file_data=optimized_data,
+            filename=object_name,
+            content_type=file.content_type
+        )
+    else:
+        # Get file size before uploading
+        file.file.seek(0, 2)
+        file_size = file.file.tell()
+        file.file.seek(0)
+        file_url = s3_storage.upload_file(file=file, object_name=object_name)
     if file_url is None:
+        if archive_key:
+            s3_storage.delete_object(archive_key)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to upload file to"
         )
     filename_parts = file.filename.split('.')
     file_extension = filename_parts[-1] if len(filename_parts) > 1 else None
-    file_data = schemas.FileCreate(
+    return schemas.FileCreate(
         filename=file.filename,
         file_url=file_url,
+        storage_backend="s3",
+        object_key=object_name,
         content_type=file.content_type,
         file_extension=file_extension,
-        size=file_size
+        size=file_size,
+        width=width,
+        height=height,
+        archive_key=archive_key,
+        phash=phash
     )
-    db_file = create_file(db=db, file=file_data)
+
+def upload_file(
+    db: Session,
+    file: UploadFile,
+    s3_storage,
+    validate_public: bool = False,
+    uploaded_by: Optional[int] = None
+) -> models.File:
+    validate_upload(file, validate_public)
+    ensure_storage_available(s3_storage)
+    file_data = store_upload(file, s3_storage)
+    db_file = create_file(db=db, file=file_data, uploaded_by=uploaded_by)
     return db_file
 
+def upload_files(
+    db: Session,
+    files: list,
+    s3_storage,
+    validate_public: bool = False,
+    uploaded_by: Optional[int] = None
+) -> list:
+    """
+    Upload several files at once: all parts are validated first, the valid ones
+    are sent to S3 concurrently and their rows are inserted in one transaction.
+    Returns one (filename, File or None, error or None) per part, in request order.
+    """
+    if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.UPLOAD_BATCH_MAX_FILES} files per batch"
+        )
+    ensure_storage_available(s3_storage)
+
+    errors = {}
+    for index, file in enumerate(files):
+        try:
+            validate_upload(file, validate_public)
+        except HTTPException as e:
+            errors[index] = e.detail
+
+    stored = {}
+    pending = [index for index in range(len(files)) if index not in errors]
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.UPLOAD_CONCURRENCY, len(pending)))) as executor:
+        futures = {index: executor.submit(store_upload, files[index], s3_storage) for index in pending}
+        for index, future in futures.items():
+            try:
+                stored[index] = future.result()
+            except HTTPException as e:
+                errors[index] = e.detail
+            except Exception as e:
+                logger.error(f"Failed to upload {files[index].filename}: {e}")
+                errors[index] = f"Failed to upload file: {str(e)}"
+
+    db_files = {index: models.File(**file_data.dict(), uploaded_by=uploaded_by) for index, file_data in stored.items()}
+    if db_files:
+        db.add_all(db_files.values())
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Nothing references the uploaded objects now
+            for file_data in stored.values():
+                s3_storage.delete_object(file_data.object_key)
+                if file_data.archive_key:
+                    s3_storage.delete_object(file_data.archive_key)
+            raise
+        for db_file in db_files.values():
+            db.refresh(db_file)
+
+    return [
+        (file.filename, db_files.get(index), errors.get(index))
+        for index, file in enumerate(files)
+    ]
+
+def replace_file_content(
+    db: Session,
+    db_file: models.File,
+    file: UploadFile,
+    s3_storage,
+    validate_public: bool = True
+) -> models.File:
+    """
+    Store new content for an existing file and bump its version. Thumbnails and
+    auto-quality picks of the old content are dropped along with their objects,
+    the old original and its archive; sprite sheets notice the new object key
+    through their source signature and rebuild on next request.
+    """
+    validate_upload(file, validate_public)
+    ensure_storage_available(s3_storage)
+    file_data = store_upload(file, s3_storage)
+    old_object_key = get_object_key(s3_storage, db_file)
+    old_archive_key = db_file.archive_key
+    old_mezzanine_key = db_file.mezzanine_key
+    old_thumbnail_keys = {
+        object_key for (object_key,) in db.query(models.Thumbnail.object_key).filter(
+            models.Thumbnail.original_file_id == db_file.id,
+            models.Thumbnail.object_key.isnot(None)
+        )
+    }
+
+    for field, value in file_data.dict().items():
+        setattr(db_file, field, value)
+    db_file.mezzanine_key = None
+    db_file.version = (db_file.version or 1) + 1
+    db_file.storage_tier = "hot"
+
+    db.query(models.Thumbnail).filter(
+        models.Thumbnail.original_file_id == db_file.id
+    ).delete(synchronize_session=False)
+    db.query(models.ThumbnailQuality).filter(
+        models.ThumbnailQuality.file_id == db_file.id
+    ).delete(synchronize_session=False)
+    db.commit()
+    db.refresh(db_file)
+
+    if old_object_key and old_object_key != db_file.object_key:
+        s3_storage.delete_object(old_object_key)
+    if old_archive_key and old_archive_key != db_file.archive_key:
+        s3_storage.delete_object(old_archive_key)
+    if old_mezzanine_key:
+        s3_storage.delete_object(old_mezzanine_key)
+    delete_unreferenced_thumbnail_objects(db, s3_storage, old_thumbnail_keys)
+    return db_file
+
+def delete_unreferenced_thumbnail_objects(db: Session, s3_storage, object_keys) -> int:
+    """
+    Delete the thumbnail objects no row points at any more; call after the commit
+    that dropped or repointed their rows. Near-duplicate reuse shares objects
+    between files, so a key may still be in use. Returns the number deleted.
+    """
+    object_keys = {object_key for object_key in object_keys if object_key}
+    if not object_keys:
+        return 0
+    shared_keys = {
+        object_key for (object_key,) in db.query(models.Thumbnail.object_key).filter(
+            models.Thumbnail.object_key.in_(object_keys)
+        )
+    }
+    for object_key in object_keys - shared_keys:
+        s3_storage.delete_object(object_key)
+    return len(object_keys - shared_keys)
+
+def ensure_phash(db: Session, s3_storage, db_file: models.File) -> Optional[str]:
+    """Perceptual hash of an image file, computed and stored now for rows uploaded before hashing"""
+    if db_file.phash or not db_file.content_type or not db_file.content_type.startswith('image/'):
+        return db_file.phash
+    source = s3_storage.open_object(get_object_key(s3_storage, db_file))
+    if not source:
+        return None
+    try:
+        db_file.phash = dhash(source)
+    finally:
+        source.close()
+    if db_file.phash:
+        db.commit()
+    return db_file.phash
+
+def find_near_duplicates(db: Session, db_file: models.File, max_distance: int, limit: int = 20) -> list:
+    """(file, distance) of other files whose content hash is within max_distance, closest first"""
+    if not db_file.phash:
+        return []
+    matches = phash_index.search(db, db_file.phash, max_distance)
+    candidate_ids = {file_id for file_id, _ in matches if file_id != db_file.id}
+    if not candidate_ids:
+        return []
+
+    # The index can be stale (replaced or deleted files): re-check against current rows
+    value = int(db_file.phash, 16)
+    results = []
+    for candidate in db.query(models.File).filter(models.File.id.in_(candidate_ids)).all():
+        if not candidate.phash:
+            continue
+        distance = hamming(value, int(candidate.phash, 16))
+        if distance <= max_distance:
+            results.append((candidate, distance))
+    results.sort(key=lambda r: (r[1], r[0].id))
+    return results[:limit]
+
+def read_image_dimensions(file_obj) -> tuple:
+    """Read (width, height) from the image header only; (None, None) if unreadable"""
+    try:
+        file_obj.seek(0)
+        with Image.open(file_obj) as image:
+            size = image.size
+        file_obj.seek(0)
+        return size
+    except Exception as e:
+        logger.warning(f"Could not read image dimensions: {e}")
+        return None, None
+
+def _convert_to_srgb(image: Image.Image) -> Tuple[Image.Image, bool]:
+    """
+    Convert pixels tagged with a non-sRGB ICC profile (Display P3, Adobe RGB, CMYK)
+    to sRGB, so the colours survive dropping the profile. Returns (image, converted).
+    """
+    icc_profile = image.info.get("icc_profile")
+    if not icc_profile or image.mode not in ("RGB", "RGBA", "CMYK"):
+        return image, False
+    source_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+    if "srgb" in (ImageCms.getProfileDescription(source_profile) or "").lower():
+        return image, False
+    output_mode = "RGB" if image.mode == "CMYK" else image.mode
+    converted = ImageCms.profileToProfile(
+        image,
+        source_profile,
+        ImageCms.createProfile("sRGB"),
+        renderingIntent=ImageCms.Intent.PERCEPTUAL,
+        outputMode=output_mode
+    )
+    return converted, True
+
+def optimize_original_image(image_data: bytes, content_type: str) -> Optional[bytes]:
+    """
+    Strip metadata, apply EXIF orientation, cap the longest edge and recompress.
+    Returns None when the original should be stored as-is.
+    """
+    save_format = OPTIMIZABLE_IMAGE_TYPES.get(content_type)
+    if save_format is None:
+        return None
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        if image.format != save_format:
+            return None
+
+        # Bake the EXIF orientation into the pixels since the EXIF block is dropped below
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        pixels_changed = orientation not in (None, 1)
+        if pixels_changed:
+            image = ImageOps.exif_transpose(image)
+
+        # The ICC block is dropped below as well: wide-gamut pixels must be sRGB first
+        image, converted = _convert_to_srgb(image)
+        pixels_changed = pixels_changed or converted
+
+        if max(image.size) > settings.IMAGE_MAX_DIMENSION:
+            image.thumbnail(
+                (settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION),
+                Image.Resampling.LANCZOS
+            )
+            pixels_changed = True
+
+        output = io.BytesIO()
+        # EXIF and ICC blocks are not carried over
+        save_kwargs = {"optimize": True, "exif": b"", "icc_profile": None}
+        if save_format == 'JPEG':
+            if pixels_changed:
+                save_kwargs["quality"] = settings.IMAGE_JPEG_QUALITY
+            else:
+                # Reuse the source quantization tables so pixels are not degraded further
+                save_kwargs["quality"] = "keep"
+                save_kwargs["subsampling"] = "keep"
+            save_kwargs["progressive"] = True
+        image.save(output, format=save_format, **save_kwargs)
+
+        optimized_data = output.getvalue()
+        if not pixels_changed and len(optimized_data) >= len(image_data):
+            return None
+        return optimized_data
+
+    except Exception as e:
+        logger.warning(f"Skipping optimization of uploaded image: {e}")
+        return None
+
 # Thumbnail CRUD functions
 def get_thumbnail(
     db: Session, 
@@ -113,13 +480,34 @@ def get_thumbnail(
     quality: int = 80
 ) -> Optional[models.Thumbnail]:
     """Get existing thumbnail or return None"""
-    return db.query(models.Thumbnail).filter(
-        models.Thumbnail.original_file_id == file_id,
-        models.Thumbnail.width == width,
-        models.Thumbnail.height == height,
-        models.Thumbnail.format == format,
-        models.Thumbnail.quality == quality
-    ).first()
+    with stage_timer("db_lookup"):
+        return db.query(models.Thumbnail).filter(
+            models.Thumbnail.original_file_id == file_id,
+            models.Thumbnail.width == width,
+            models.Thumbnail.height == height,
+            models.Thumbnail.format == format,
+            models.Thumbnail.quality == quality
+        ).first()
+
+def find_nearest_thumbnail(db: Session, file_id: int, width: int, height: int, format: str = "webp") -> Optional[models.Thumbnail]:
+    """
+    Closest stored variant of a file to a requested size, used when a render is
+    shed under load: the same format first, then the smallest variant at least as
+    wide (the browser scales it down), else the widest smaller one.
+    """
+    thumbnails = db.query(models.Thumbnail).filter(models.Thumbnail.original_file_id == file_id).all()
+    if not thumbnails:
+        return None
+
+    def rank(thumbnail):
+        larger = thumbnail.width >= width
+        return (
+            thumbnail.format != format,
+            not larger,
+            thumbnail.width - width if larger else width - thumbnail.width,
+            abs(thumbnail.height - height)
+        )
+    return min(thumbnails, key=rank)
 
 def create_thumbnail(db: Session, thumbnail_data: schemas.ThumbnailCreate) -> models.Thumbnail:
     """Create new thumbnail record in database"""
@@ -129,73 +517,112 @@ def create_thumbnail(db: Session, thumbnail_data: schemas.ThumbnailCreate) -> mo
     db.refresh(db_thumbnail)
     return db_thumbnail
 
+def upsert_thumbnail(db: Session, thumbnail_data: schemas.ThumbnailCreate) -> models.Thumbnail:
+    """Create the thumbnail record, or point an existing one at the re-rendered object"""
+    existing_thumbnail = get_thumbnail(
+        db,
+        thumbnail_data.original_file_id,
+        thumbnail_data.width,
+        thumbnail_data.height,
+        thumbnail_data.format,
+        thumbnail_data.quality
+    )
+    if existing_thumbnail is None:
+        return create_thumbnail(db, thumbnail_data)
+    
+    existing_thumbnail.file_url = thumbnail_data.file_url
+    existing_thumbnail.storage_backend = thumbnail_data.storage_backend
+    existing_thumbnail.object_key = thumbnail_data.object_key
+    existing_thumbnail.file_size = thumbnail_data.file_size
+    existing_thumbnail.lossless = thumbnail_data.lossless
+    db.commit()
+    db.refresh(existing_thumbnail)
+    return existing_thumbnail
+
 def update_thumbnail_access(db: Session, thumbnail: models.Thumbnail):
     """Update last accessed time and access count"""
     thumbnail.last_accessed = datetime.utcnow()
     thumbnail.access_count += 1
-    db.commit()
+    with stage_timer("db_commit"):
+        db.commit()
+
+def is_lossless_format(format: str) -> bool:
+    """Whether every encoder profile writes this format without losing pixels"""
+    return format.lower() == "png"
 
-def resize_image(image_data: bytes, width: int, height: int, format: str = "webp", quality: int = 80) -> bytes:
-    """Resize image using Pillow"""
+def resize_image_bytes(
+    image_data,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80,
+    profile: Optional[str] = None
+) -> bytes:
+    """
+    Resize image with the configured image engine (IMAGE_ENGINE).
+    Raises plain exceptions so it can run inside the render process pool.
+    """
+    return engines.get_image_engine().resize(image_data, width, height, format, quality, profile)
+
+def resize_image(
+    image_data,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80,
+    profile: Optional[str] = None
+) -> bytes:
+    """Resize image with the configured image engine"""
     try:
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert RGBA to RGB if saving as JPEG
-        if format.lower() in ['jpg', 'jpeg'] and image.mode in ('RGBA', 'LA', 'P'):
-            # Create white background
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        
-        # Resize image maintaining aspect ratio
-        image.thumbnail((width, height), Image.Resampling.LANCZOS)
-        
-        # Save to bytes
-        output = io.BytesIO()
-        save_format = 'JPEG' if format.lower() in ['jpg', 'jpeg'] else format.upper()
-        
-        if save_format == 'JPEG':
-            image.save(output, format=save_format, quality=quality, optimize=True)
-        elif save_format == 'WEBP':
-            image.save(output, format=save_format, quality=quality, optimize=True)
-        else:
-            image.save(output, format=save_format, optimize=True)
-        
-        return output.getvalue()
-    
+        return resize_image_bytes(image_data, width, height, format, quality, profile)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to resize image: {str(e)}"
         )
 
-def upload_thumbnail_to_s3(s3_storage, thumbnail_data: bytes, file_id: int, width: int, height: int, format: str = "webp") -> str:
-    """Upload thumbnail to S3 and return URL"""
+THUMBNAIL_CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+def thumbnail_content_type(format: str) -> str:
+    return THUMBNAIL_CONTENT_TYPES.get(format.lower(), 'image/webp')
+
+def thumbnail_object_key(file_id: int, width: int, height: int, format: str, quality: int, thumbnail_data: bytes) -> str:
+    """
+    Object key a rendered thumbnail is stored under. It includes the quality and a
+    hash of the encoded bytes, so an object never changes once written and can be
+    cached forever; a new source or encoder setting produces a new key.
+    """
+    digest = hashlib.sha256(thumbnail_data).hexdigest()[:16]
+    return f"thumbnails/{file_id}/{width}x{height}_q{quality}_{digest}.{format}"
+
+def upload_thumbnail_to_s3(
+    s3_storage,
+    thumbnail_data: bytes,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80
+) -> tuple:
+    """Upload thumbnail to S3; returns (URL, object key)"""
     try:
         # Generate thumbnail filename
-        thumbnail_filename = f"thumbnails/{file_id}_{width}x{height}.{format}"
-        
-        # Create file-like object from bytes
-        thumbnail_file = io.BytesIO(thumbnail_data)
-        thumbnail_file.name = thumbnail_filename
+        thumbnail_filename = thumbnail_object_key(file_id, width, height, format, quality, thumbnail_data)
         
         # Set content type
-        content_type_map = {
-            'webp': 'image/webp',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png'
-        }
-        content_type = content_type_map.get(format.lower(), 'image/webp')
+        content_type = thumbnail_content_type(format)
         
         # Upload to S3
         file_url = s3_storage.upload_file_from_bytes(
             file_data=thumbnail_data,
             filename=thumbnail_filename,
-            content_type=content_type
+            content_type=content_type,
+            cache_control=settings.IMMUTABLE_CACHE_CONTROL
         )
         
         if not file_url:
@@ -204,7 +631,7 @@ def upload_thumbnail_to_s3(s3_storage, thumbnail_data: bytes, file_id: int, widt
                 detail="Failed to upload thumbnail to S3"
             )
         
-        return file_url
+        return file_url, thumbnail_filename
     
     except Exception as e:
         raise HTTPException(
@@ -212,25 +639,8 @@ def upload_thumbnail_to_s3(s3_storage, thumbnail_data: bytes, file_id: int, widt
             detail=f"Failed to upload thumbnail: {str(e)}"
         )
 
-def get_or_create_thumbnail(
-    db: Session,
-    s3_storage,
-    file_id: int,
-    width: int,
-    height: int,
-    format: str = "webp",
-    quality: int = 80
-) -> models.Thumbnail:
-    """Main function: get existing thumbnail or create new one"""
-    
-    # Step 1: Check if thumbnail already exists
-    existing_thumbnail = get_thumbnail(db, file_id, width, height, format, quality)
-    if existing_thumbnail:
-        # Update access stats
-        update_thumbnail_access(db, existing_thumbnail)
-        return existing_thumbnail
-    
-    # Step 2: Get original file
+def get_image_file(db: Session, file_id: int) -> models.File:
+    """Original a thumbnail can be rendered from, or the HTTP error explaining why not"""
     original_file = get_file(db, file_id)
     if not original_file:
         raise HTTPException(
@@ -238,17 +648,25 @@ def get_or_create_thumbnail(
             detail="Original file not found"
         )
     
-    # Step 3: Check if original file is an image
+    # Check if original file is an image
     if not original_file.content_type or not original_file.content_type.startswith('image/'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File is not an image"
         )
+    return original_file
+
+def load_thumbnail_source(db: Session, s3_storage, file_id: int):
+    """Temporary file holding the original image a thumbnail is rendered from; the caller closes it"""
+    return _open_original(db, s3_storage, get_image_file(db, file_id))
+
+def _open_original(db: Session, s3_storage, original_file: models.File):
+    record_file_access(db, s3_storage, original_file)
     
-    # Step 4: Download original image from S3
+    # Download original image from S3
     try:
-        original_image_data = s3_storage.download_file_as_bytes(original_file.file_url)
-        if not original_image_data:
+        original_image = s3_storage.open_object(get_object_key(s3_storage, original_file))
+        if not original_image:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to download original image"
@@ -258,14 +676,158 @@ def get_or_create_thumbnail(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to download original image: {str(e)}"
         )
+    return original_image
+
+def find_derivable_thumbnail(
+    db: Session,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80
+) -> Optional[models.Thumbnail]:
+    """
+    Smallest stored variant at least THUMBNAIL_DERIVE_MIN_RATIO times the requested
+    box on both edges, in the same format at no lower quality, or recorded as
+    lossless (rows from before that flag, e.g. quantized PNG, never qualify)
+    """
+    ratio = settings.THUMBNAIL_DERIVE_MIN_RATIO
+    return db.query(models.Thumbnail).filter(
+        models.Thumbnail.original_file_id == file_id,
+        models.Thumbnail.width >= math.ceil(width * ratio),
+        models.Thumbnail.height >= math.ceil(height * ratio),
+        or_(
+            (models.Thumbnail.format == format) & (models.Thumbnail.quality >= quality),
+            models.Thumbnail.lossless.is_(True)
+        )
+    ).order_by(models.Thumbnail.width, models.Thumbnail.height).first()
+
+def mezzanine_covers(db_file: models.File, width: int, height: int) -> bool:
+    """
+    Whether the mezzanine master is worth using for a box: the original is larger
+    than the master, and the master is still THUMBNAIL_DERIVE_MIN_RATIO times the
+    thumbnail's size. Unknown source dimensions never qualify.
+    """
+    cap = settings.THUMBNAIL_MEZZANINE_MAX_DIMENSION
+    if not cap or not db_file.width or not db_file.height:
+        return False
+    if max(db_file.width, db_file.height) <= cap:
+        return False
+    master_scale = min(cap / db_file.width, cap / db_file.height)
+    thumbnail_scale = min(width / db_file.width, height / db_file.height, 1)
+    return master_scale >= settings.THUMBNAIL_DERIVE_MIN_RATIO * thumbnail_scale
+
+def mezzanine_object_key(file_id: int, version: int, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    return f"mezzanine/{file_id}/v{version}_{digest}.webp"
+
+def create_mezzanine(db: Session, s3_storage, db_file: models.File, original_image) -> bytes:
+    """
+    Downscale the original to the mezzanine master and store it. Returns the
+    master's bytes; if storing fails they are still usable for this render.
+    """
+    cap = settings.THUMBNAIL_MEZZANINE_MAX_DIMENSION
+    version = db_file.version or 1
+    data = resize_image(original_image, cap, cap, "webp", settings.THUMBNAIL_MEZZANINE_QUALITY, "fast")
+    object_key = mezzanine_object_key(db_file.id, version, data)
+    if not s3_storage.upload_file_from_bytes(data, object_key, content_type="image/webp"):
+        logger.warning(f"Failed to store mezzanine of file {db_file.id}")
+        return data
+
+    # Only the first master of the current version is recorded
+    updated = db.query(models.File).filter(
+        models.File.id == db_file.id,
+        models.File.version == version,
+        models.File.mezzanine_key.is_(None)
+    ).update({"mezzanine_key": object_key}, synchronize_session=False)
+    with stage_timer("db_commit"):
+        db.commit()
+    db.refresh(db_file)
+    if not updated and db_file.mezzanine_key != object_key:
+        s3_storage.delete_object(object_key)
+    return data
+
+def open_render_source(
+    db: Session,
+    s3_storage,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80
+) -> tuple:
+    """
+    (file object, kind) of the smallest stored image a variant can be rendered
+    from: a larger stored variant, the mezzanine master, or the original as a
+    last resort. kind is variant, mezzanine or original; the caller closes it.
+    Only reading the original counts as an access for storage tiering.
+    """
+    with stage_timer("db_lookup"):
+        original_file = get_image_file(db, file_id)
+        larger_variant = find_derivable_thumbnail(db, file_id, width, height, format, quality)
+    if larger_variant:
+        source = s3_storage.open_object(get_object_key(s3_storage, larger_variant))
+        if source:
+            return source, "variant"
+
+    if original_file.mezzanine_key and mezzanine_covers(original_file, width, height):
+        source = s3_storage.open_object(original_file.mezzanine_key)
+        if source:
+            return source, "mezzanine"
+
+    return _open_original(db, s3_storage, original_file), "original"
+
+def render_thumbnail(
+    db: Session,
+    s3_storage,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80
+) -> bytes:
+    """
+    Render a thumbnail variant without storing it. Small variants are derived
+    from a larger variant or the mezzanine master; the first small render that
+    has to read the original creates that master on the way.
+    """
+    source, kind = open_render_source(db, s3_storage, file_id, width, height, format, quality)
+    try:
+        original_file = get_file(db, file_id)
+        if kind == "original" and mezzanine_covers(original_file, width, height):
+            original_image = source
+            try:
+                source = io.BytesIO(create_mezzanine(db, s3_storage, original_file, original_image))
+            finally:
+                original_image.close()
+            kind = "mezzanine"
+        logger.debug(f"Rendering {width}x{height} {format} of file {file_id} from {kind}")
+        return resize_image(source, width, height, format, quality)
+    finally:
+        source.close()
+
+def store_thumbnail(
+    db: Session,
+    s3_storage,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str,
+    quality: int,
+    thumbnail_data: bytes,
+    source_version: Optional[int] = None
+) -> Optional[models.Thumbnail]:
+    """
+    Upload a rendered thumbnail and save its record (first access included).
+    With source_version, nothing is stored if the content was replaced since the render.
+    """
+    if source_version is not None:
+        original_file = get_file(db, file_id)
+        if original_file is None or (original_file.version or 1) != source_version:
+            logger.info(f"Skipping thumbnail {width}x{height} of file {file_id}: source changed while rendering")
+            return None
+    thumbnail_url, object_key = upload_thumbnail_to_s3(s3_storage, thumbnail_data, file_id, width, height, format, quality)
     
-    # Step 5: Resize image
-    thumbnail_data = resize_image(original_image_data, width, height, format, quality)
-    
-    # Step 6: Upload thumbnail to S3
-    thumbnail_url = upload_thumbnail_to_s3(s3_storage, thumbnail_data, file_id, width, height, format)
-    
-    # Step 7: Save thumbnail record to database
     thumbnail_create = schemas.ThumbnailCreate(
         original_file_id=file_id,
         width=width,
@@ -273,32 +835,323 @@ def get_or_create_thumbnail(
         quality=quality,
         format=format,
         file_url=thumbnail_url,
-        file_size=len(thumbnail_data)
+        storage_backend="s3",
+        object_key=object_key,
+        file_size=len(thumbnail_data),
+        lossless=is_lossless_format(format)
     )
+    db_thumbnail = models.Thumbnail(
+        **thumbnail_create.dict(),
+        last_accessed=datetime.utcnow(),
+        access_count=1
+    )
+    db.add(db_thumbnail)
+    try:
+        with stage_timer("db_commit"):
+            db.commit()
+    except IntegrityError:
+        # Another worker stored the same variant first; the object key is identical
+        db.rollback()
+        existing = get_thumbnail(db, file_id, width, height, format, quality)
+        if existing:
+            update_thumbnail_access(db, existing)
+            return existing
+        raise
+    db.refresh(db_thumbnail)
+    return db_thumbnail
+
+def _same_aspect(a: models.File, b: models.File) -> bool:
+    if not a.width or not a.height or not b.width or not b.height:
+        return False
+    return abs(a.width * b.height - a.height * b.width) <= 0.01 * a.width * b.height
+
+def reuse_near_duplicate_thumbnail(
+    db: Session,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80
+) -> Optional[models.Thumbnail]:
+    """
+    Point a missing variant at the same variant of a near-identical file instead
+    of rendering it. Only files with the same aspect ratio qualify, so the shared
+    thumbnail has the size this file would have produced.
+    """
+    if not settings.THUMBNAIL_REUSE_NEAR_DUPLICATES:
+        return None
+    db_file = get_file(db, file_id)
+    if not db_file or not db_file.phash:
+        return None
+
+    with stage_timer("reuse_lookup"):
+        candidates = find_near_duplicates(db, db_file, settings.THUMBNAIL_REUSE_MAX_DISTANCE)
+    for candidate, _ in candidates:
+        if not _same_aspect(db_file, candidate):
+            continue
+        source = get_thumbnail(db, candidate.id, width, height, format, quality)
+        if not source:
+            continue
+        db_thumbnail = models.Thumbnail(
+            original_file_id=file_id,
+            width=width,
+            height=height,
+            quality=quality,
+            format=format,
+            file_url=source.file_url,
+            storage_backend=source.storage_backend,
+            object_key=source.object_key,
+            file_size=source.file_size,
+            lossless=source.lossless,
+            last_accessed=datetime.utcnow(),
+            access_count=1
+        )
+        db.add(db_thumbnail)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return get_thumbnail(db, file_id, width, height, format, quality)
+        db.refresh(db_thumbnail)
+        logger.info(f"Thumbnail {width}x{height} {format} of file {file_id} reused from file {candidate.id}")
+        return db_thumbnail
+    return None
+
+def get_or_create_thumbnail(
+    db: Session,
+    s3_storage,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80,
+    client: Optional[str] = None
+) -> models.Thumbnail:
+    """
+    Main function: get existing thumbnail or create new one.
+    Renders for a client go through admission control and may raise RenderRejected.
+    """
     
-    db_thumbnail = create_thumbnail(db, thumbnail_create)
+    existing_thumbnail = get_thumbnail(db, file_id, width, height, format, quality)
+    if existing_thumbnail:
+        metrics.set_labels(cache="hit")
+        # Update access stats
+        update_thumbnail_access(db, existing_thumbnail)
+        return existing_thumbnail
     
-    # Update access stats for new thumbnail
-    update_thumbnail_access(db, db_thumbnail)
+    reused_thumbnail = reuse_near_duplicate_thumbnail(db, file_id, width, height, format, quality)
+    if reused_thumbnail:
+        metrics.set_labels(cache="reuse")
+        return reused_thumbnail
     
-    return db_thumbnail
+    metrics.set_labels(cache="miss")
+    thumbnail_data = admit_render(
+        client,
+        lambda: render_thumbnail(db, s3_storage, file_id, width, height, format, quality)
+    )
+    return store_thumbnail(db, s3_storage, file_id, width, height, format, quality, thumbnail_data)
+
+def get_responsive_sizes(source_width: Optional[int], source_height: Optional[int]) -> list:
+    """
+    (request_width, request_height, output_width, output_height) for each srcset variant.
+    Variants never upscale the source. The output size is what the render of the
+    (clamped) request box really produces, so for tall sources the height limit
+    can bind; widths that collapse to an already listed output are dropped.
+    """
+    widths = sorted(set(settings.THUMBNAIL_SRCSET_WIDTHS))
+    if not source_width or not source_height:
+        # Unknown aspect ratio (legacy rows): fall back to square boxes
+        return [(w, w, w, w) for w in widths]
+
+    # Offer the full source width too when it falls inside the configured range
+    if 50 <= source_width <= widths[-1] and source_width not in widths:
+        widths = sorted(widths + [source_width])
+
+    sizes = []
+    outputs = set()
+    for width in widths:
+        if width > source_width:
+            break
+        request_height = min(2000, max(50, math.ceil(width * source_height / source_width)))
+        output = engines.thumbnail_size((source_width, source_height), width, request_height) or (source_width, source_height)
+        if output in outputs:
+            continue
+        outputs.add(output)
+        sizes.append((width, request_height) + output)
+    return sizes
+
+def generate_thumbnail_urls_for_file(db_file: models.File, base_url: Optional[str] = None) -> list:
+    """Generate responsive thumbnail URLs sized from the stored source dimensions"""
+    if base_url is None:
+        base_url = settings.THUMBNAIL_CDN_BASE_URL or settings.PUBLIC_BASE_URL
+    base_url = base_url.rstrip('/')
 
-def generate_thumbnail_urls_for_file(file_id: int, base_url: str = "http://localhost:8000") -> list:
-    """Generate thumbnail URLs for common sizes"""
-    common_sizes = [
-        (150, 150),   # Small thumbnail
-        (300, 300),   # Medium thumbnail  
-        (600, 600),   # Large thumbnail
-        (800, 600),   # Landscape
-    ]
-    
     thumbnail_urls = []
-    for width, height in common_sizes:
-        thumbnail_url = f"{base_url}/v1/files/thumbnail/{file_id}?w={width}&h={height}"
+    for request_width, request_height, width, height in get_responsive_sizes(db_file.width, db_file.height):
+        thumbnail_url = (
+            f"{base_url}{settings.API_V1_STR}/files/thumbnail/{db_file.id}"
+            f"?w={request_width}&h={request_height}&v={db_file.version or 1}"
+        )
         thumbnail_urls.append({
             "width": width,
             "height": height,
             "url": thumbnail_url
         })
     
-    return thumbnail_urls 
\ No newline at end of file
+    return thumbnail_urls
+
+def build_srcset(thumbnail_urls: list) -> str:
+    """Format thumbnail URLs as an HTML srcset with width descriptors"""
+    return ", ".join(f"{thumbnail['url']} {thumbnail['width']}w" for thumbnail in thumbnail_urls)
+
+# Sprite sheet functions
+def _sprite_cache_key(file_ids: list, preset: str) -> str:
+    return hashlib.sha256(f"{preset}:{','.join(map(str, file_ids))}".encode()).hexdigest()
+
+def _sprite_source_signature(files: list) -> str:
+    members = "|".join(f"{f.id}:{f.object_key or f.file_url}:{f.size}" for f in files)
+    return hashlib.sha256(members.encode()).hexdigest()
+
+def _load_sprite_tile(s3_storage, file: models.File, tile_size: int) -> Optional[Image.Image]:
+    """Download one member and shrink it to fit the tile"""
+    source = s3_storage.open_object(get_object_key(s3_storage, file))
+    if not source:
+        return None
+    try:
+        image = Image.open(source)
+        # Let the JPEG decoder skip straight to a reduced scale
+        image.draft("RGB", (tile_size, tile_size))
+        image = image.convert("RGBA")
+        image.thumbnail((tile_size, tile_size), Image.Resampling.LANCZOS)
+        return image
+    except Exception as e:
+        logger.warning(f"Failed to decode file {file.id} for sprite sheet: {e}")
+        return None
+    finally:
+        source.close()
+
+def build_sprite_sheet(s3_storage, files: list, tile_size: int):
+    """Render members into a grid; returns (sheet bytes, width, height, coordinates)"""
+    with ThreadPoolExecutor(max_workers=settings.SPRITE_DOWNLOAD_CONCURRENCY) as executor:
+        tiles = list(executor.map(lambda f: _load_sprite_tile(s3_storage, f, tile_size), files))
+
+    placed = [(f, tile) for f, tile in zip(files, tiles) if tile is not None]
+    columns = max(1, math.ceil(math.sqrt(len(placed))))
+    rows = max(1, math.ceil(len(placed) / columns))
+    sheet = Image.new("RGBA", (columns * tile_size, rows * tile_size), (0, 0, 0, 0))
+
+    coordinates = []
+    for index, (file, tile) in enumerate(placed):
+        # Center each image inside its cell
+        x = (index % columns) * tile_size + (tile_size - tile.width) // 2
+        y = (index // columns) * tile_size + (tile_size - tile.height) // 2
+        sheet.paste(tile, (x, y))
+        coordinates.append({"file_id": file.id, "x": x, "y": y, "width": tile.width, "height": tile.height})
+
+    output = io.BytesIO()
+    sheet.save(output, format="WEBP", quality=80, **engines.ENCODER_PROFILES[engines.encoder_profile("sprite")]["WEBP"])
+    return output.getvalue(), sheet.width, sheet.height, coordinates
+
+def get_or_create_sprite(
+    db: Session,
+    s3_storage,
+    file_ids: list,
+    preset: str,
+    client: Optional[str] = None
+) -> models.ThumbnailSprite:
+    """
+    Return the cached sprite sheet for the id set, rebuilding it when a member
+    changed. Builds run under render admission control (client None bypasses
+    it) and raise RenderRejected when shed; a rebuilt sheet replaces the old object.
+    """
+    tile_size = SPRITE_PRESETS[preset]
+    file_ids = sorted(set(file_ids))
+    cache_key = _sprite_cache_key(file_ids, preset)
+
+    files = db.query(models.File).filter(
+        models.File.id.in_(file_ids),
+        models.File.content_type.ilike("image%")
+    ).order_by(models.File.id).all()
+    if not files:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No image files found"
+        )
+    signature = _sprite_source_signature(files)
+
+    sprite = db.query(models.ThumbnailSprite).filter(models.ThumbnailSprite.cache_key == cache_key).first()
+    if sprite and sprite.source_signature == signature:
+        # LRU order only needs coarse timestamps, so most hits do not write
+        if sprite.last_accessed is None or datetime.utcnow() - sprite.last_accessed > SPRITE_ACCESS_RESOLUTION:
+            sprite.last_accessed = datetime.utcnow()
+            db.commit()
+        return sprite
+
+    sheet_data, width, height, coordinates = admit_render(
+        client, lambda: build_sprite_sheet(s3_storage, files, tile_size)
+    )
+    sheet_key = f"sprites/{cache_key}_{signature[:12]}.webp"
+    sheet_url = s3_storage.upload_file_from_bytes(
+        file_data=sheet_data,
+        filename=sheet_key,
+        content_type="image/webp",
+        cache_control=settings.IMMUTABLE_CACHE_CONTROL
+    )
+    if not sheet_url:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to upload sprite sheet"
+        )
+
+    superseded_key = None
+    is_new = sprite is None
+    if is_new:
+        sprite = models.ThumbnailSprite(cache_key=cache_key, preset=preset)
+        db.add(sprite)
+    elif sprite.object_key != sheet_key:
+        superseded_key = sprite.object_key
+    sprite.file_ids = ",".join(map(str, file_ids))
+    sprite.source_signature = signature
+    sprite.file_url = sheet_url
+    sprite.storage_backend = "s3"
+    sprite.object_key = sheet_key
+    sprite.file_size = len(sheet_data)
+    sprite.width = width
+    sprite.height = height
+    sprite.tile_size = tile_size
+    sprite.coordinates = coordinates
+    sprite.last_accessed = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request built the same sheet first
+        db.rollback()
+        return db.query(models.ThumbnailSprite).filter(models.ThumbnailSprite.cache_key == cache_key).first()
+    db.refresh(sprite)
+    if superseded_key:
+        s3_storage.delete_object(superseded_key)
+    if is_new:
+        evict_sprites(db, s3_storage, settings.SPRITE_CACHE_MAX_SHEETS)
+    return sprite
+
+def evict_sprites(db: Session, s3_storage, max_sheets: int) -> int:
+    """
+    Delete the least recently used sprite sheets (rows and objects) beyond
+    max_sheets. Any id combination can be requested publicly, so the cache
+    is bounded here. Returns the number evicted.
+    """
+    excess = db.query(func.count(models.ThumbnailSprite.id)).scalar() - max_sheets
+    if excess <= 0:
+        return 0
+    evicted = db.query(models.ThumbnailSprite.id, models.ThumbnailSprite.object_key).order_by(
+        models.ThumbnailSprite.last_accessed, models.ThumbnailSprite.id
+    ).limit(excess).all()
+    db.query(models.ThumbnailSprite).filter(
+        models.ThumbnailSprite.id.in_([sprite_id for sprite_id, _ in evicted])
+    ).delete(synchronize_session=False)
+    db.commit()
+    for _, object_key in evicted:
+        if object_key:
+            s3_storage.delete_object(object_key)
+    logger.info(f"Evicted {len(evicted)} least recently used sprite sheets")
+    return len(evicted)
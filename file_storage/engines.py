@@ -0,0 +1,228 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+import io
+import logging
+import math
+
+from PIL import Image
+
+from core.core.config import settings
+from core.core.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    # pyvips is missing, or installed without the libvips shared library
+    pyvips = None
+
+# Pillow save options per encoder profile and output format.
+# fast: lowest encode time, balanced: the long-standing defaults, smallest: fewest bytes
+ENCODER_PROFILES = {
+    "fast": {
+        "JPEG": {"optimize": False, "progressive": False},
+        "WEBP": {"method": 0},
+        "PNG": {"compress_level": 1},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True, "progressive": False},
+        "WEBP": {"method": 4},
+        "PNG": {"compress_level": 6},
+    },
+    "smallest": {
+        "JPEG": {"optimize": True, "progressive": True, "subsampling": "4:2:0"},
+        "WEBP": {"method": 6},
+        # Still lossless: PNG variants are bit-exact whichever profile rendered them
+        "PNG": {"compress_level": 9, "optimize": True},
+    },
+}
+
+def encoder_profile(use: str) -> str:
+    """Profile configured for a render path (on_demand, warmup, regenerate, sprite)"""
+    profile = settings.ENCODER_PROFILE_PRESETS.get(use, settings.THUMBNAIL_ENCODER_PROFILE)
+    if profile not in ENCODER_PROFILES:
+        logger.warning(f"Unknown encoder profile {profile!r} for {use}, using balanced")
+        return "balanced"
+    return profile
+
+def encode_thumbnail_image(image: Image.Image, format: str = "webp", quality: int = 80, profile: Optional[str] = None) -> bytes:
+    """Encode a prepared thumbnail with the options of an encoder profile"""
+    output = io.BytesIO()
+    save_format = 'JPEG' if format.lower() in ['jpg', 'jpeg'] else format.upper()
+    options = dict(ENCODER_PROFILES[profile or encoder_profile("on_demand")].get(save_format, {}))
+    
+    if save_format in ('JPEG', 'WEBP'):
+        options['quality'] = quality
+    
+    with stage_timer("encode"):
+        image.save(output, format=save_format, **options)
+    return output.getvalue()
+
+def prepare_thumbnail_image(image_data, width: int, height: int, format: str = "webp") -> Image.Image:
+    """
+    Decode and downscale to the thumbnail box, ready to encode. image_data is
+    bytes or a seekable file object, so spooled downloads are decoded without
+    being read into memory first.
+    """
+    source = image_data if hasattr(image_data, "read") else io.BytesIO(image_data)
+    image = Image.open(source)
+    
+    # Image.thumbnail, split so decode and resize are timed separately
+    target_size = thumbnail_size(image.size, width, height)
+    with stage_timer("decode"):
+        box = None
+        if target_size:
+            # Let the JPEG decoder downscale by DCT while decoding
+            draft = image.draft(None, (width * 2, height * 2))
+            if draft is not None:
+                box = draft[1]
+        image.load()
+    
+    is_jpeg = format.lower() in ['jpg', 'jpeg']
+    if is_jpeg and image.mode == 'P':
+        image = image.convert('RGBA')
+    
+    # Resize image maintaining aspect ratio
+    if target_size and image.size != target_size:
+        with stage_timer("resize"):
+            image = image.resize(target_size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+    
+    # Convert RGBA to RGB if saving as JPEG (after resizing, so the background is thumbnail sized)
+    if is_jpeg and image.mode in ('RGBA', 'LA'):
+        # Create white background
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    return image
+
+def thumbnail_size(size: tuple, width: int, height: int) -> Optional[tuple]:
+    """Output size of Image.thumbnail for a box, None when the image already fits"""
+    source_width, source_height = size
+    if width >= source_width and height >= source_height:
+        return None
+    aspect = source_width / source_height
+    if width / height >= aspect:
+        exact = height * aspect
+        width = max(min(math.floor(exact), math.ceil(exact), key=lambda n: abs(aspect - n / height)), 1)
+    else:
+        exact = width / aspect
+        height = max(min(math.floor(exact), math.ceil(exact), key=lambda n: 0 if n == 0 else abs(aspect - width / n)), 1)
+    return width, height
+
+class ImageEngine(ABC):
+    """
+    Decodes, fits and encodes one thumbnail. Every engine follows the same rules:
+    fit inside width x height without upscaling, keep the aspect ratio, flatten
+    transparency onto white for JPEG, and apply the quality and encoder profile.
+    """
+    name = None
+
+    @abstractmethod
+    def resize(
+        self,
+        image_data,
+        width: int,
+        height: int,
+        format: str = "webp",
+        quality: int = 80,
+        profile: Optional[str] = None
+    ) -> bytes:
+        """Thumbnail of image_data (bytes or a seekable file object), encoded"""
+
+class PillowEngine(ImageEngine):
+    """Pillow: decodes the whole original, single threaded"""
+    name = "pillow"
+
+    def resize(self, image_data, width, height, format="webp", quality=80, profile=None) -> bytes:
+        image = prepare_thumbnail_image(image_data, width, height, format)
+        return encode_thumbnail_image(image, format, quality, profile)
+
+class VipsEngine(ImageEngine):
+    """
+    libvips: shrinks on load and streams the rest of the pipeline, so large
+    originals need a fraction of the memory and time Pillow does.
+    """
+    name = "vips"
+
+    def _load(self, image_data, width: int, height: int) -> tuple:
+        """
+        (image, source). The pipeline is lazy, so a custom source must stay
+        referenced until the thumbnail has been encoded.
+        """
+        # size="down" never upscales; no_rotate matches Pillow, which ignores EXIF orientation here
+        options = {"height": height, "size": "down", "no_rotate": True}
+        if not hasattr(image_data, "read"):
+            return pyvips.Image.thumbnail_buffer(image_data, width, **options), None
+
+        # Stream spooled downloads through libvips instead of reading them into memory
+        image_data.seek(0)
+        source = pyvips.SourceCustom()
+        source.on_read(image_data.read)
+        source.on_seek(image_data.seek)
+        return pyvips.Image.thumbnail_source(source, width, **options), source
+
+    def _save_options(self, save_format: str, quality: int, profile: Optional[str]) -> dict:
+        """Translate the Pillow profile options into libvips save options"""
+        options = ENCODER_PROFILES[profile or encoder_profile("on_demand")].get(save_format, {})
+        # Pillow does not copy metadata into thumbnails either
+        vips_options = {"strip": True}
+        if save_format == 'JPEG':
+            vips_options.update(
+                Q=quality,
+                optimize_coding=options.get("optimize", False),
+                interlace=options.get("progressive", False),
+                # Pillow subsamples chroma to 4:2:0 by default
+                subsample_mode="on"
+            )
+        elif save_format == 'WEBP':
+            vips_options.update(Q=quality, effort=options.get("method", 4))
+        elif save_format == 'PNG':
+            vips_options.update(compression=options.get("compress_level", 6))
+        return vips_options
+
+    def resize(self, image_data, width, height, format="webp", quality=80, profile=None) -> bytes:
+        # The pipeline is lazy: "decode" only reads the header, the pixel work is timed as "encode"
+        with stage_timer("decode"):
+            image, source = self._load(image_data, width, height)
+        save_format = 'JPEG' if format.lower() in ['jpg', 'jpeg'] else format.upper()
+
+        if image.interpretation not in ("srgb", "b-w"):
+            image = image.colourspace("srgb")
+        if save_format == 'JPEG' and image.hasalpha():
+            # White background, like the Pillow path
+            image = image.flatten(background=[255] * (image.bands - 1))
+
+        suffix = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}.get(save_format, '.webp')
+        # source (if any) is still referenced here, while the pipeline actually runs
+        with stage_timer("encode"):
+            return image.write_to_buffer(suffix, **self._save_options(save_format, quality, profile))
+
+ENGINES = {
+    PillowEngine.name: PillowEngine,
+    VipsEngine.name: VipsEngine,
+}
+
+_engines = {}
+
+def available_engines() -> list:
+    return [name for name in ENGINES if name != VipsEngine.name or pyvips is not None]
+
+def get_image_engine(name: Optional[str] = None) -> ImageEngine:
+    """
+    Engine configured by IMAGE_ENGINE (or name). Falls back to Pillow when the
+    engine is unknown or its library is not installed, so a missing libvips never
+    takes thumbnails down.
+    """
+    name = (name or settings.IMAGE_ENGINE).lower()
+    if name not in _engines:
+        if name not in ENGINES:
+            logger.warning(f"Unknown image engine {name!r}, using pillow")
+            engine = PillowEngine()
+        elif name not in available_engines():
+            logger.warning(f"Image engine {name!r} is not installed, using pillow")
+            engine = PillowEngine()
+        else:
+            engine = ENGINES[name]()
+        _engines[name] = engine
+    return _engines[name]
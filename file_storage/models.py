@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, UniqueConstraint, Index, Text, JSON, BigInteger, Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.core.database import Base
+from core.core.storage import build_object_url
 
 class File(Base):
     __tablename__ = "files"
@@ -9,17 +10,41 @@ class File(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String(255), index=True)
     file_url = Column(String(512), nullable=False)
+    storage_backend = Column(String(20), default="s3", nullable=False)
+    object_key = Column(String(512), nullable=True)
     content_type = Column(String(100))
     file_extension = Column(String(20), index=True)
     size = Column(Float, comment="File size in bytes") # Using Float for size in bytes
+    archive_key = Column(String(512), nullable=True, comment="Object key of the untouched original when the upload was optimized")
+    width = Column(Integer, nullable=True, comment="Source image width in pixels")
+    height = Column(Integer, nullable=True, comment="Source image height in pixels")
+    phash = Column(String(16), nullable=True, index=True, comment="64-bit dHash (hex) of image content")
+    mezzanine_key = Column(String(512), nullable=True, comment="Downscaled master small thumbnails are rendered from")
+    # Bumped whenever the content is replaced; part of every generated thumbnail URL
+    version = Column(Integer, default=1, nullable=False)
+    uploaded_by = Column(Integer, nullable=True, index=True, comment="User who uploaded the file (NULL for public uploads)")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Access tracking for storage tiering (downloads and thumbnail renders)
+    last_accessed = Column(DateTime)
+    access_count = Column(Integer, default=0)
+    storage_tier = Column(String(10), default="hot", nullable=False, comment="hot or cold")
+
     # Relationship
     thumbnails = relationship("Thumbnail", back_populates="original_file", cascade="all, delete-orphan")
 
+    # Indexes
+    __table_args__ = (
+        Index('idx_files_tiering', 'storage_tier', 'last_accessed'),
+    )
+
     @property
     def download_url(self):
-        return self.file_url
+        return build_object_url(self.storage_backend, self.object_key, self.file_url)
+
+    @property
+    def url(self):
+        return self.download_url
 
 class Thumbnail(Base):
     __tablename__ = "thumbnails"
@@ -35,7 +60,11 @@ class Thumbnail(Base):
     
     # Generated file info
     file_url = Column(String(512), nullable=False)
+    storage_backend = Column(String(20), default="s3", nullable=False)
+    object_key = Column(String(512), nullable=True)
     file_size = Column(Float)
+    # Only lossless variants are used as sources for smaller ones in other formats
+    lossless = Column(Boolean, default=False, nullable=False, comment="Pixels are exact (PNG without quantization)")
     
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -50,4 +79,74 @@ class Thumbnail(Base):
         UniqueConstraint('original_file_id', 'width', 'height', 'format', 'quality', 
                         name='unique_thumbnail'),
         Index('idx_thumbnail_lookup', 'original_file_id', 'width', 'height', 'format', 'quality'),
-    ) 
\ No newline at end of file
+    )
+
+    @property
+    def url(self):
+        return build_object_url(self.storage_backend, self.object_key, self.file_url)
+
+class ThumbnailQuality(Base):
+    """Encoder quality picked by q=auto for one file, size and format"""
+    __tablename__ = "thumbnail_qualities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    format = Column(String(10), nullable=False)
+    quality = Column(Integer, nullable=False)
+    score = Column(Float, comment="SSIM of the chosen quality against the lossless resize")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('file_id', 'width', 'height', 'format', name='unique_thumbnail_quality'),
+    )
+
+class ThumbnailSprite(Base):
+    __tablename__ = "thumbnail_sprites"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha256 of the preset and the sorted member ids
+    cache_key = Column(String(64), nullable=False, unique=True)
+    preset = Column(String(10), nullable=False)
+    file_ids = Column(Text, nullable=False, comment="Comma separated member file ids")
+    # Changes whenever a member file is replaced or removed, forcing a rebuild
+    source_signature = Column(String(64), nullable=False)
+
+    # Generated sheet info
+    file_url = Column(String(512), nullable=False)
+    storage_backend = Column(String(20), default="s3", nullable=False)
+    object_key = Column(String(512), nullable=True)
+    file_size = Column(Float)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    tile_size = Column(Integer, nullable=False)
+    coordinates = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Least recently used sheets are evicted beyond SPRITE_CACHE_MAX_SHEETS
+    last_accessed = Column(DateTime, index=True)
+
+    @property
+    def url(self):
+        return build_object_url(self.storage_backend, self.object_key, self.file_url)
+
+class ThumbnailJob(Base):
+    """Checkpoint of a bulk thumbnail regeneration run"""
+    __tablename__ = "thumbnail_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="running", comment="running, completed")
+
+    # Progress; files are processed in id order so last_file_id is the resume point
+    last_file_id = Column(Integer, nullable=False, default=0)
+    total_files = Column(Integer, default=0)
+    processed_files = Column(Integer, default=0)
+    rendered_variants = Column(BigInteger, default=0)
+    failed_variants = Column(BigInteger, default=0)
+
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime)
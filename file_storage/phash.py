@@ -0,0 +1,113 @@
+from sqlalchemy.orm import Session
+from PIL import Image, ImageOps
+from typing import Optional
+import numpy as np
+import threading
+import logging
+import time
+
+from core.core.config import settings
+from . import models
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+
+def dhash(file_obj) -> Optional[str]:
+    """
+    64-bit difference hash of an image as 16 hex chars; None if it cannot be decoded.
+    Robust to re-compression and resizing, so re-uploads of the same photo land
+    within a few bits of each other.
+    """
+    try:
+        file_obj.seek(0)
+        with Image.open(file_obj) as image:
+            # Let the JPEG decoder skip straight to a tiny scale
+            image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+            image = ImageOps.exif_transpose(image).convert("L")
+            image = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+        file_obj.seek(0)
+        pixels = np.asarray(image, dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+        value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+        return f"{value:016x}"
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash: {e}")
+        return None
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries"""
+    def __init__(self):
+        # Node: (hash, [items], {distance: child})
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> list:
+        """(item, distance) for every hash within radius"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                results.extend((item, distance) for item in items)
+            # Triangle inequality: only subtrees in [distance - radius, distance + radius] can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return results
+
+class PhashIndex:
+    """
+    Process-wide BK-tree of files.phash. New files are picked up incrementally by
+    id; the tree is rebuilt every PHASH_INDEX_REBUILD_INTERVAL seconds so backfilled,
+    replaced and deleted files are reflected too.
+    """
+    def __init__(self):
+        self.tree = BKTree()
+        self.last_file_id = 0
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self, db: Session):
+        with self.lock:
+            if time.monotonic() - self.built_at > settings.PHASH_INDEX_REBUILD_INTERVAL:
+                self.tree = BKTree()
+                self.last_file_id = 0
+                self.built_at = time.monotonic()
+            rows = db.query(models.File.id, models.File.phash).filter(
+                models.File.id > self.last_file_id,
+                models.File.phash.isnot(None)
+            ).order_by(models.File.id).all()
+            for file_id, value in rows:
+                self.tree.add(int(value, 16), file_id)
+            if rows:
+                self.last_file_id = rows[-1][0]
+
+    def search(self, db: Session, value: str, radius: int) -> list:
+        """(file_id, distance) of indexed files within radius; may include stale entries"""
+        self.refresh(db)
+        with self.lock:
+            return self.tree.search(int(value, 16), radius)
+
+phash_index = PhashIndex()
@@ -0,0 +1,124 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from PIL import Image
+import numpy as np
+import io
+import logging
+
+from typing import Optional
+
+from core.core.config import settings
+from . import crud, engines, models
+from .admission import admit_render
+
+logger = logging.getLogger(__name__)
+
+# Formats where the encoder quality changes the output
+LOSSY_FORMATS = {"webp", "jpg", "jpeg"}
+# PNG ignores quality; this only keeps its variant key stable
+LOSSLESS_QUALITY = 80
+
+SSIM_WINDOW = 8
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+def _luma(image: Image.Image) -> np.ndarray:
+    return np.asarray(image.convert("RGB").convert("L"), dtype=np.float64)
+
+def _box_mean(a: np.ndarray, k: int) -> np.ndarray:
+    """Mean over every k x k window, via an integral image"""
+    c = np.pad(a, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+def ssim(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Mean SSIM of two luma planes over sliding uniform windows"""
+    k = min(SSIM_WINDOW, *reference.shape)
+    mu_x = _box_mean(reference, k)
+    mu_y = _box_mean(candidate, k)
+    var_x = _box_mean(reference * reference, k) - mu_x * mu_x
+    var_y = _box_mean(candidate * candidate, k) - mu_y * mu_y
+    cov = _box_mean(reference * candidate, k) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + _C1) * (2 * cov + _C2)) / (
+        (mu_x * mu_x + mu_y * mu_y + _C1) * (var_x + var_y + _C2)
+    )
+    return float(ssim_map.mean())
+
+def search_quality(image: Image.Image, format: str, threshold: float, low: int, high: int) -> tuple:
+    """
+    Binary search the lowest quality whose encoded output keeps SSIM >= threshold
+    against the lossless resize. Returns (quality, score); high if none passes.
+    """
+    reference = _luma(image)
+    best_quality, best_score = high, None
+    while low <= high:
+        quality = (low + high) // 2
+        encoded = engines.encode_thumbnail_image(image, format, quality)
+        score = ssim(reference, _luma(Image.open(io.BytesIO(encoded))))
+        if score >= threshold:
+            best_quality, best_score = quality, score
+            high = quality - 1
+        else:
+            low = quality + 1
+    return best_quality, best_score
+
+def get_auto_quality(db: Session, file_id: int, width: int, height: int, format: str):
+    return db.query(models.ThumbnailQuality).filter(
+        models.ThumbnailQuality.file_id == file_id,
+        models.ThumbnailQuality.width == width,
+        models.ThumbnailQuality.height == height,
+        models.ThumbnailQuality.format == format
+    ).first()
+
+def _search_variant_quality(db: Session, s3_storage, file_id: int, width: int, height: int, format: str) -> tuple:
+    # Any source that can render the variant at full quality is good enough to search on
+    source, _ = crud.open_render_source(
+        db, s3_storage, file_id, width, height, format, settings.THUMBNAIL_AUTO_QUALITY_MAX
+    )
+    try:
+        image = engines.prepare_thumbnail_image(source, width, height, format)
+    finally:
+        source.close()
+
+    return search_quality(
+        image,
+        format,
+        settings.THUMBNAIL_AUTO_QUALITY_SSIM,
+        settings.THUMBNAIL_AUTO_QUALITY_MIN,
+        settings.THUMBNAIL_AUTO_QUALITY_MAX
+    )
+
+def resolve_auto_quality(
+    db: Session,
+    s3_storage,
+    file_id: int,
+    width: int,
+    height: int,
+    format: str = "webp",
+    client: Optional[str] = None
+) -> int:
+    """
+    Quality for q=auto, searched once per file, size and format and then cached.
+    A search for a client costs several encodes, so it goes through render
+    admission control like a render and may raise RenderRejected.
+    """
+    if format.lower() not in LOSSY_FORMATS:
+        return LOSSLESS_QUALITY
+
+    cached = get_auto_quality(db, file_id, width, height, format)
+    if cached:
+        return cached.quality
+
+    quality, score = admit_render(
+        client, lambda: _search_variant_quality(db, s3_storage, file_id, width, height, format)
+    )
+    logger.info(f"Auto quality for file {file_id} {width}x{height} {format}: q={quality} ssim={score}")
+
+    db.add(models.ThumbnailQuality(
+        file_id=file_id, width=width, height=height, format=format, quality=quality, score=score
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request searched the same variant; both results are equivalent
+        db.rollback()
+    return quality
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, UploadFile, File as FastAPIFile, HTTPException, status, Query
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, Request, UploadFile, File as FastAPIFile, HTTPException, status, Query
+from fastapi.responses import RedirectResponse, Response, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from datetime import datetime
 
+from core.core.config import settings
 from core.core.database import get_db
 from core.core.storage import s3_storage
 from core.core import auth as core_auth
+from core.core import metrics
+from core.core.metrics import stage_timer
+from core.core.exceptions import ServiceUnavailableError
 from users import schemas as users_schemas
-from . import crud, schemas
+from . import crud, schemas, tasks
+from . import quality as thumbnail_quality
+from .admission import RenderRejected, admit_render, render_admission
 import imghdr
 
 router = APIRouter(
@@ -56,30 +63,65 @@ router = APIRouter(
 #     db_file = crud.create_file(db=db, file=file_data)
 #     return db_file
 
-@router.post("/upload", response_model=schemas.FileWithThumbnails, dependencies=[Depends(core_auth.get_current_user)])
-def upload_file(
-    db: Session = Depends(get_db),
-    file: UploadFile = FastAPIFile(...)
-):
-    db_file = crud.upload_file(db, file, s3_storage, validate_public=False)
-    
-    # Generate thumbnail URLs if file is an image
+def _file_with_thumbnails(db_file) -> dict:
+    """File response with responsive thumbnail URLs if the file is an image"""
     thumbnails = None
+    srcset = None
     if db_file.content_type and db_file.content_type.startswith('image/'):
-        thumbnails = crud.generate_thumbnail_urls_for_file(db_file.id)
+        thumbnails = crud.generate_thumbnail_urls_for_file(db_file)
+        srcset = crud.build_srcset(thumbnails) or None
     
     return {
         "id": db_file.id,
         "filename": db_file.filename,
-        "file_url": db_file.file_url,
+        "file_url": db_file.download_url,
         "content_type": db_file.content_type,
         "file_extension": db_file.file_extension,
         "size": db_file.size,
+        "width": db_file.width,
+        "height": db_file.height,
+        "version": db_file.version or 1,
         "created_at": db_file.created_at,
         "url": db_file.download_url,
-        "thumbnails": thumbnails
+        "thumbnails": thumbnails,
+        "srcset": srcset
     }
 
+@router.post("/upload", response_model=schemas.FileWithThumbnails)
+def upload_file(
+    db: Session = Depends(get_db),
+    file: UploadFile = FastAPIFile(...),
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    db_file = crud.upload_file(db, file, s3_storage, validate_public=False, uploaded_by=current_user.id)
+    return _file_with_thumbnails(db_file)
+
+def _batch_upload_response(results: list) -> dict:
+    items = [
+        {
+            "filename": filename,
+            "success": db_file is not None,
+            "file": _file_with_thumbnails(db_file) if db_file is not None else None,
+            "error": error
+        }
+        for filename, db_file, error in results
+    ]
+    uploaded = sum(1 for item in items if item["success"])
+    return {"uploaded": uploaded, "failed": len(items) - uploaded, "items": items}
+
+@router.post("/upload/batch", response_model=schemas.BatchUploadResponse)
+def upload_files(
+    db: Session = Depends(get_db),
+    files: List[UploadFile] = FastAPIFile(...),
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    """
+    Upload several files in one request. Files are sent to storage in parallel;
+    a rejected or failed part does not stop the others (see each item's error).
+    """
+    results = crud.upload_files(db, files, s3_storage, validate_public=False, uploaded_by=current_user.id)
+    return _batch_upload_response(results)
+
 @router.get("/", response_model=schemas.FileList)
 def get_file_list(
     db: Session = Depends(get_db),
@@ -90,7 +132,7 @@ def get_file_list(
     ids: Optional[str] = Query(None),
     page: int = 1,
     limit: int = 100,
-    current_user: users_schemas.User = Depends(core_auth.get_current_user)
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
 ):
     skip = (page - 1) * limit
 
@@ -107,16 +149,76 @@ def get_file_list(
     )
     return {"page": page, "limit": limit, "total": result["total"], "items": result["files"]}
 
-@router.get("/{file_id}", response_model=schemas.File)
+@router.get("/{file_id}", response_model=schemas.FileWithThumbnails)
 def get_file_detail(
     file_id: int, 
     db: Session = Depends(get_db),
-    current_user: users_schemas.User = Depends(core_auth.get_current_user)
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    db_file = crud.get_file(db, file_id=file_id)
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return _file_with_thumbnails(db_file)
+
+@router.put("/{file_id}/content", response_model=schemas.FileWithThumbnails)
+def replace_file_content(
+    file_id: int,
+    db: Session = Depends(get_db),
+    file: UploadFile = FastAPIFile(...),
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    """
+    Replace a file's content in place. The id stays the same, the version is bumped
+    so thumbnail URLs change, and stored thumbnails of the old content are dropped.
+    Only the uploader or an admin can replace a file; the new content must pass
+    the public upload checks (type and size), since it is served at public URLs.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not current_user.has_any_role("admin") and db_file.uploaded_by != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to replace this file")
+    db_file = crud.replace_file_content(db, db_file, file, s3_storage, validate_public=True)
+    return _file_with_thumbnails(db_file)
+
+@router.get("/{file_id}/near-duplicates", response_model=List[schemas.NearDuplicate])
+def get_near_duplicates(
+    file_id: int,
+    distance: int = Query(6, ge=0, le=20, description="Max Hamming distance between 64-bit hashes"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    """
+    Images that look like this one: re-uploads at another size or compression level.
+    Distance 0-2 is practically the same picture, up to ~10 is visually similar.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not db_file.content_type or not db_file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File is not an image")
+    if not crud.ensure_phash(db, s3_storage, db_file):
+        raise HTTPException(status_code=422, detail="Could not compute a perceptual hash for this image")
+
+    matches = crud.find_near_duplicates(db, db_file, distance, limit)
+    return [{"distance": d, "file": f} for f, d in matches]
+
+@router.get("/{file_id}/download", response_class=RedirectResponse)
+def download_file(
+    file_id: int,
+    db: Session = Depends(get_db),
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
 ):
+    """
+    Redirect to the original file, recording the access for storage tiering.
+    Cold files are moved back to the hot tier by the next tier_storage.py run.
+    """
     db_file = crud.get_file(db, file_id=file_id)
     if db_file is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return db_file
+    crud.record_file_access(db, s3_storage, db_file)
+    return RedirectResponse(url=db_file.download_url, status_code=302)
 
 # --- Public Endpoints ---
 
@@ -147,12 +249,61 @@ def get_public_file_list(
     )
     return {"page": page, "limit": limit, "total": result["total"], "items": result["files"]}
 
-@router.get("/public/{file_id}", response_model=schemas.File)
+@router.get("/public/sprite", response_model=schemas.ThumbnailSpriteResponse)
+def get_public_sprite(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated list of file ids"),
+    size: str = Query("sm", regex="^(xs|sm|md|lg)$", description="Tile preset (xs=48, sm=64, md=96, lg=128)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Build (or reuse) a single sprite sheet for many image previews.
+    Returns the sheet URL and the position of every file inside it.
+    """
+    try:
+        file_ids_list = [int(id_str.strip()) for id_str in ids.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid 'ids' format. Must be a comma-separated list of integers.")
+    
+    if len(set(file_ids_list)) > settings.SPRITE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A sprite sheet can hold at most {settings.SPRITE_MAX_FILES} files")
+    
+    try:
+        sprite = crud.get_or_create_sprite(db, s3_storage, file_ids_list, size, client=_client_key(request))
+    except RenderRejected as rejected:
+        raise ServiceUnavailableError(
+            message=f"Sprite rendering is busy ({rejected.reason}), try again shortly",
+            retry_after=settings.THUMBNAIL_ADMISSION_RETRY_AFTER
+        )
+    placed_ids = {item["file_id"] for item in sprite.coordinates}
+    
+    return {
+        "sprite_url": sprite.url,
+        "preset": sprite.preset,
+        "tile_size": sprite.tile_size,
+        "width": sprite.width,
+        "height": sprite.height,
+        "items": sprite.coordinates,
+        "missing": [file_id for file_id in sorted(set(file_ids_list)) if file_id not in placed_ids]
+    }
+
+@router.get("/public/{file_id}", response_model=schemas.FileWithThumbnails)
 def get_public_file_detail(file_id: int, db: Session = Depends(get_db)):
     db_file = crud.get_file(db, file_id=file_id)
     if db_file is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return db_file 
+    return _file_with_thumbnails(db_file)
+
+@router.get("/public/{file_id}/download", response_class=RedirectResponse)
+def public_download_file(file_id: int, db: Session = Depends(get_db)):
+    """
+    Public redirect to an original image, recording the access for storage tiering.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if db_file is None or not db_file.content_type or not db_file.content_type.startswith('image/'):
+        raise HTTPException(status_code=404, detail="File not found")
+    crud.record_file_access(db, s3_storage, db_file)
+    return RedirectResponse(url=db_file.download_url, status_code=302)
 
 @router.post("/public-upload", response_model=schemas.FileWithThumbnails)
 def public_upload_file(
@@ -160,60 +311,182 @@ def public_upload_file(
     file: UploadFile = FastAPIFile(...)
 ):
     db_file = crud.upload_file(db, file, s3_storage, validate_public=True)
-    
-    # Generate thumbnail URLs if file is an image
-    thumbnails = None
-    if db_file.content_type and db_file.content_type.startswith('image/'):
-        thumbnails = crud.generate_thumbnail_urls_for_file(db_file.id)
-    
-    return {
-        "id": db_file.id,
-        "filename": db_file.filename,
-        "file_url": db_file.file_url,
-        "content_type": db_file.content_type,
-        "file_extension": db_file.file_extension,
-        "size": db_file.size,
-        "created_at": db_file.created_at,
-        "url": db_file.download_url,
-        "thumbnails": thumbnails
-    }
+    return _file_with_thumbnails(db_file)
+
+@router.post("/public-upload/batch", response_model=schemas.BatchUploadResponse)
+def public_upload_files(
+    db: Session = Depends(get_db),
+    files: List[UploadFile] = FastAPIFile(...)
+):
+    """Public batch upload (images or PDF, max 5MB each), with per-file results"""
+    results = crud.upload_files(db, files, s3_storage, validate_public=True)
+    return _batch_upload_response(results)
 
 # --- Thumbnail Endpoints ---
 
+QUALITY_PATTERN = r"^(auto|\d{1,3})$"
+
+def _resolve_quality(
+    db: Session, client: str, q: str, file_id: int, w: int, h: int, format: str, low: int, high: int
+) -> int:
+    """
+    Numeric quality for a request; q=auto is searched once per variant and cached.
+    The search is admitted like a render; a shed search fails fast with 503.
+    """
+    if q == "auto":
+        try:
+            quality = thumbnail_quality.resolve_auto_quality(db, s3_storage, file_id, w, h, format, client=client)
+        except RenderRejected as rejected:
+            metrics.set_labels(cache="shed")
+            raise ServiceUnavailableError(
+                message=f"Thumbnail rendering is busy ({rejected.reason}), try again shortly",
+                retry_after=settings.THUMBNAIL_ADMISSION_RETRY_AFTER
+            )
+        return min(max(quality, low), high)
+    quality = int(q)
+    if not low <= quality <= high:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"q must be between {low} and {high}, or auto"
+        )
+    return quality
+
+def _client_key(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def _shed_render(db: Session, file_id: int, w: int, h: int, format: str, rejected: RenderRejected):
+    """The nearest stored variant of a shed render, or 503 with Retry-After"""
+    metrics.set_labels(cache="shed")
+    if settings.THUMBNAIL_ADMISSION_FALLBACK:
+        thumbnail = crud.find_nearest_thumbnail(db, file_id, w, h, format)
+        if thumbnail:
+            metrics.set_labels(cache="fallback")
+            render_admission.record_fallback()
+            return thumbnail
+    raise ServiceUnavailableError(
+        message=f"Thumbnail rendering is busy ({rejected.reason}), try again shortly",
+        retry_after=settings.THUMBNAIL_ADMISSION_RETRY_AFTER
+    )
+
+def _redirect_cache_headers(immutable: bool) -> Optional[dict]:
+    """
+    Cache-Control of a redirect to a stored variant. Presigned targets expire,
+    so a cached redirect must not outlive them: signed URLs are reused until
+    STORAGE_PRESIGN_REFRESH_MARGIN before expiry, which is all the lifetime
+    a redirect is guaranteed to have left.
+    """
+    if not immutable:
+        return None
+    if settings.STORAGE_PRIVATE_OBJECTS:
+        max_age = max(0, min(
+            settings.STORAGE_PRESIGN_REFRESH_MARGIN,
+            settings.STORAGE_PRESIGN_EXPIRES - settings.STORAGE_PRESIGN_REFRESH_MARGIN
+        ))
+        return {"Cache-Control": f"public, max-age={max_age}"}
+    return {"Cache-Control": settings.IMMUTABLE_CACHE_CONTROL}
+
+def _serve_thumbnail(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    client: str,
+    file_id: int,
+    w: int,
+    h: int,
+    format: str,
+    q: int,
+    v: Optional[int] = None
+):
+    """
+    Redirect to a stored variant. On a miss the freshly rendered bytes are
+    returned directly; the S3 upload and the DB insert run after the response.
+    Requests naming the file's current version (v) are cacheable forever,
+    except redirects to presigned URLs, which are cached only while they stay
+    valid. Renders go through admission control; a shed render redirects to the
+    nearest stored variant (not cacheable) or fails fast with 503.
+    """
+    with stage_timer("db_lookup"):
+        db_file = crud.get_file(db, file_id)
+    if db_file is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Original file not found")
+    version = db_file.version or 1
+    immutable = v is not None and v == version
+    headers = {"Cache-Control": settings.IMMUTABLE_CACHE_CONTROL} if immutable else None
+    redirect_headers = _redirect_cache_headers(immutable)
+
+    thumbnail = crud.get_thumbnail(db, file_id, w, h, format, q)
+    if thumbnail:
+        metrics.set_labels(cache="hit")
+        crud.update_thumbnail_access(db, thumbnail)
+        return RedirectResponse(url=thumbnail.url, status_code=302, headers=redirect_headers)
+
+    thumbnail = crud.reuse_near_duplicate_thumbnail(db, file_id, w, h, format, q)
+    if thumbnail:
+        metrics.set_labels(cache="reuse")
+        return RedirectResponse(url=thumbnail.url, status_code=302, headers=redirect_headers)
+
+    variant = (file_id, w, h, format, q)
+    try:
+        thumbnail_data, owner = tasks.render_once(
+            variant,
+            lambda: admit_render(client, lambda: crud.render_thumbnail(db, s3_storage, file_id, w, h, format, q))
+        )
+    except RenderRejected as rejected:
+        thumbnail = _shed_render(db, file_id, w, h, format, rejected)
+        return RedirectResponse(url=thumbnail.url, status_code=302, headers={"Cache-Control": "no-store"})
+    metrics.set_labels(cache="miss" if owner else "inflight")
+    if owner:
+        background_tasks.add_task(tasks.store_in_background, s3_storage, variant, thumbnail_data, version)
+
+    return Response(
+        content=thumbnail_data,
+        media_type=crud.thumbnail_content_type(format),
+        headers=headers or {"Cache-Control": f"public, max-age={settings.THUMBNAIL_INLINE_MAX_AGE}"}
+    )
+
+# Declared before /thumbnail/{file_id} so "admission" is not parsed as a file id
+@router.get("/thumbnail/admission", response_model=schemas.RenderAdmissionStats)
+def get_render_admission_stats(
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
+):
+    """
+    Queue depth and rejection counters of on-demand thumbnail rendering in this process.
+    Requires authentication.
+    """
+    return render_admission.stats()
+
 @router.get("/thumbnail/{file_id}", response_class=RedirectResponse)
 def get_thumbnail(
     file_id: int,
+    background_tasks: BackgroundTasks,
+    request: Request,
     w: int = Query(..., ge=50, le=2000, description="Width in pixels"),
     h: int = Query(..., ge=50, le=2000, description="Height in pixels"),
     format: str = Query("webp", regex="^(webp|jpg|jpeg|png)$", description="Output format"),
-    q: int = Query(80, ge=10, le=100, description="Quality (10-100)"),
+    q: str = Query("80", regex=QUALITY_PATTERN, description="Quality (10-100) or auto"),
+    v: Optional[int] = Query(None, description="Source version from the file response; makes the response immutable"),
     db: Session = Depends(get_db)
 ):
     """
     Get or create thumbnail for an image file.
-    Returns redirect to the thumbnail URL.
+    Returns redirect to the thumbnail URL, or the image itself on first render.
+    Under render overload: redirect to the nearest existing size, or 503 with Retry-After.
     
     Parameters:
     - file_id: ID of the original file
     - w: Width in pixels (50-2000)
     - h: Height in pixels (50-2000) 
     - format: Output format (webp, jpg, jpeg, png)
-    - q: Quality 10-100 (default 80)
+    - q: Quality 10-100 (default 80), or auto for the lowest quality that looks the same
+    - v: Source version (optional, as in the generated thumbnail URLs)
+    
+    Responses carry a Server-Timing header with the time spent in each stage.
     """
     try:
-        # Get or create thumbnail
-        thumbnail = crud.get_or_create_thumbnail(
-            db=db,
-            s3_storage=s3_storage,
-            file_id=file_id,
-            width=w,
-            height=h,
-            format=format,
-            quality=q
-        )
-        
-        # Redirect to thumbnail URL
-        return RedirectResponse(url=thumbnail.file_url, status_code=302)
+        with crud.thumbnail_trace(w, h, format) as trace:
+            quality = _resolve_quality(db, _client_key(request), q, file_id, w, h, format, 10, 100)
+            response = _serve_thumbnail(db, background_tasks, _client_key(request), file_id, w, h, format, quality, v)
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
         
     except HTTPException:
         raise
@@ -223,29 +496,78 @@ def get_thumbnail(
             detail=f"Unexpected error: {str(e)}"
         )
 
-@router.get("/thumbnail/{file_id}/info", response_model=schemas.ThumbnailResponse)
+def _thumbnail_job_status(job: dict, thumbnail=None) -> dict:
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"{settings.API_V1_STR}/files/thumbnail/jobs/{job['job_id']}",
+        "thumbnail": thumbnail,
+        "error": job.get("error")
+    }
+
+def _thumbnail_job_accepted(job: dict) -> JSONResponse:
+    """202 pointing the client at the job's status URL"""
+    body = _thumbnail_job_status(job)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(schemas.ThumbnailJobStatus(**body)),
+        headers={"Retry-After": str(settings.THUMBNAIL_JOB_RETRY_AFTER), "Location": body["status_url"]}
+    )
+
+@router.get(
+    "/thumbnail/{file_id}/info",
+    response_model=schemas.ThumbnailResponse,
+    responses={202: {"model": schemas.ThumbnailJobStatus, "description": "Render queued (wait=false)"}}
+)
 def get_thumbnail_info(
     file_id: int,
+    request: Request,
+    response: Response,
     w: int = Query(..., ge=50, le=2000),
     h: int = Query(..., ge=50, le=2000),
     format: str = Query("webp", regex="^(webp|jpg|jpeg|png)$"),
-    q: int = Query(80, ge=10, le=100),
+    q: str = Query("80", regex=QUALITY_PATTERN),
+    wait: bool = Query(True, description="false: return 202 and render in the background if the thumbnail does not exist yet"),
     db: Session = Depends(get_db)
 ):
     """
     Get thumbnail information without redirecting.
     Returns thumbnail metadata including URL.
+    With wait=false a missing thumbnail is queued instead of rendered in the request:
+    the response is 202 with a status URL to poll and a Retry-After header.
+    Under render overload the nearest existing size is returned, or 503 with Retry-After.
     """
     try:
-        thumbnail = crud.get_or_create_thumbnail(
-            db=db,
-            s3_storage=s3_storage,
-            file_id=file_id,
-            width=w,
-            height=h,
-            format=format,
-            quality=q
-        )
+        with crud.thumbnail_trace(w, h, format) as trace:
+            quality = _resolve_quality(db, _client_key(request), q, file_id, w, h, format, 10, 100)
+            if not wait:
+                thumbnail = crud.get_thumbnail(db, file_id, w, h, format, quality)
+                if thumbnail:
+                    metrics.set_labels(cache="hit")
+                    crud.update_thumbnail_access(db, thumbnail)
+                    response.headers["Server-Timing"] = trace.server_timing()
+                    return thumbnail
+                metrics.set_labels(cache="queued")
+                crud.get_image_file(db, file_id)
+                job = tasks.submit_thumbnail_job(s3_storage, (file_id, w, h, format, quality), _client_key(request))
+                accepted = _thumbnail_job_accepted(job)
+                accepted.headers["Server-Timing"] = trace.server_timing()
+                return accepted
+
+            try:
+                thumbnail = crud.get_or_create_thumbnail(
+                    db=db,
+                    s3_storage=s3_storage,
+                    file_id=file_id,
+                    width=w,
+                    height=h,
+                    format=format,
+                    quality=quality,
+                    client=_client_key(request)
+                )
+            except RenderRejected as rejected:
+                thumbnail = _shed_render(db, file_id, w, h, format, rejected)
+            response.headers["Server-Timing"] = trace.server_timing()
         
         return thumbnail
         
@@ -257,11 +579,39 @@ def get_thumbnail_info(
             detail=f"Unexpected error: {str(e)}"
         )
 
+@router.get(
+    "/thumbnail/jobs/{job_id}",
+    response_model=schemas.ThumbnailJobStatus,
+    responses={202: {"model": schemas.ThumbnailJobStatus, "description": "Still queued or running"}}
+)
+def get_thumbnail_job_status(job_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Poll a render queued by /thumbnail/{file_id}/info?wait=false.
+    200 with the thumbnail once done (or with the error if it failed), 202 while pending,
+    503 with Retry-After when too many renders are queued.
+    """
+    variant = tasks.parse_thumbnail_job_id(job_id)
+    if variant is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    thumbnail = crud.get_thumbnail(db, *variant)
+    if thumbnail:
+        return _thumbnail_job_status({"job_id": job_id, "status": "done"}, thumbnail)
+
+    job = tasks.get_thumbnail_job(job_id)
+    if job is None or job["status"] == "done":
+        # Queued by another worker, or finished state already forgotten: queue it here
+        crud.get_image_file(db, variant[0])
+        job = tasks.submit_thumbnail_job(s3_storage, variant, _client_key(request))
+    if job["status"] == "failed":
+        return _thumbnail_job_status(job)
+    return _thumbnail_job_accepted(job)
+
 @router.get("/thumbnail/{file_id}/list", response_model=List[schemas.ThumbnailResponse])
 def list_file_thumbnails(
     file_id: int,
     db: Session = Depends(get_db),
-    current_user: users_schemas.User = Depends(core_auth.get_current_user)
+    current_user: users_schemas.Principal = Depends(core_auth.get_current_user)
 ):
     """
     List all existing thumbnails for a file.
@@ -287,10 +637,13 @@ def list_file_thumbnails(
 @router.get("/public/thumbnail/{file_id}", response_class=RedirectResponse)
 def get_public_thumbnail(
     file_id: int,
+    background_tasks: BackgroundTasks,
+    request: Request,
     w: int = Query(..., ge=50, le=1000, description="Width in pixels (public limited to 1000px)"),
     h: int = Query(..., ge=50, le=1000, description="Height in pixels (public limited to 1000px)"),
     format: str = Query("webp", regex="^(webp|jpg|png)$", description="Output format"),
-    q: int = Query(80, ge=50, le=90, description="Quality 50-90 (public limited)"),
+    q: str = Query("80", regex=QUALITY_PATTERN, description="Quality 50-90 (public limited) or auto"),
+    v: Optional[int] = Query(None, description="Source version; makes the response immutable"),
     db: Session = Depends(get_db)
 ):
     """
@@ -312,17 +665,11 @@ def get_public_thumbnail(
         )
     
     try:
-        thumbnail = crud.get_or_create_thumbnail(
-            db=db,
-            s3_storage=s3_storage,
-            file_id=file_id,
-            width=w,
-            height=h,
-            format=format,
-            quality=q
-        )
-        
-        return RedirectResponse(url=thumbnail.file_url, status_code=302)
+        with crud.thumbnail_trace(w, h, format) as trace:
+            quality = _resolve_quality(db, _client_key(request), q, file_id, w, h, format, 50, 90)
+            response = _serve_thumbnail(db, background_tasks, _client_key(request), file_id, w, h, format, quality, v)
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
         
     except HTTPException:
         raise
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, AliasChoices
 from datetime import datetime
 from typing import List, Optional
 
@@ -8,18 +8,32 @@ class FileBase(BaseModel):
     content_type: Optional[str] = None
     file_extension: Optional[str] = None
     size: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
 class FileCreate(FileBase):
-    pass
+    storage_backend: str = "s3"
+    object_key: Optional[str] = None
+    archive_key: Optional[str] = None
+    phash: Optional[str] = None
 
 class File(FileBase):
+    # Built at read time from the object key (CDN / presigned), stored URL for legacy rows
+    file_url: str = Field(validation_alias=AliasChoices("download_url", "file_url"))
     id: int
     created_at: datetime
     url: str
+    phash: Optional[str] = None
+    version: int = 1
 
     class Config:
         orm_mode = True
 
+class NearDuplicate(BaseModel):
+    """A file whose perceptual hash is within the requested Hamming distance"""
+    distance: int
+    file: File
+
 class FileList(BaseModel):
     page: int
     limit: int
@@ -36,11 +50,14 @@ class ThumbnailBase(BaseModel):
 
 class ThumbnailCreate(ThumbnailBase):
     file_url: str
+    storage_backend: str = "s3"
+    object_key: Optional[str] = None
     file_size: Optional[float] = None
+    lossless: bool = False
 
 class Thumbnail(ThumbnailBase):
     id: int
-    file_url: str
+    file_url: str = Field(validation_alias=AliasChoices("url", "file_url"))
     file_size: Optional[float] = None
     created_at: datetime
     last_accessed: Optional[datetime] = None
@@ -55,13 +72,35 @@ class ThumbnailResponse(BaseModel):
     height: int
     format: str
     quality: int
-    file_url: str
+    file_url: str = Field(validation_alias=AliasChoices("url", "file_url"))
     file_size: Optional[float] = None
     created_at: datetime
 
     class Config:
         orm_mode = True
 
+class ThumbnailJobStatus(BaseModel):
+    """State of a queued thumbnail render"""
+    job_id: str
+    status: str  # queued, running, done, failed
+    status_url: str
+    thumbnail: Optional[ThumbnailResponse] = None
+    error: Optional[str] = None
+
+class RenderAdmissionStats(BaseModel):
+    """On-demand render admission state and counters since process start"""
+    running: int
+    queued: int
+    clients: int
+    max_concurrent: int
+    max_queue: int
+    per_client: int
+    admitted: int
+    rejected_queue_full: int
+    rejected_client_limit: int
+    rejected_queue_timeout: int
+    served_fallback: int
+
 class ThumbnailUrl(BaseModel):
     """Simple thumbnail URL info for file responses"""
     width: int
@@ -76,9 +115,44 @@ class FileWithThumbnails(BaseModel):
     content_type: Optional[str] = None
     file_extension: Optional[str] = None
     size: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    version: int = 1
     created_at: datetime
     url: str
     thumbnails: Optional[List[ThumbnailUrl]] = None
+    srcset: Optional[str] = None
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class BatchUploadItem(BaseModel):
+    """Outcome of one part of a batch upload"""
+    filename: str
+    success: bool
+    file: Optional[FileWithThumbnails] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    items: List[BatchUploadItem]
+
+# Sprite sheet schemas
+class SpriteTile(BaseModel):
+    """Position of one file inside a sprite sheet"""
+    file_id: int
+    x: int
+    y: int
+    width: int
+    height: int
+
+class ThumbnailSpriteResponse(BaseModel):
+    """Sprite sheet URL plus the coordinate map of its members"""
+    sprite_url: str
+    preset: str
+    tile_size: int
+    width: int
+    height: int
+    items: List[SpriteTile]
+    missing: List[int] = []
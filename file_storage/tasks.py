@@ -0,0 +1,677 @@
+from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, Iterable
+from itertools import islice
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from urllib.parse import parse_qs
+import threading
+import logging
+import multiprocessing
+import os
+import re
+import time
+
+from core.core.config import settings
+from core.core import database
+from core.core.metrics import stage_timer
+from core.core.exceptions import ServiceUnavailableError
+from . import crud, engines, models, schemas
+from . import quality as thumbnail_quality
+from .admission import RenderRejected
+from .phash import dhash
+
+logger = logging.getLogger(__name__)
+
+# (file_id, width, height, format, quality) of one thumbnail variant
+Variant = tuple
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Process pool shared by every CPU-heavy thumbnail render"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: the first submit comes from a worker thread while others are inside boto3/urllib3
+            _render_pool = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _render_pool
+
+def render_in_pool(
+    image_data: bytes,
+    width: int,
+    height: int,
+    format: str = "webp",
+    quality: int = 80,
+    profile: Optional[str] = None
+) -> bytes:
+    """Resize in the render pool so the calling thread only waits on the result"""
+    future = get_render_pool().submit(crud.resize_image_bytes, image_data, width, height, format, quality, profile)
+    return future.result()
+
+class RateLimiter:
+    """Spaces calls evenly so at most `rate` start per second"""
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_slot > now:
+            time.sleep(self.next_slot - now)
+        self.next_slot = max(now, self.next_slot) + self.interval
+
+def variant_key(variant: Variant) -> str:
+    file_id, width, height, format, quality = variant
+    return f"{file_id}:{width}x{height}:{format}:{quality}"
+
+# --- First render ---
+
+class _InflightRender:
+    def __init__(self):
+        self.done = threading.Event()
+        self.data: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+_inflight: dict = {}
+_inflight_lock = threading.Lock()
+
+def render_once(variant: Variant, render) -> tuple:
+    """
+    Render a variant at most once per process while it is in flight.
+    Returns (thumbnail_data, owner); the owner must call store_in_background.
+    Concurrent misses wait for the owner's bytes instead of rendering again.
+    """
+    key = variant_key(variant)
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        owner = entry is None
+        if owner:
+            entry = _inflight[key] = _InflightRender()
+
+    if not owner:
+        with stage_timer("inflight_wait"):
+            finished = entry.done.wait(timeout=settings.THUMBNAIL_INFLIGHT_WAIT)
+        if not finished:
+            return render(), False
+        if entry.error is not None:
+            raise entry.error
+        return entry.data, False
+
+    try:
+        entry.data = render()
+    except BaseException as e:
+        entry.error = e
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        raise
+    finally:
+        entry.done.set()
+    return entry.data, True
+
+def store_in_background(s3_storage, variant: Variant, thumbnail_data: bytes, source_version: Optional[int] = None):
+    """Upload and record a variant already served inline, then release it"""
+    file_id, width, height, format, quality = variant
+    # Own session: the request's session is closed once the response is sent
+    db = database.SessionLocal()
+    try:
+        with crud.thumbnail_trace(width, height, format, cache="store"):
+            crud.store_thumbnail(db, s3_storage, file_id, width, height, format, quality, thumbnail_data, source_version)
+    except Exception as e:
+        # The next miss renders and stores the variant again
+        logger.error(f"Failed to store thumbnail {variant_key(variant)}: {e}")
+    finally:
+        db.close()
+        with _inflight_lock:
+            _inflight.pop(variant_key(variant), None)
+
+# --- Background jobs ---
+
+_JOB_ID_RE = re.compile(r"^(\d+)-(\d+)x(\d+)-(webp|jpg|jpeg|png)-(\d+)$")
+
+_job_executor: Optional[ThreadPoolExecutor] = None
+_jobs: dict = {}
+_jobs_lock = threading.Lock()
+
+def thumbnail_job_id(variant: Variant) -> str:
+    """Deterministic, so every worker and every poll agrees on a variant's job"""
+    file_id, width, height, format, quality = variant
+    return f"{file_id}-{width}x{height}-{format}-{quality}"
+
+def parse_thumbnail_job_id(job_id: str) -> Optional[Variant]:
+    match = _JOB_ID_RE.match(job_id)
+    if not match:
+        return None
+    file_id, width, height, format, quality = match.groups()
+    width, height, quality = int(width), int(height), int(quality)
+    # Ids come from clients: only variants the thumbnail endpoints would accept
+    if not (50 <= width <= 2000 and 50 <= height <= 2000 and 10 <= quality <= 100):
+        return None
+    return int(file_id), width, height, format, quality
+
+def _get_job_executor() -> ThreadPoolExecutor:
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_JOB_WORKERS)
+        return _job_executor
+
+def _set_job_status(job_id: str, status: str, error: Optional[str] = None):
+    with _jobs_lock:
+        _jobs[job_id] = {"status": status, "error": error, "updated": time.monotonic()}
+
+def _run_thumbnail_job(s3_storage, job_id: str, variant: Variant, client: str):
+    file_id, width, height, format, quality = variant
+    _set_job_status(job_id, "running")
+    db = database.SessionLocal()
+    try:
+        crud.get_or_create_thumbnail(db, s3_storage, file_id, width, height, format, quality, client=client)
+        _set_job_status(job_id, "done")
+    except RenderRejected as rejected:
+        # Shed like any other render; the next poll queues it again
+        logger.info(f"Thumbnail job {job_id} shed: {rejected.reason}")
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+    except Exception as e:
+        error = getattr(e, "detail", None) or str(e)
+        logger.error(f"Thumbnail job {job_id} failed: {error}")
+        _set_job_status(job_id, "failed", error)
+    finally:
+        db.close()
+
+def submit_thumbnail_job(s3_storage, variant: Variant, client: str) -> dict:
+    """
+    Queue a render unless this process already has it queued or running; returns
+    the job state. The render goes through admission control as `client`; at most
+    THUMBNAIL_JOB_MAX_PENDING jobs are queued or running, beyond that a 503.
+    """
+    job_id = thumbnail_job_id(variant)
+    now = time.monotonic()
+    with _jobs_lock:
+        # Forget finished jobs; a later miss simply queues the variant again
+        for stale_id in [
+            k for k, job in _jobs.items()
+            if job["status"] in ("done", "failed") and now - job["updated"] > settings.THUMBNAIL_JOB_TTL
+        ]:
+            del _jobs[stale_id]
+        job = _jobs.get(job_id)
+        if job and job["status"] in ("queued", "running"):
+            return dict(job, job_id=job_id)
+        pending = sum(1 for job in _jobs.values() if job["status"] in ("queued", "running"))
+        if pending >= settings.THUMBNAIL_JOB_MAX_PENDING:
+            raise ServiceUnavailableError(
+                message="Too many thumbnail renders queued, try again shortly",
+                retry_after=settings.THUMBNAIL_ADMISSION_RETRY_AFTER
+            )
+        job = _jobs[job_id] = {"status": "queued", "error": None, "updated": now}
+    _get_job_executor().submit(_run_thumbnail_job, s3_storage, job_id, variant, client)
+    return dict(job, job_id=job_id)
+
+def get_thumbnail_job(job_id: str) -> Optional[dict]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job, job_id=job_id) if job else None
+
+# --- Warm-up ---
+
+def rank_variants_by_access(db: Session, limit: int) -> list:
+    """Most requested variants first, using the thumbnails access stats"""
+    thumbnails = db.query(models.Thumbnail).order_by(
+        models.Thumbnail.access_count.desc(),
+        models.Thumbnail.last_accessed.desc()
+    ).limit(limit).all()
+    return [(t.original_file_id, t.width, t.height, t.format, t.quality) for t in thumbnails]
+
+_THUMBNAIL_PATH_RE = re.compile(r"/files/(public/)?thumbnail/(\d+)\?([^\s\"]+)")
+
+def _logged_auto_quality(db: Optional[Session], file_id: int, width: int, height: int, format: str, public: bool) -> Optional[int]:
+    """Quality a q=auto request was served at, from the stored pick; None if never searched"""
+    if format.lower() not in thumbnail_quality.LOSSY_FORMATS:
+        return thumbnail_quality.LOSSLESS_QUALITY
+    if db is None:
+        return None
+    cached = thumbnail_quality.get_auto_quality(db, file_id, width, height, format)
+    if cached is None:
+        return None
+    # Same clamp as the endpoints apply to the pick
+    low, high = (50, 90) if public else (10, 100)
+    return min(max(cached.quality, low), high)
+
+def rank_variants_from_access_log(lines: Iterable[str], limit: int, db: Optional[Session] = None) -> list:
+    """
+    Most requested variants first, counted from access log lines of the thumbnail
+    endpoints. q=auto requests are resolved through the stored auto-quality picks
+    (needs db); those without one are skipped and counted in the log.
+    """
+    requests = Counter()
+    for line in lines:
+        match = _THUMBNAIL_PATH_RE.search(line)
+        if not match:
+            continue
+        params = parse_qs(match.group(3))
+        try:
+            quality = params.get("q", ["80"])[0]
+            request = (
+                int(match.group(2)),
+                int(params["w"][0]),
+                int(params["h"][0]),
+                params.get("format", ["webp"])[0],
+                quality if quality == "auto" else int(quality),
+                bool(match.group(1)),
+            )
+        except (KeyError, ValueError):
+            continue
+        requests[request] += 1
+
+    counter = Counter()
+    skipped_auto = 0
+    for (file_id, width, height, format, quality, public), count in requests.items():
+        if quality == "auto":
+            quality = _logged_auto_quality(db, file_id, width, height, format, public)
+            if quality is None:
+                skipped_auto += count
+                continue
+        counter[(file_id, width, height, format, quality)] += count
+    if skipped_auto:
+        logger.info(f"Skipped {skipped_auto} q=auto log lines with no stored auto quality")
+    return [variant for variant, _ in counter.most_common(limit)]
+
+def load_checkpoint(path: str) -> set:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def _render_and_upload(s3_storage, object_key: str, variant: Variant) -> tuple:
+    """Download, render in the process pool and upload one variant; returns (url, object key, size)"""
+    file_id, width, height, format, quality = variant
+    image_data = s3_storage.download_object(object_key)
+    if not image_data:
+        raise RuntimeError(f"Failed to download original of file {file_id}")
+    thumbnail_data = render_in_pool(image_data, width, height, format, quality, engines.encoder_profile("warmup"))
+    thumbnail_url, thumbnail_key = crud.upload_thumbnail_to_s3(
+        s3_storage, thumbnail_data, file_id, width, height, format, quality
+    )
+    return thumbnail_url, thumbnail_key, len(thumbnail_data)
+
+def regenerate_variants(
+    db: Session,
+    s3_storage,
+    variants: list,
+    concurrency: int = 4,
+    rate: Optional[float] = None,
+    checkpoint_path: Optional[str] = None
+) -> dict:
+    """
+    Re-render the given variants concurrently and upsert their thumbnail rows,
+    deleting the objects the re-rendered rows replace. Completed variants are
+    appended to the checkpoint file, if given, so a rerun resumes.
+    """
+    done = load_checkpoint(checkpoint_path)
+    pending = [v for v in variants if variant_key(v) not in done]
+    stats = {"total": len(variants), "skipped": len(variants) - len(pending), "rendered": 0, "failed": 0}
+
+    file_ids = {v[0] for v in pending}
+    files = {
+        f.id: f for f in db.query(models.File).filter(models.File.id.in_(file_ids)).all()
+    } if file_ids else {}
+
+    limiter = RateLimiter(rate)
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as io_pool:
+            in_flight = {}
+
+            def drain(return_when):
+                finished, _ = wait(in_flight, return_when=return_when)
+                for future in finished:
+                    variant = in_flight.pop(future)
+                    try:
+                        thumbnail_url, thumbnail_key, file_size = future.result()
+                    except Exception as e:
+                        stats["failed"] += 1
+                        logger.error(f"Failed to regenerate {variant_key(variant)}: {e}")
+                        continue
+                    # DB writes stay on this thread; the session is not shared with workers
+                    file_id, width, height, format, quality = variant
+                    existing = crud.get_thumbnail(db, file_id, width, height, format, quality)
+                    replaced_key = existing.object_key if existing is not None else None
+                    crud.upsert_thumbnail(db, schemas.ThumbnailCreate(
+                        original_file_id=file_id,
+                        width=width,
+                        height=height,
+                        quality=quality,
+                        format=format,
+                        file_url=thumbnail_url,
+                        storage_backend="s3",
+                        object_key=thumbnail_key,
+                        file_size=file_size,
+                        lossless=crud.is_lossless_format(format)
+                    ))
+                    # The row now points at the new object; drop the old one unless a near-duplicate shares it
+                    if replaced_key and replaced_key != thumbnail_key:
+                        crud.delete_unreferenced_thumbnail_objects(db, s3_storage, [replaced_key])
+                    stats["rendered"] += 1
+                    if checkpoint:
+                        checkpoint.write(variant_key(variant) + "\n")
+                        checkpoint.flush()
+
+            for variant in pending:
+                original_file = files.get(variant[0])
+                if original_file is None or not (original_file.content_type or "").startswith("image/"):
+                    stats["failed"] += 1
+                    logger.warning(f"Skipping {variant_key(variant)}: original image not found")
+                    continue
+                # Keep a bounded number of renders queued
+                if len(in_flight) >= concurrency * 2:
+                    drain(FIRST_COMPLETED)
+                limiter.wait()
+                object_key = crud.get_object_key(s3_storage, original_file)
+                in_flight[io_pool.submit(_render_and_upload, s3_storage, object_key, variant)] = variant
+
+            if in_flight:
+                drain(ALL_COMPLETED)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    return stats
+
+# --- Storage tiering ---
+
+def tier_cold_files(
+    db: Session,
+    s3_storage,
+    older_than_days: Optional[int] = None,
+    limit: int = 1000,
+    dry_run: bool = False
+) -> dict:
+    """
+    Move originals that have not been downloaded or rendered recently to the cold storage class.
+    Thumbnails are never tiered.
+    """
+    days = older_than_days if older_than_days is not None else settings.STORAGE_COLD_AFTER_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    candidates = db.query(models.File).filter(
+        models.File.storage_tier == "hot",
+        func.coalesce(models.File.last_accessed, models.File.created_at) < cutoff,
+        models.File.size >= settings.STORAGE_TIERING_MIN_SIZE
+    ).order_by(models.File.id).limit(limit).all()
+
+    stats = {"candidates": len(candidates), "moved": 0, "failed": 0, "bytes": 0}
+    for db_file in candidates:
+        if dry_run:
+            stats["bytes"] += int(db_file.size or 0)
+            continue
+        if s3_storage.change_storage_class(crud.get_object_key(s3_storage, db_file), settings.STORAGE_COLD_CLASS):
+            db_file.storage_tier = "cold"
+            db.commit()
+            stats["moved"] += 1
+            stats["bytes"] += int(db_file.size or 0)
+        else:
+            stats["failed"] += 1
+    return stats
+
+def rehydrate_accessed_files(
+    db: Session,
+    s3_storage,
+    older_than_days: Optional[int] = None,
+    limit: int = 1000,
+    dry_run: bool = False
+) -> dict:
+    """
+    Move cold originals that were downloaded or rendered again back to the hot storage class.
+    A file only went cold once its last access was older than the cutoff, so a newer
+    last_accessed means it has been read since.
+    """
+    days = older_than_days if older_than_days is not None else settings.STORAGE_COLD_AFTER_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    candidates = db.query(models.File).filter(
+        models.File.storage_tier == "cold",
+        models.File.last_accessed >= cutoff
+    ).order_by(models.File.last_accessed.desc()).limit(limit).all()
+
+    stats = {"candidates": len(candidates), "moved": 0, "failed": 0, "bytes": 0}
+    for db_file in candidates:
+        if dry_run:
+            stats["bytes"] += int(db_file.size or 0)
+            continue
+        if s3_storage.change_storage_class(crud.get_object_key(s3_storage, db_file), settings.STORAGE_HOT_CLASS):
+            db_file.storage_tier = "hot"
+            db.commit()
+            stats["moved"] += 1
+            stats["bytes"] += int(db_file.size or 0)
+        else:
+            stats["failed"] += 1
+    return stats
+
+# --- Perceptual hashes ---
+
+def _hash_object(s3_storage, object_key: Optional[str]) -> Optional[str]:
+    source = s3_storage.open_object(object_key) if object_key else None
+    if not source:
+        return None
+    try:
+        return dhash(source)
+    finally:
+        source.close()
+
+def backfill_phashes(db: Session, s3_storage, batch_size: int = 200, concurrency: int = 8) -> dict:
+    """Compute files.phash for images uploaded before hashing, in id order"""
+    stats = {"hashed": 0, "failed": 0}
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as io_pool:
+        while True:
+            batch = db.query(models.File).filter(
+                models.File.id > last_id,
+                models.File.phash.is_(None),
+                models.File.content_type.like("image/%")
+            ).order_by(models.File.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            keys = [crud.get_object_key(s3_storage, f) for f in batch]
+            for db_file, value in zip(batch, io_pool.map(lambda key: _hash_object(s3_storage, key), keys)):
+                if value:
+                    db_file.phash = value
+                    stats["hashed"] += 1
+                else:
+                    stats["failed"] += 1
+            db.commit()
+            logger.info(f"Perceptual hashes: {stats['hashed']} hashed, {stats['failed']} failed (up to file {last_id})")
+    return stats
+
+# --- Bulk regeneration ---
+
+def _render_file_variants(s3_storage, object_key: Optional[str], variants: list) -> list:
+    """Download one original and render all of its variants; returns [(variant, url, object key, size)]"""
+    image_data = s3_storage.download_object(object_key) if object_key else None
+    if not image_data:
+        logger.error(f"Failed to download original {object_key}")
+        return [(variant, None, None, None) for variant in variants]
+
+    pool = get_render_pool()
+    profile = engines.encoder_profile("regenerate")
+    futures = [
+        (variant, pool.submit(crud.resize_image_bytes, image_data, *variant[1:], profile))
+        for variant in variants
+    ]
+    results = []
+    for variant, future in futures:
+        file_id, width, height, format, quality = variant
+        try:
+            thumbnail_data = future.result()
+            thumbnail_url, thumbnail_key = crud.upload_thumbnail_to_s3(
+                s3_storage, thumbnail_data, file_id, width, height, format, quality
+            )
+            results.append((variant, thumbnail_url, thumbnail_key, len(thumbnail_data)))
+        except Exception as e:
+            logger.error(f"Failed to regenerate {variant_key(variant)}: {e}")
+            results.append((variant, None, None, None))
+    return results
+
+def _upsert_thumbnail_rows(db: Session, rows: list):
+    """Insert or repoint a batch of thumbnail rows in one statement"""
+    if not rows:
+        return
+    stmt = mysql_insert(models.Thumbnail).values(rows)
+    stmt = stmt.on_duplicate_key_update(
+        file_url=stmt.inserted.file_url,
+        storage_backend=stmt.inserted.storage_backend,
+        object_key=stmt.inserted.object_key,
+        file_size=stmt.inserted.file_size,
+        lossless=stmt.inserted.lossless
+    )
+    db.execute(stmt)
+
+def _variants_for_file(file_row, existing: dict, format: str, quality: int, include_responsive: bool) -> list:
+    variants = set(existing.get(file_row.id, []))
+    if include_responsive:
+        for request_width, request_height, _, _ in crud.get_responsive_sizes(file_row.width, file_row.height):
+            variants.add((file_row.id, request_width, request_height, format, quality))
+    return sorted(variants)
+
+def regenerate_library(
+    db: Session,
+    read_db: Session,
+    s3_storage,
+    job_name: str,
+    batch_size: int = 200,
+    concurrency: int = 4,
+    format: str = "webp",
+    quality: int = 80,
+    include_existing: bool = True,
+    include_responsive: bool = True,
+    restart: bool = False
+) -> models.ThumbnailJob:
+    """
+    Rebuild thumbnails for every image file, in id order.
+    `read_db` streams the files table while `db` writes thumbnail rows and the
+    thumbnail_jobs checkpoint in the same transaction per batch, so a crashed
+    run resumes after the last committed batch. Objects replaced by re-rendered
+    rows are deleted after the batch commits.
+    """
+    job = db.query(models.ThumbnailJob).filter(models.ThumbnailJob.name == job_name).first()
+    if job is None:
+        job = models.ThumbnailJob(name=job_name, last_file_id=0, processed_files=0,
+                                  rendered_variants=0, failed_variants=0)
+        db.add(job)
+    elif restart:
+        job.status = "running"
+        job.last_file_id = 0
+        job.processed_files = 0
+        job.rendered_variants = 0
+        job.failed_variants = 0
+        job.finished_at = None
+    elif job.status == "completed":
+        logger.info(f"Job {job_name} already completed, use restart to run it again")
+        return job
+
+    image_filter = models.File.content_type.ilike("image%")
+    remaining = db.query(func.count(models.File.id)).filter(
+        image_filter, models.File.id > job.last_file_id
+    ).scalar()
+    job.status = "running"
+    job.total_files = job.processed_files + remaining
+    db.commit()
+    logger.info(f"Job {job_name}: {remaining} files left, resuming after file id {job.last_file_id}")
+
+    file_rows = read_db.query(
+        models.File.id, models.File.object_key, models.File.file_url, models.File.width, models.File.height
+    ).filter(
+        image_filter, models.File.id > job.last_file_id
+    ).order_by(models.File.id).yield_per(batch_size)
+    file_rows = iter(file_rows)
+
+    started = time.monotonic()
+    processed_this_run = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as io_pool:
+        while True:
+            batch = list(islice(file_rows, batch_size))
+            if not batch:
+                break
+            file_ids = [row.id for row in batch]
+
+            existing = {}
+            # Objects the batch's rows point at now, deleted once a row is repointed
+            current_keys = {}
+            for thumbnail in db.query(
+                models.Thumbnail.original_file_id, models.Thumbnail.width, models.Thumbnail.height,
+                models.Thumbnail.format, models.Thumbnail.quality, models.Thumbnail.object_key
+            ).filter(models.Thumbnail.original_file_id.in_(file_ids)):
+                variant = tuple(thumbnail)[:5]
+                current_keys[variant] = thumbnail.object_key
+                if include_existing:
+                    existing.setdefault(thumbnail.original_file_id, []).append(variant)
+
+            futures = []
+            for row in batch:
+                variants = _variants_for_file(row, existing, format, quality, include_responsive)
+                if variants:
+                    object_key = crud.get_object_key(s3_storage, row)
+                    futures.append(io_pool.submit(_render_file_variants, s3_storage, object_key, variants))
+
+            thumbnail_rows = []
+            failed = 0
+            for future in futures:
+                for variant, thumbnail_url, thumbnail_key, file_size in future.result():
+                    if thumbnail_url is None:
+                        failed += 1
+                        continue
+                    file_id, width, height, variant_format, variant_quality = variant
+                    thumbnail_rows.append({
+                        "original_file_id": file_id,
+                        "width": width,
+                        "height": height,
+                        "format": variant_format,
+                        "quality": variant_quality,
+                        "file_url": thumbnail_url,
+                        "storage_backend": "s3",
+                        "object_key": thumbnail_key,
+                        "file_size": file_size,
+                        "lossless": crud.is_lossless_format(variant_format),
+                    })
+
+            _upsert_thumbnail_rows(db, thumbnail_rows)
+            job.last_file_id = file_ids[-1]
+            job.processed_files += len(batch)
+            job.rendered_variants += len(thumbnail_rows)
+            job.failed_variants += failed
+            db.commit()
+
+            replaced_keys = set()
+            for thumbnail_row in thumbnail_rows:
+                replaced_key = current_keys.get((
+                    thumbnail_row["original_file_id"], thumbnail_row["width"], thumbnail_row["height"],
+                    thumbnail_row["format"], thumbnail_row["quality"]
+                ))
+                if replaced_key and replaced_key != thumbnail_row["object_key"]:
+                    replaced_keys.add(replaced_key)
+            crud.delete_unreferenced_thumbnail_objects(db, s3_storage, replaced_keys)
+
+            processed_this_run += len(batch)
+            elapsed = time.monotonic() - started
+            rate = processed_this_run / elapsed if elapsed else 0.0
+            left = max(job.total_files - job.processed_files, 0)
+            eta = f"{left / rate / 60:.1f} min" if rate else "unknown"
+            logger.info(
+                f"Job {job_name}: {job.processed_files}/{job.total_files} files, "
+                f"{job.rendered_variants} variants ({job.failed_variants} failed), "
+                f"{rate:.1f} files/s, ETA {eta}"
+            )
+
+    job.status = "completed"
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    return job
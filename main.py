@@ -1,8 +1,10 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 
 from core.core.config import settings
+from core.core import metrics
 from core.core.database import engine, Base
 
 # Import all models here so that Base has them registered
@@ -63,6 +65,12 @@ app.include_router(file_storage_router, prefix=settings.API_V1_STR)
 def read_root():
     return {"message": "Welcome to the application!"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        """Latency histograms of this worker process, in the Prometheus text format"""
+        return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Rebuild thumbnails for the whole library, e.g. after changing the default
+quality or adding a new size. Progress is checkpointed in thumbnail_jobs,
+so rerunning the same --job resumes after a crash.
+
+Examples:
+    python regenerate_thumbnails.py --job webp-q75 --quality 75
+    python regenerate_thumbnails.py --job rebuild-existing --no-responsive --concurrency 8
+"""
+
+import argparse
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.core.database import SessionLocal
+from core.core.storage import s3_storage
+# Import all models to ensure they are registered with Base
+from users.models import User
+from employee.models import Employee
+from role.models import Role, UserRole
+from file_storage.models import File, Thumbnail, ThumbnailJob
+from file_storage import tasks
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Regenerate thumbnails for every image file")
+    parser.add_argument("--job", required=True, help="Job name used as the checkpoint key")
+    parser.add_argument("--batch-size", type=int, default=200, help="Files per batch / transaction")
+    parser.add_argument("--concurrency", type=int, default=4, help="Originals downloaded in parallel")
+    parser.add_argument("--format", default="webp", choices=["webp", "jpg", "jpeg", "png"], help="Format of the responsive set")
+    parser.add_argument("--quality", type=int, default=80, help="Quality of the responsive set")
+    parser.add_argument("--no-existing", action="store_true", help="Do not re-render variants already in thumbnails")
+    parser.add_argument("--no-responsive", action="store_true", help="Do not render the responsive srcset sizes")
+    parser.add_argument("--restart", action="store_true", help="Start the job over from the first file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    db = SessionLocal()
+    read_db = SessionLocal()
+    try:
+        job = tasks.regenerate_library(
+            db,
+            read_db,
+            s3_storage,
+            job_name=args.job,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            format=args.format,
+            quality=args.quality,
+            include_existing=not args.no_existing,
+            include_responsive=not args.no_responsive,
+            restart=args.restart
+        )
+        logger.info(
+            f"Job {job.name} {job.status}: {job.processed_files} files, "
+            f"{job.rendered_variants} variants rendered, {job.failed_variants} failed"
+        )
+    finally:
+        read_db.close()
+        db.close()
+
+if __name__ == "__main__":
+    main()
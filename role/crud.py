@@ -1,6 +1,9 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from role.models import Role, UserRole
 from role.schemas import RoleCreate, UserRoleCreate, DEFAULT_ROLES
+from users.models import User
+from core.core.principal_cache import invalidate_principal
 
 # Tạo role mới
 def create_role(db: Session, role_in: RoleCreate):
@@ -23,15 +26,61 @@ def assign_role_to_user(db: Session, user_id: int, role_id: int):
     db.add(user_role)
     db.commit()
     db.refresh(user_role)
+    # Cached principals carry the role names
+    invalidate_principal(db.query(User.username).filter(User.id == user_id).scalar())
     return user_role
 
+# Gán nhiều role cho nhiều user
+def assign_roles_bulk(db: Session, user_ids: list, role_ids: list) -> dict:
+    """
+    Assign every role to every user in one transaction: one query per table to
+    resolve ids and existing pairs, then a single executemany for the rest.
+    """
+    user_ids, role_ids = set(user_ids), set(role_ids)
+    users = dict(db.query(User.id, User.username).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+    known_role_ids = {role_id for (role_id,) in db.query(Role.id).filter(Role.id.in_(role_ids)).all()} if role_ids else set()
+
+    existing = set()
+    if users and known_role_ids:
+        existing = set(
+            db.query(UserRole.user_id, UserRole.role_id)
+            .filter(UserRole.user_id.in_(users), UserRole.role_id.in_(known_role_ids))
+            .all()
+        )
+    missing = [
+        {"user_id": user_id, "role_id": role_id}
+        for user_id in sorted(users)
+        for role_id in sorted(known_role_ids)
+        if (user_id, role_id) not in existing
+    ]
+    if missing:
+        db.execute(insert(UserRole), missing)
+        db.commit()
+        for user_id in {row["user_id"] for row in missing}:
+            invalidate_principal(users[user_id])
+
+    return {
+        "assigned": len(missing),
+        "already_assigned": len(existing),
+        "unknown_user_ids": sorted(user_ids - set(users)),
+        "unknown_role_ids": sorted(role_ids - known_role_ids),
+    }
+
 # Lấy tất cả role
 def get_roles(db: Session):
     return db.query(Role).all()
 
+def get_roles_by_ids(db: Session, role_ids: list):
+    return db.query(Role).filter(Role.id.in_(role_ids)).all() if role_ids else []
+
 # Lấy role của user
 def get_user_roles(db: Session, user_id: int):
     """
     Returns a list of Role objects that the user has.
     """
-    return db.query(Role).join(UserRole).filter(UserRole.user_id == user_id).all() 
\ No newline at end of file
+    return db.query(Role).join(UserRole).filter(UserRole.user_id == user_id).all()
+
+def get_user_role_names(db: Session, user_id: int) -> list:
+    """Sorted role names of the user (one query, no ORM objects)"""
+    rows = db.query(Role.name).join(UserRole).filter(UserRole.user_id == user_id).all()
+    return sorted(name for (name,) in rows) 
\ No newline at end of file
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from role.schemas import RoleCreate, RoleOut, UserRoleCreate, UserRoleOut
-from role.crud import create_role, assign_role_to_user, get_roles, get_user_roles, seed_default_roles
+from role.schemas import RoleCreate, RoleOut, UserRoleCreate, UserRoleOut, BulkRoleAssign, BulkRoleAssignResult
+from role.crud import create_role, assign_role_to_user, assign_roles_bulk, get_roles, get_roles_by_ids, get_user_roles, seed_default_roles
 from core.core.database import get_db
+from core.core.auth import PermissionChecker
+from users.schemas import Principal
 
 router = APIRouter(prefix="/role", tags=["Role"])
 
+role_admin_permission = PermissionChecker(required_roles=["admin"])
+role_assign_permission = PermissionChecker(required_roles=["employee_manager", "admin"])
+
 @router.post("/create", response_model=RoleOut, status_code=status.HTTP_201_CREATED)
 def create_role_api(role_in: RoleCreate, db: Session = Depends(get_db)):
     return create_role(db, role_in)
@@ -23,6 +28,22 @@ def list_roles_api(db: Session = Depends(get_db)):
 def assign_role_api(user_role: UserRoleCreate, db: Session = Depends(get_db)):
     return assign_role_to_user(db, user_role.user_id, user_role.role_id)
 
+@router.post("/assign/bulk", response_model=BulkRoleAssignResult)
+def assign_roles_bulk_api(
+    assignment: BulkRoleAssign,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(role_assign_permission)
+):
+    """
+    Give every listed user every listed role; pairs that already exist are skipped.
+    Admins and employee managers; only admins can hand out the admin role.
+    """
+    if not current_user.has_any_role("admin") and any(
+        role.name == "admin" for role in get_roles_by_ids(db, assignment.role_ids)
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can assign the admin role")
+    return assign_roles_bulk(db, assignment.user_ids, assignment.role_ids)
+
 @router.get("/user/{user_id}", response_model=list[UserRoleOut])
 def get_user_roles_api(user_id: int, db: Session = Depends(get_db)):
     return get_user_roles(db, user_id) 
\ No newline at end of file
@@ -25,6 +25,17 @@ class UserRoleOut(UserRoleBase):
     class Config:
         from_attributes = True
 
+class BulkRoleAssign(BaseModel):
+    """Assign every role in role_ids to every user in user_ids"""
+    user_ids: List[int]
+    role_ids: List[int]
+
+class BulkRoleAssignResult(BaseModel):
+    assigned: int
+    already_assigned: int
+    unknown_user_ids: List[int] = []
+    unknown_role_ids: List[int] = []
+
 # Danh sách quyền mẫu
 DEFAULT_ROLES = [
     {"name": "employee_manager", "description": "Quản lý nhân viên"},
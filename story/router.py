@@ -5,7 +5,7 @@ from typing import Optional, List
 from . import crud, schemas
 from core.core.database import get_db
 from core.core.auth import PermissionChecker, get_current_user
-from users import models as users_models
+from users import schemas as users_schemas
 
 router = APIRouter(
     prefix="/story",
@@ -24,7 +24,7 @@ def list_stories(
     keyword: Optional[str] = None,
     story_type: Optional[str] = None,
     category_id: Optional[int] = None,
-    current_user: users_models.User = Depends(get_current_user)
+    current_user: users_schemas.Principal = Depends(get_current_user)
 ):
     """
     [Admin] Retrieve stories with pagination and filtering. Requires authentication.
@@ -67,7 +67,7 @@ def list_public_stories(
 async def create_story(
     story: schemas.StoryCreate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(story_creator_permission)
+    current_user: users_schemas.Principal = Depends(story_creator_permission)
 ):
     """
     Create a new story. Requires 'story_manager' or 'admin' role.
@@ -75,7 +75,7 @@ async def create_story(
     return await crud.create_story_with_notifications(db=db, story=story, author_id=current_user.id)
 
 @router.get("/{slug}", response_model=schemas.Story, summary="[Admin] Get story by slug")
-def get_story(slug: str, db: Session = Depends(get_db), current_user: users_models.User = Depends(get_current_user)):
+def get_story(slug: str, db: Session = Depends(get_db), current_user: users_schemas.Principal = Depends(get_current_user)):
     """
     [Admin] Get a single story by its slug. Requires authentication.
     """
@@ -99,7 +99,7 @@ def get_public_story(slug: str, db: Session = Depends(get_db)):
 def create_category(
     category: schemas.StoryCategoryCreate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(category_admin_permission)
+    current_user: users_schemas.Principal = Depends(category_admin_permission)
 ):
     """
     Create a new story category. Requires admin role.
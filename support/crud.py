@@ -73,7 +73,7 @@ async def create_support_with_notifications(
             file_info = {
                 "file_id": int(file_id),
                 "filename": file.filename,
-                "file_url": file.file_url
+                "file_url": file.download_url
             }
             files.append(file_info)
             attachments.append({
@@ -5,7 +5,7 @@ from typing import Optional, List
 from . import crud, schemas
 from core.core.database import get_db
 from core.core.auth import PermissionChecker, get_current_user
-from users import models as users_models
+from users import schemas as users_schemas
 
 router = APIRouter(
     prefix="/support",
@@ -103,7 +103,7 @@ async def create_public_recruitment_application(
 async def create_support(
     support: schemas.SupportCreate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_creator_permission)
+    current_user: users_schemas.Principal = Depends(support_creator_permission)
 ):
     """
     Create a new support request. Requires authentication.
@@ -121,7 +121,7 @@ def list_supports(
     keyword: Optional[str] = None,
     support_type: Optional[str] = None,
     status: Optional[str] = None,
-    current_user: users_models.User = Depends(get_current_user)
+    current_user: users_schemas.Principal = Depends(get_current_user)
 ):
     """
     List support requests with filtering. Users can only see their own requests.
@@ -130,7 +130,7 @@ def list_supports(
     skip = (page - 1) * limit if page > 0 else 0
     
     # If user is not admin or support manager, only show their own supports
-    email_filter = None if "admin" in current_user.roles or "support_manager" in current_user.roles else current_user.username
+    email_filter = None if current_user.has_any_role("admin", "support_manager") else current_user.username
     
     supports, total = crud.get_supports(
         db, 
@@ -148,7 +148,7 @@ def list_supports(
 def get_support(
     support_id: int,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(get_current_user)
+    current_user: users_schemas.Principal = Depends(get_current_user)
 ):
     """
     Get a specific support request. Users can only see their own requests.
@@ -159,7 +159,7 @@ def get_support(
         raise HTTPException(status_code=404, detail="Support request not found")
     
     # Check if user can access this support
-    if "admin" not in current_user.roles and "support_manager" not in current_user.roles and support.email != current_user.username:
+    if not current_user.has_any_role("admin", "support_manager") and support.email != current_user.username:
         raise HTTPException(status_code=403, detail="Not authorized to view this support request")
     
     return support
@@ -169,7 +169,7 @@ def update_support(
     support_id: int,
     support_update: schemas.SupportUpdate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_admin_permission)
+    current_user: users_schemas.Principal = Depends(support_admin_permission)
 ):
     """
     Update a support request. Only admins can update all fields.
@@ -185,7 +185,7 @@ async def update_support_status(
     support_id: int,
     status_update: schemas.SupportStatusUpdate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_manager_permission)
+    current_user: users_schemas.Principal = Depends(support_manager_permission)
 ):
     """
     Update support status. Support managers and admins can update status.
@@ -200,7 +200,7 @@ async def update_support_status(
 def delete_support(
     support_id: int,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_admin_permission)
+    current_user: users_schemas.Principal = Depends(support_admin_permission)
 ):
     """
     Delete a support request. Only admins can delete.
@@ -214,7 +214,7 @@ def get_supports_by_source(
     source_type: str,
     source_id: int,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_manager_permission)
+    current_user: users_schemas.Principal = Depends(support_manager_permission)
 ):
     """
     Get all support requests related to a specific source. Support managers and admins can access.
@@ -227,7 +227,7 @@ async def create_recruitment_application(
     story_id: int,
     support: schemas.SupportCreate,
     db: Session = Depends(get_db),
-    current_user: users_models.User = Depends(support_creator_permission)
+    current_user: users_schemas.Principal = Depends(support_creator_permission)
 ):
     """
     Create a recruitment application for a specific story.
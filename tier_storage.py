@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Move originals that nobody has downloaded or rendered recently to the
+cold storage class, and move cold originals that were accessed since back
+to the hot class.
+
+Examples:
+    python tier_storage.py --dry-run
+    python tier_storage.py --days 60 --limit 5000
+"""
+
+import argparse
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.core.database import SessionLocal
+from core.core.storage import s3_storage
+# Import all models to ensure they are registered with Base
+from users.models import User
+from employee.models import Employee
+from role.models import Role, UserRole
+from file_storage.models import File, Thumbnail
+from file_storage import tasks
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tier cold originals to a cheaper storage class")
+    parser.add_argument("--days", type=int, default=None, help="Idle days before a file is cold (default STORAGE_COLD_AFTER_DAYS)")
+    parser.add_argument("--limit", type=int, default=1000, help="Max files moved in this run")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        action = "Would rehydrate" if args.dry_run else "Rehydrated"
+        stats = tasks.rehydrate_accessed_files(
+            db,
+            s3_storage,
+            older_than_days=args.days,
+            limit=args.limit,
+            dry_run=args.dry_run
+        )
+        moved = stats["candidates"] if args.dry_run else stats["moved"]
+        logger.info(
+            f"{action} {moved} files ({stats['bytes'] / (1024 * 1024):.1f} MB), {stats['failed']} failed"
+        )
+
+        stats = tasks.tier_cold_files(
+            db,
+            s3_storage,
+            older_than_days=args.days,
+            limit=args.limit,
+            dry_run=args.dry_run
+        )
+        action = "Would move" if args.dry_run else "Moved"
+        moved = stats["candidates"] if args.dry_run else stats["moved"]
+        logger.info(
+            f"{action} {moved} files ({stats['bytes'] / (1024 * 1024):.1f} MB), {stats['failed']} failed"
+        )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
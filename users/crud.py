@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from users import models, schemas
 from core.core.security import get_password_hash
+from core.core.principal_cache import invalidate_principal
 from datetime import datetime, timedelta
 import uuid
 
@@ -41,6 +42,17 @@ def update_user_login_time(db: Session, user_id: int):
     db.query(models.User).filter(models.User.id == user_id).update({"last_login": datetime.utcnow()})
     db.commit()
 
+def set_user_active(db: Session, user_id: int, is_active: bool):
+    """Activate or deactivate a user; the cached principal is dropped so it applies at once"""
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        return None
+    db_user.is_active = is_active
+    db.commit()
+    db.refresh(db_user)
+    invalidate_principal(db_user.username)
+    return db_user
+
 def create_user_session(db: Session, user_id: int, expires_in_days: int, device_info: str = None, ip_address: str = None):
     session_token = str(uuid.uuid4())
     expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
@@ -35,6 +35,6 @@ class UserSession(Base):
     ip_address = Column(String(50))
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
 
     user = relationship("User", back_populates="sessions") 
\ No newline at end of file
@@ -11,9 +11,15 @@ from core.core.auth import (
     authenticate_user, 
     create_refresh_token, 
     get_current_user,
-    get_password_hash
+    get_current_user_model,
+    load_principal,
+    access_token_claims,
+    get_password_hash,
+    PermissionChecker
 )
 from core.core.exceptions import AuthenticationError
+from core.core.login_throttle import login_throttle
+from .session_store import get_session_store
 from jose import JWTError, jwt
 from .models import User
 
@@ -22,6 +28,8 @@ router = APIRouter(
     tags=["Authentication"]
 )
 
+user_admin_permission = PermissionChecker(required_roles=["admin"])
+
 @router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user_by_username = crud.get_user_by_username(db, username=user.username)
@@ -52,9 +60,14 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/login", response_model=schemas.Token)
 def login_for_access_token(request: Request, db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    ip_address = request.client.host if request.client else None
+    # Throttled attempts are refused before any bcrypt work
+    login_throttle.check(form_data.username, ip_address)
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        login_throttle.record_failure(form_data.username, ip_address)
         raise AuthenticationError(message="Incorrect username or password")
+    login_throttle.reset(form_data.username)
     
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
@@ -62,20 +75,18 @@ def login_for_access_token(request: Request, db: Session = Depends(get_db), form
     # Update last login time
     crud.update_user_login_time(db, user.id)
 
-    # Create user session
+    # Create user session; its id goes into the refresh token
     device_info = request.headers.get("User-Agent")
-    ip_address = request.client.host
-    crud.create_user_session(
-        db, 
-        user_id=user.id, 
-        expires_in_days=settings.REFRESH_TOKEN_EXPIRE_DAYS,
+    sid = get_session_store().create(
+        db,
+        user_id=user.id,
         device_info=device_info,
         ip_address=ip_address
     )
 
     # Create access and refresh tokens
-    access_token = create_access_token(data={"sub": user.username, "type": "access"})
-    refresh_token = create_refresh_token(data={"sub": user.username, "type": "refresh"})
+    access_token = create_access_token(data=access_token_claims(load_principal(db, user.username)))
+    refresh_token = create_refresh_token(data={"sub": user.username, "sid": sid, "type": "refresh"})
 
     return {
         "access_token": access_token,
@@ -83,27 +94,37 @@ def login_for_access_token(request: Request, db: Session = Depends(get_db), form
         "token_type": "bearer"
     }
 
-@router.post("/token/refresh", response_model=schemas.Token)
-def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)):
+def decode_refresh_token(refresh_token: str) -> dict:
+    """Claims of a valid refresh token that carries a session id"""
     credentials_exception = AuthenticationError(
         message="Could not validate credentials",
     )
     try:
         payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        token_type: str = payload.get("type")
-
-        if username is None or token_type != "refresh":
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
+    # Tokens issued before sessions were tracked have no sid and cannot be revoked
+    if payload.get("sub") is None or payload.get("type") != "refresh" or not payload.get("sid"):
+        raise credentials_exception
+    return payload
+
+@router.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)):
+    credentials_exception = AuthenticationError(
+        message="Could not validate credentials",
+    )
+    payload = decode_refresh_token(refresh_token)
+
+    principal = load_principal(db, payload["sub"])
+    if principal is None or not principal.is_active:
+        raise credentials_exception
 
-    user = crud.get_user_by_username(db, username=username)
-    if user is None:
+    # Revoked or expired session
+    if get_session_store().get_user_id(db, payload["sid"]) != principal.id:
         raise credentials_exception
         
     # Create new access token
-    new_access_token = create_access_token(data={"sub": user.username})
+    new_access_token = create_access_token(data=access_token_claims(principal))
     
     return {
         "access_token": new_access_token,
@@ -111,6 +132,29 @@ def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)):
         "token_type": "bearer"
     }
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(refresh_token: str, db: Session = Depends(get_db)):
+    """Revoke the session of the refresh token; access tokens already issued run out on their own"""
+    payload = decode_refresh_token(refresh_token)
+    get_session_store().revoke(db, payload["sid"])
+
+@router.post("/logout/all", status_code=status.HTTP_204_NO_CONTENT)
+def logout_all(current_user: schemas.Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Revoke every session of the current user"""
+    get_session_store().revoke_user(db, current_user.id)
+
+@router.put("/users/{user_id}/active", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(user_admin_permission)])
+def set_user_active(user_id: int, update: schemas.UserActiveUpdate, db: Session = Depends(get_db)):
+    """
+    Activate or deactivate a user (admin only). Takes effect on the user's next
+    request; deactivating also revokes every session, so refresh tokens stop working.
+    """
+    db_user = crud.set_user_active(db, user_id, update.is_active)
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if not update.is_active:
+        get_session_store().revoke_user(db, user_id)
+
 @router.get("/me", response_model=schemas.User)
-def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: User = Depends(get_current_user_model)):
     return current_user
\ No newline at end of file
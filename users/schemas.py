@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, FrozenSet
 from datetime import datetime
 
 # Schema for Employee
@@ -43,6 +43,9 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class UserActiveUpdate(BaseModel):
+    is_active: bool
+
 class User(UserBase):
     id: int
     is_active: bool
@@ -62,6 +65,16 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+class Principal(BaseModel):
+    """Identity of the authenticated user as resolved (and cached) by get_current_user"""
+    id: int
+    username: str
+    is_active: bool
+    roles: FrozenSet[str] = frozenset()
+
+    def has_any_role(self, *roles: str) -> bool:
+        return not self.roles.isdisjoint(roles)
+
 # Schema for User Session
 class UserSessionBase(BaseModel):
     device_info: Optional[str] = None
@@ -0,0 +1,193 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional
+import json
+import logging
+import threading
+import time
+import uuid
+
+import redis
+from sqlalchemy.orm import Session
+
+from core.core.config import settings
+from core.core.exceptions import ServiceUnavailableError
+from core.core import redis_client
+from . import models, crud
+
+logger = logging.getLogger(__name__)
+
+class SessionStore(ABC):
+    """
+    Login sessions behind refresh tokens. The session id (sid) is embedded in
+    the refresh token; refresh checks it with a single key lookup and logout
+    revokes it, so revocation takes effect without scanning anything.
+    """
+    @abstractmethod
+    def create(self, db: Session, user_id: int, device_info: str = None, ip_address: str = None) -> str:
+        """Start a session lasting REFRESH_TOKEN_EXPIRE_DAYS; returns its sid"""
+
+    @abstractmethod
+    def get_user_id(self, db: Session, sid: str) -> Optional[int]:
+        """Owner of the session, or None if it expired or was revoked"""
+
+    @abstractmethod
+    def revoke(self, db: Session, sid: str):
+        """End one session (logout)"""
+
+    @abstractmethod
+    def revoke_user(self, db: Session, user_id: int):
+        """Revoke every session of the user (logout everywhere)"""
+
+class RedisSessionStore(SessionStore):
+    """
+    auth:session:{sid} holds the session with a native TTL, and
+    auth:user_sessions:{user_id} is a sorted set of the user's sids scored by
+    expiry, trimmed of expired sids on every write.
+    Redis is a hard dependency of this store: while it is unreachable, login,
+    refresh and logout fail with a 503 rather than falling back, so that a
+    revocation can never be lost.
+    """
+    @staticmethod
+    def _session_key(sid: str) -> str:
+        return f"auth:session:{sid}"
+
+    @staticmethod
+    def _user_key(user_id: int) -> str:
+        return f"auth:user_sessions:{user_id}"
+
+    def _unavailable(self, e: Exception) -> ServiceUnavailableError:
+        logger.error(f"Session store: Redis error: {e}")
+        return ServiceUnavailableError(message="Session store unavailable, please retry")
+
+    def create(self, db, user_id, device_info=None, ip_address=None) -> str:
+        sid = str(uuid.uuid4())
+        ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        now = time.time()
+        session = {
+            "user_id": user_id,
+            "device_info": device_info,
+            "ip_address": ip_address,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        try:
+            pipe = redis_client.redis_client.pipeline()
+            pipe.set(self._session_key(sid), json.dumps(session), ex=ttl)
+            pipe.zadd(self._user_key(user_id), {sid: now + ttl})
+            pipe.zremrangebyscore(self._user_key(user_id), "-inf", now)
+            # The set lives as long as the newest session
+            pipe.expire(self._user_key(user_id), ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        return sid
+
+    def get_user_id(self, db, sid) -> Optional[int]:
+        try:
+            value = redis_client.get_key(self._session_key(sid))
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        return json.loads(value)["user_id"] if value else None
+
+    def revoke(self, db, sid):
+        try:
+            value = redis_client.get_key(self._session_key(sid))
+            if value:
+                pipe = redis_client.redis_client.pipeline()
+                pipe.delete(self._session_key(sid))
+                pipe.zrem(self._user_key(json.loads(value)["user_id"]), sid)
+                pipe.execute()
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+
+    def revoke_user(self, db, user_id):
+        try:
+            sids = redis_client.redis_client.zrange(self._user_key(user_id), 0, -1)
+            redis_client.delete_key(self._user_key(user_id))
+            if sids:
+                redis_client.redis_client.delete(*(self._session_key(sid) for sid in sids))
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+
+class SqlSessionStore(SessionStore):
+    """
+    user_sessions rows, looked up by the unique session_token index. Expired
+    rows are deleted in batches, at most once per SESSION_PRUNE_INTERVAL per
+    process, when sessions are created, so the table stops growing.
+    """
+    def __init__(self, prune_interval: int, prune_batch_size: int):
+        self.prune_interval = prune_interval
+        self.prune_batch_size = prune_batch_size
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, db, user_id, device_info=None, ip_address=None) -> str:
+        db_session = crud.create_user_session(
+            db,
+            user_id=user_id,
+            expires_in_days=settings.REFRESH_TOKEN_EXPIRE_DAYS,
+            device_info=device_info,
+            ip_address=ip_address
+        )
+        self._maybe_prune(db)
+        return db_session.session_token
+
+    def get_user_id(self, db, sid) -> Optional[int]:
+        return db.query(models.UserSession.user_id).filter(
+            models.UserSession.session_token == sid,
+            models.UserSession.expires_at > datetime.utcnow()
+        ).scalar()
+
+    def revoke(self, db, sid):
+        db.query(models.UserSession).filter(models.UserSession.session_token == sid).delete(synchronize_session=False)
+        db.commit()
+
+    def revoke_user(self, db, user_id):
+        db.query(models.UserSession).filter(models.UserSession.user_id == user_id).delete(synchronize_session=False)
+        db.commit()
+
+    def _maybe_prune(self, db: Session):
+        with self._lock:
+            if time.monotonic() < self._next_prune:
+                return
+            self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            self.prune_expired(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Session store: pruning expired sessions failed: {e}")
+
+    def prune_expired(self, db: Session, max_batches: int = 10) -> int:
+        """Delete expired sessions, prune_batch_size rows per statement; returns the count"""
+        deleted = 0
+        now = datetime.utcnow()
+        for _ in range(max_batches):
+            ids = [
+                session_id for (session_id,) in db.query(models.UserSession.id)
+                .filter(models.UserSession.expires_at <= now)
+                .limit(self.prune_batch_size)
+                .all()
+            ]
+            if not ids:
+                break
+            db.query(models.UserSession).filter(models.UserSession.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            deleted += len(ids)
+            if len(ids) < self.prune_batch_size:
+                break
+        return deleted
+
+_session_store = None
+
+def get_session_store() -> SessionStore:
+    """Store configured by SESSION_STORE: sql (default) or redis"""
+    global _session_store
+    if _session_store is None:
+        if settings.SESSION_STORE.lower() == "redis":
+            _session_store = RedisSessionStore()
+        else:
+            _session_store = SqlSessionStore(
+                prune_interval=settings.SESSION_PRUNE_INTERVAL,
+                prune_batch_size=settings.SESSION_PRUNE_BATCH_SIZE
+            )
+    return _session_store
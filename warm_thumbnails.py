@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Pre-render the most requested thumbnails, e.g. after an eviction run,
+a quality change or a storage migration.
+
+Examples:
+    python warm_thumbnails.py --top 500
+    python warm_thumbnails.py --access-log /var/log/nginx/access.log --top 1000 --rate 20
+    python warm_thumbnails.py --top 5000 --run after-migration   # resumable
+"""
+
+import argparse
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.core.database import SessionLocal
+from core.core.storage import s3_storage
+# Import all models to ensure they are registered with Base
+from users.models import User
+from employee.models import Employee
+from role.models import Role, UserRole
+from file_storage.models import File, Thumbnail
+from file_storage import tasks
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Warm the thumbnail cache from access statistics")
+    parser.add_argument("--top", type=int, default=500, help="Number of variants to regenerate")
+    parser.add_argument("--access-log", help="Rank variants from this access log instead of thumbnails.access_count")
+    parser.add_argument("--concurrency", type=int, default=4, help="Variants downloaded/uploaded in parallel")
+    parser.add_argument("--rate", type=float, default=None, help="Max renders started per second")
+    parser.add_argument("--run", help="Name of this warm-up; progress is checkpointed per run so a rerun resumes it")
+    parser.add_argument("--checkpoint", help="Explicit progress file (default: one per --run, none without it)")
+    parser.add_argument("--reset", action="store_true", help="Ignore and clear the existing checkpoint")
+    return parser.parse_args()
+
+def checkpoint_path(args):
+    """Checkpoints only exist when asked for, one per run, so a later warm-up never skips everything"""
+    if args.checkpoint:
+        return args.checkpoint
+    if args.run:
+        source = "log" if args.access_log else "db"
+        return f".thumbnail_warmup.{args.run}.{source}.checkpoint"
+    return None
+
+def main():
+    args = parse_args()
+    checkpoint = checkpoint_path(args)
+    if args.reset and checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    db = SessionLocal()
+    try:
+        if args.access_log:
+            with open(args.access_log, "r", encoding="utf-8", errors="ignore") as f:
+                variants = tasks.rank_variants_from_access_log(f, args.top, db)
+        else:
+            variants = tasks.rank_variants_by_access(db, args.top)
+        logger.info(f"Warming {len(variants)} thumbnail variants")
+
+        stats = tasks.regenerate_variants(
+            db,
+            s3_storage,
+            variants,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            checkpoint_path=checkpoint
+        )
+        logger.info(
+            f"Done: {stats['rendered']} rendered, {stats['skipped']} already done, {stats['failed']} failed"
+        )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()